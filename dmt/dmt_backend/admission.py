@@ -0,0 +1,346 @@
+"""
+Admission control and load shedding by request class
+
+Under overload (LibreTranslate down, several exports at once) every request
+used to wait in the same threadpool and connection pools, so cheap form
+reads timed out behind slow writes. Each request is now classified and
+admitted only while its class and the worker have free slots:
+
+    class    priority  requests
+    auth     0         POST /auth/token
+    read     1         GET/HEAD (catalogs, DMT records, users)
+    write    2         POST/PUT/PATCH/DELETE
+    export   3         GET /dmt/export/csv
+    bulk     4         POST /dmt/bulk, /users/bulk, /entities/{name}/import
+
+/health, /metrics, /admin, the docs and the DMT event stream (long-lived,
+limited by DMT_EVENTS_MAX_SUBSCRIBERS) are not limited.
+
+Requests that find no free slot wait in a FIFO queue per class; a freed slot
+goes to the highest-priority class with room. A request is shed with
+503 + Retry-After when its wait exceeds its class budget, right away when
+the expected wait (queue position x recent duration) already exceeds the
+budget, or when the queues are full (the lowest-priority waiter goes first).
+Lower-priority classes get smaller budgets, so exports and bulk loads are
+shed early and the plant-floor form keeps answering.
+
+Limits are per worker (process).
+
+Configuration (environment variables):
+    ADMISSION_ENABLED       1 (default) or 0
+    ADMISSION_CAPACITY      Requests running at once, all classes (default: 64)
+    ADMISSION_LIMITS        Per class, e.g. "auth:8,read:48,write:16,export:2,bulk:1"
+    ADMISSION_MAX_WAIT_MS   Queue wait budget per class, e.g.
+                            "auth:3000,read:2000,write:3000,export:1000,bulk:500"
+    ADMISSION_MAX_QUEUE     Requests waiting at once, all classes (default: 200)
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+from metrics import Counter, GaugeCallback, Histogram
+from responses import dumps
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+ADMISSION_CAPACITY = int(os.getenv("ADMISSION_CAPACITY", "64"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "200"))
+
+# Clases en orden de prioridad: (límite, espera máxima en ms)
+DEFAULT_CLASSES = {
+    "auth": (8, 3000),
+    "read": (48, 2000),
+    "write": (16, 3000),
+    "export": (2, 1000),
+    "bulk": (1, 500),
+}
+
+EXEMPT_PREFIXES = ("/health", "/metrics", "/admin", "/docs", "/redoc", "/openapi.json", "/dmt/events")
+BULK_PATHS = ("/dmt/bulk", "/users/bulk")
+
+# Peso de la última duración en el promedio móvil
+DURATION_ALPHA = 0.2
+MAX_RETRY_AFTER = 60
+
+ADMITTED = Counter("dmt_admission_admitted_total", "Requests admitted by class", ("class",))
+SHED = Counter(
+    "dmt_admission_shed_total", "Requests rejected with 503 (reason: queue_full, wait_budget, expected_wait)",
+    ("class", "reason")
+)
+QUEUE_WAIT = Histogram("dmt_admission_queue_wait_seconds", "Time waiting for an admission slot", ("class",))
+
+
+def parse_class_settings(value: Optional[str]) -> Dict[str, int]:
+    """
+    "auth:8,read:48" -> {"auth": 8, "read": 48} (clases desconocidas: ValueError)
+    """
+    settings = {}
+    for item in (value or "").split(","):
+        if not item.strip():
+            continue
+        name, _, number = item.partition(":")
+        name = name.strip()
+        if name not in DEFAULT_CLASSES:
+            raise ValueError(f"Unknown admission class '{name}'")
+        settings[name] = int(number)
+    return settings
+
+
+def classify(method: str, path: str) -> Optional[str]:
+    """
+    Clase del request, o None si no se limita
+    """
+    if method == "OPTIONS" or path == "/" or path.startswith(EXEMPT_PREFIXES):
+        return None
+    if path.startswith("/auth/"):
+        return "auth"
+    if path.startswith("/dmt/export"):
+        return "export"
+    if path.rstrip("/") in BULK_PATHS or (path.startswith("/entities/") and path.rstrip("/").endswith("/import")):
+        return "bulk"
+    if method in ("GET", "HEAD"):
+        return "read"
+    return "write"
+
+
+class Shed(Exception):
+    """
+    Request rechazado por el control de admisión
+    """
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionClass:
+    """
+    Límite, presupuesto de espera y cola de una clase
+    """
+
+    def __init__(self, name: str, priority: int, limit: int, max_wait_ms: int):
+        self.name = name
+        self.priority = priority
+        self.limit = limit
+        self.max_wait = max_wait_ms / 1000
+        self.active = 0
+        self.queue: Deque[asyncio.Future] = deque()
+        self.avg_duration = 0.0
+        self.admitted = 0
+        self.shed = 0
+
+    def expected_wait(self, position: int) -> float:
+        """
+        Espera estimada para el puesto `position` de la cola (0 = primero)
+        """
+        return (position + 1) / max(self.limit, 1) * self.avg_duration
+
+    def retry_after(self) -> int:
+        return min(MAX_RETRY_AFTER, max(1, math.ceil(self.expected_wait(len(self.queue)))))
+
+
+class AdmissionController:
+    """
+    Slots por clase y totales; las colas viven en el event loop (sin locks)
+    """
+
+    def __init__(self, capacity: int = ADMISSION_CAPACITY, max_queue: int = ADMISSION_MAX_QUEUE,
+                 limits: Optional[Dict[str, int]] = None, max_wait_ms: Optional[Dict[str, int]] = None):
+        limits = limits or {}
+        max_wait_ms = max_wait_ms or {}
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.active = 0
+        self.classes = {
+            name: AdmissionClass(name, priority, limits.get(name, limit), max_wait_ms.get(name, wait))
+            for priority, (name, (limit, wait)) in enumerate(DEFAULT_CLASSES.items())
+        }
+
+    @staticmethod
+    def _admitted(admission_class: AdmissionClass, wait: float):
+        admission_class.admitted += 1
+        ADMITTED.labels(admission_class.name).inc()
+        QUEUE_WAIT.labels(admission_class.name).observe(wait)
+
+    @staticmethod
+    def _shed(admission_class: AdmissionClass, reason: str):
+        admission_class.shed += 1
+        SHED.labels(admission_class.name, reason).inc()
+
+    def queued(self) -> int:
+        return sum(len(admission_class.queue) for admission_class in self.classes.values())
+
+    def _grant(self, admission_class: AdmissionClass, waiter: asyncio.Future):
+        admission_class.active += 1
+        self.active += 1
+        waiter.set_result(None)
+
+    def _dispatch(self):
+        """
+        Entregar los slots libres a las colas en orden de prioridad
+        """
+        for admission_class in self.classes.values():
+            queue = admission_class.queue
+            while queue and admission_class.active < admission_class.limit and self.active < self.capacity:
+                waiter = queue.popleft()
+                if not waiter.done():
+                    self._grant(admission_class, waiter)
+
+    def _shed_lowest(self, incoming: AdmissionClass) -> bool:
+        """
+        Cola llena: rechazar el último en espera de la clase de menor
+        prioridad, si es menor que la del request entrante
+        """
+        for admission_class in reversed(list(self.classes.values())):
+            if admission_class.priority <= incoming.priority:
+                return False
+            queue = admission_class.queue
+            while queue:
+                waiter = queue.pop()
+                if not waiter.done():
+                    waiter.set_exception(Shed("queue_full", admission_class.retry_after()))
+                    return True
+        return False
+
+    async def acquire(self, name: str):
+        """
+        Esperar un slot de la clase; Shed si no llega dentro del presupuesto
+        """
+        admission_class = self.classes[name]
+        queue = admission_class.queue
+        if not queue and admission_class.active < admission_class.limit and self.active < self.capacity:
+            admission_class.active += 1
+            self.active += 1
+            self._admitted(admission_class, 0.0)
+            return
+
+        if admission_class.avg_duration and admission_class.expected_wait(len(queue)) > admission_class.max_wait:
+            self._shed(admission_class, "expected_wait")
+            raise Shed("expected_wait", admission_class.retry_after())
+        if self.queued() >= self.max_queue and not self._shed_lowest(admission_class):
+            self._shed(admission_class, "queue_full")
+            raise Shed("queue_full", admission_class.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        self._dispatch()
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, admission_class.max_wait)
+        except asyncio.TimeoutError:
+            self._shed(admission_class, "wait_budget")
+            raise Shed("wait_budget", admission_class.retry_after())
+        except Shed as shed:
+            self._shed(admission_class, shed.reason)
+            raise
+        except asyncio.CancelledError:
+            # Cancelado justo después de recibir el slot: devolverlo
+            if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                self._free(admission_class)
+            raise
+        finally:
+            if waiter in queue:
+                queue.remove(waiter)
+        self._admitted(admission_class, time.perf_counter() - started)
+
+    def release(self, name: str, duration: float):
+        """
+        Liberar el slot y actualizar la duración promedio de la clase
+        """
+        admission_class = self.classes[name]
+        if admission_class.avg_duration:
+            admission_class.avg_duration += DURATION_ALPHA * (duration - admission_class.avg_duration)
+        else:
+            admission_class.avg_duration = duration
+        self._free(admission_class)
+
+    def _free(self, admission_class: AdmissionClass):
+        admission_class.active -= 1
+        self.active -= 1
+        self._dispatch()
+
+    def status(self) -> dict:
+        """
+        Slots y colas por clase (GET /admin/admission)
+        """
+        return {
+            "enabled": ADMISSION_ENABLED,
+            "capacity": self.capacity,
+            "active": self.active,
+            "queued": self.queued(),
+            "max_queue": self.max_queue,
+            "classes": {
+                name: {
+                    "priority": admission_class.priority,
+                    "limit": admission_class.limit,
+                    "active": admission_class.active,
+                    "queued": len(admission_class.queue),
+                    "max_wait_ms": round(admission_class.max_wait * 1000),
+                    "avg_duration_ms": round(admission_class.avg_duration * 1000, 1),
+                    "admitted": admission_class.admitted,
+                    "shed": admission_class.shed,
+                }
+                for name, admission_class in self.classes.items()
+            },
+        }
+
+
+# Instancia global (por worker)
+admission = AdmissionController(
+    limits=parse_class_settings(os.getenv("ADMISSION_LIMITS")),
+    max_wait_ms=parse_class_settings(os.getenv("ADMISSION_MAX_WAIT_MS")),
+)
+
+GaugeCallback(
+    "dmt_admission_active", "Requests holding an admission slot", ("class",),
+    lambda: {(name,): admission_class.active for name, admission_class in admission.classes.items()}
+)
+GaugeCallback(
+    "dmt_admission_queued", "Requests waiting for an admission slot", ("class",),
+    lambda: {(name,): len(admission_class.queue) for name, admission_class in admission.classes.items()}
+)
+
+
+class AdmissionMiddleware:
+    """
+    Middleware ASGI: admitir, encolar o rechazar (503) según la clase del request
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ADMISSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        name = classify(scope["method"], scope["path"])
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await admission.acquire(name)
+        except Shed as shed:
+            body = dumps({"detail": f"Server busy ({name} requests), retry later"})
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode("latin-1")),
+                    (b"retry-after", str(shed.retry_after).encode("latin-1")),
+                    (b"x-admission-class", name.encode("latin-1")),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.release(name, time.perf_counter() - start)
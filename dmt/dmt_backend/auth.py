@@ -1,31 +1,47 @@
 import os
 from datetime import datetime, timedelta
 from typing import Optional
-from jose import JWTError, jwt
-from passlib.context import CryptContext
 from schemas import TokenData
+from metrics import PASSWORD_HASH_DURATION
+
+# passlib y jose se importan en el primer uso (arranque más rápido de los workers)
 
 # Configuración
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production-please-use-random-secure-key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
 
-# Contexto de hashing de passwords con bcrypt
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+# Contexto de hashing de passwords (creado en el primer uso)
+_pwd_context = None
+
+
+def get_pwd_context():
+    """
+    Contexto de hashing de passwords con pbkdf2_sha256
+    """
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+    return _pwd_context
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
     Verificar si la password en texto plano coincide con el hash
     """
-    return pwd_context.verify(plain_password, hashed_password)
+    pwd_context = get_pwd_context()
+    with PASSWORD_HASH_DURATION.time("verify"):
+        return pwd_context.verify(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
     """
     Generar hash de password
     """
-    return pwd_context.hash(password)
+    pwd_context = get_pwd_context()
+    with PASSWORD_HASH_DURATION.time("hash"):
+        return pwd_context.hash(password)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -39,6 +55,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
 
     to_encode.update({"exp": expire})
+    from jose import jwt
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -48,6 +65,7 @@ def verify_token(token: str) -> Optional[TokenData]:
     Verificar y decodificar JWT token
     Retorna TokenData si es válido, None si no
     """
+    from jose import JWTError, jwt
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
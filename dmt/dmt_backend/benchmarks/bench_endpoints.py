@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Endpoint benchmark suite
+
+Boots the app in-process (ASGI transport, lifespan included) against a
+seeded database and a local fake LibreTranslate (benchmarks.fake_translate)
+with configurable latency, then measures each endpoint scenario:
+p50/p95/p99 and mean latency, throughput, errors and SQL queries per
+request (X-DB-Queries).
+
+The database is SQLite by default: a dataset built with
+benchmarks.generate_data is kept in the temp directory and reused while
+--records and --seed do not change. --database-url runs against another
+database (e.g. a local PostgreSQL), which is seeded the same way if it has
+fewer DMT records than --records.
+
+Baselines are stored in benchmarks/baselines/<dialect>.json. Without
+--save-baseline the run is compared with the stored baseline: a p95 more
+than --threshold slower, or more queries per request, is reported as a
+regression and the exit code is 1.
+
+Usage (from dmt_backend/):
+    python -m benchmarks.bench_endpoints [--records 20000] [--requests 200] [--concurrency 8]
+                                         [--translate-latency-ms 150] [--only "GET /dmt/"]
+                                         [--database-url postgresql://...] [--save-baseline]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, NamedTuple
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+# Métricas comparadas con el baseline (la latencia con tolerancia, las consultas exactas)
+LATENCY_METRIC = "p95_ms"
+QUERIES_METRIC = "db_queries"
+
+
+class Scenario(NamedTuple):
+    name: str
+    method: str
+    role: str
+    # (rng, ids) -> (path, json body o None)
+    request: Callable
+    # Fracción de --requests (para los escenarios costosos)
+    weight: float = 1.0
+
+
+def _patch_analysis(rng, ids):
+    return f"/dmt/{rng.choice(ids['open_dmt'])}", {
+        "analysis": f"Benchmark analysis {rng.randrange(10 ** 6)}: porosity traced to the pouring temperature"
+    }
+
+
+SCENARIOS = [
+    Scenario("GET /dmt/", "GET", "Inspector", lambda rng, ids: ("/dmt/?limit=100", None)),
+    Scenario("GET /dmt/?is_closed=false", "GET", "Inspector",
+             lambda rng, ids: ("/dmt/?is_closed=false&limit=100", None)),
+    Scenario("GET /dmt/{id}", "GET", "Inspector", lambda rng, ids: (f"/dmt/{rng.choice(ids['dmt'])}", None)),
+    Scenario("PATCH /dmt/{id}", "PATCH", "Tech Engineer", _patch_analysis, 0.5),
+    Scenario("GET /entities/partnumber", "GET", "Inspector", lambda rng, ids: ("/entities/partnumber", None)),
+    Scenario("GET /entities/_bundle", "GET", "Inspector", lambda rng, ids: ("/entities/_bundle", None)),
+    Scenario("GET /users/", "GET", "Inspector", lambda rng, ids: ("/users/", None)),
+    Scenario("GET /dmt/export/csv", "GET", "Inspector",
+             lambda rng, ids: (f"/dmt/export/csv?start_date={ids['export_start']}", None), 0.1),
+]
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """
+    Percentil por rango más cercano
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def prepare_database(args) -> str:
+    """
+    DATABASE_URL a usar (se fija antes de importar la app)
+    """
+    if args.database_url:
+        return args.database_url
+    path = os.path.join(tempfile.gettempdir(), f"dmt_bench_{args.records}_{args.seed}.db")
+    return f"sqlite:///{path}"
+
+
+def seed_if_needed(args):
+    from sqlalchemy import func, select
+    from database import engine, init_db
+    from models import DMTRecord
+    from benchmarks import generate_data
+
+    init_db()
+    with engine.connect() as conn:
+        existing = conn.execute(select(func.count()).select_from(DMTRecord)).scalar_one()
+    if existing >= args.records:
+        print(f"Dataset: {existing:,} DMT records (reused)")
+        return
+
+    print(f"Dataset: generating {args.records - existing:,} DMT records...")
+    rng = random.Random(args.seed)
+    users_by_role = generate_data.generate_users(rng, 300, "loadtest", 5000)
+    ids_by_entity = generate_data.generate_catalogs(rng, 20000, 5000)
+    factory = generate_data.RecordFactory(rng, ids_by_entity, users_by_role, datetime.utcnow().replace(microsecond=0))
+    generate_data.generate_records(factory, args.records - existing, 3, 5000)
+
+
+def load_fixtures() -> Dict[str, object]:
+    """
+    Tokens por rol e ids usados por los escenarios
+    """
+    from sqlalchemy import select
+    from database import engine
+    from models import DMTRecord, User
+    from auth import create_access_token
+
+    with engine.connect() as conn:
+        tokens = {}
+        for role in ("Inspector", "Tech Engineer", "Admin"):
+            username = conn.execute(select(User.username).where(User.role == role).limit(1)).scalar()
+            if username:
+                tokens[role] = create_access_token({"sub": username}, expires_delta=timedelta(hours=6))
+        dmt_ids = list(conn.execute(select(DMTRecord.id)).scalars())
+        open_ids = list(conn.execute(select(DMTRecord.id).where(DMTRecord.is_closed.is_(False))).scalars())
+        newest = conn.execute(select(DMTRecord.created_at).order_by(DMTRecord.created_at.desc()).limit(1)).scalar()
+    export_start = (newest or datetime.utcnow()) - timedelta(days=30)
+    return {
+        "tokens": tokens,
+        "dmt": dmt_ids,
+        "open_dmt": open_ids or dmt_ids,
+        "export_start": export_start.strftime("%Y-%m-%dT00:00:00"),
+    }
+
+
+async def run_scenario(client, scenario: Scenario, fixtures: dict, requests: int, concurrency: int,
+                       warmup: int, rng: random.Random) -> dict:
+    headers = {"Authorization": f"Bearer {fixtures['tokens'][scenario.role]}"}
+    latencies: List[float] = []
+    queries: List[int] = []
+    errors = 0
+
+    async def call(record: bool):
+        nonlocal errors
+        path, body = scenario.request(rng, fixtures)
+        start = time.perf_counter()
+        response = await client.request(scenario.method, path, json=body, headers=headers)
+        elapsed = (time.perf_counter() - start) * 1000
+        if not record:
+            return
+        if response.status_code >= 400:
+            errors += 1
+        latencies.append(elapsed)
+        queries.append(int(response.headers.get("x-db-queries", 0)))
+
+    for _ in range(warmup):
+        await call(False)
+
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            await call(True)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 0.50), 2),
+        "p95_ms": round(percentile(latencies, 0.95), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+        "mean_ms": round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+        "throughput_rps": round(requests / wall, 1) if wall else 0.0,
+        "db_queries": round(sum(queries) / len(queries), 1) if queries else 0.0,
+    }
+
+
+async def run_suite(args, scenarios: List[Scenario], fixtures: dict) -> Dict[str, dict]:
+    import httpx
+    import main as app_main
+
+    app = app_main.app
+    results = {}
+    rng = random.Random(args.seed)
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+            print("-" * 79)
+            print(f"{'Scenario':<30}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'SQL':>7}{'err':>6}")
+            print("-" * 79)
+            for scenario in scenarios:
+                requests = max(1, int(args.requests * scenario.weight))
+                results[scenario.name] = await run_scenario(
+                    client, scenario, fixtures, requests, args.concurrency, args.warmup, rng
+                )
+                print_row(scenario.name, results[scenario.name])
+    return results
+
+
+def print_row(name: str, result: dict):
+    print(
+        f"{name:<30}{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}{result['p99_ms']:>9.1f}"
+        f"{result['throughput_rps']:>9.1f}{result['db_queries']:>7.1f}{result['errors']:>6}"
+    )
+
+
+def compare(results: Dict[str, dict], baseline: dict, threshold: float) -> List[str]:
+    """
+    Regresiones respecto al baseline (mensajes)
+    """
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get("results", {}).get(name)
+        if not before:
+            continue
+        if before[LATENCY_METRIC] and result[LATENCY_METRIC] > before[LATENCY_METRIC] * (1 + threshold):
+            regressions.append(
+                f"{name}: {LATENCY_METRIC} {before[LATENCY_METRIC]:.1f} -> {result[LATENCY_METRIC]:.1f} ms "
+                f"(+{(result[LATENCY_METRIC] / before[LATENCY_METRIC] - 1) * 100:.0f}%)"
+            )
+        if result[QUERIES_METRIC] > before[QUERIES_METRIC]:
+            regressions.append(
+                f"{name}: {QUERIES_METRIC} {before[QUERIES_METRIC]} -> {result[QUERIES_METRIC]} per request"
+            )
+        if result["errors"] > before["errors"]:
+            regressions.append(f"{name}: errors {before['errors']} -> {result['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Endpoint benchmark suite")
+    parser.add_argument("--records", type=int, default=20000, help="DMT records in the dataset")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests per scenario")
+    parser.add_argument("--translate-latency-ms", type=float, default=150, help="Fake LibreTranslate delay")
+    parser.add_argument("--database-url", help="Database to use instead of the SQLite dataset")
+    parser.add_argument("--only", action="append", help="Run only these scenarios (repeatable)")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed p95 slowdown vs the baseline")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    args = parser.parse_args()
+
+    # La app lee la configuración al importarse
+    os.environ["DATABASE_URL"] = prepare_database(args)
+
+    from benchmarks.fake_translate import FakeTranslateServer
+    translator = FakeTranslateServer(args.translate_latency_ms).start()
+    os.environ["LIBRETRANSLATE_URL"] = translator.url
+    # Los logs por traducción, slow query y stall ensucian la tabla
+    # (los monitores siguen registrando: /admin/sql, /admin/loop)
+    logging.disable(logging.WARNING)
+
+    seed_if_needed(args)
+    fixtures = load_fixtures()
+    scenarios = [s for s in SCENARIOS if not args.only or s.name in args.only]
+
+    from database import engine
+    dialect = engine.dialect.name
+    config = {
+        "records": len(fixtures["dmt"]),
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "translate_latency_ms": args.translate_latency_ms,
+    }
+    print(f"Database: {dialect} | {config}")
+    try:
+        results = asyncio.run(run_suite(args, scenarios, fixtures))
+    finally:
+        translator.stop()
+    print("-" * 79)
+    print(f"Fake LibreTranslate requests: {translator.requests}")
+
+    baseline_path = os.path.join(BASELINE_DIR, f"{dialect}.json")
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        baseline = {"created": datetime.utcnow().isoformat(timespec="seconds"), "config": config, "results": results}
+        if os.path.exists(baseline_path) and args.only:
+            # Actualizar solo los escenarios ejecutados
+            with open(baseline_path) as f:
+                previous = json.load(f)
+            baseline["results"] = dict(previous.get("results", {}), **results)
+        with open(baseline_path, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline saved to {os.path.relpath(baseline_path)}")
+        return 0
+
+    if not os.path.exists(baseline_path):
+        print(f"No baseline for {dialect} (run with --save-baseline)")
+        return 0
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    if baseline.get("config") != config:
+        print(f"Warning: baseline config differs: {baseline.get('config')}")
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"REGRESSIONS vs baseline ({baseline.get('created')}):")
+        for message in regressions:
+            print(f"  ✗ {message}")
+        return 1
+    print(f"✓ No regressions vs baseline ({baseline.get('created')}, threshold {args.threshold:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Serialization / compression benchmark for the main API payloads
+
+Compares, for each endpoint payload:
+- serialization time: JSONResponse (json module) vs FastJSONResponse (orjson)
+- bytes on the wire: identity vs gzip vs brotli (if installed)
+
+Payloads are synthetic but shaped like production data: /dmt/ pages with
+multilingual (en/es/zh) text, catalogs and the user list.
+
+Usage (from dmt_backend/):
+    python -m benchmarks.bench_serialization [--records 1000] [--repeat 20]
+"""
+
+import argparse
+import gzip
+import random
+import time
+from datetime import datetime, timedelta
+from typing import List
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from schemas import DMTRecordRead, EntityRead, UserRead
+from responses import FastJSONResponse, orjson
+from compression import brotli, COMPRESSION_GZIP_LEVEL, COMPRESSION_BR_QUALITY
+
+TEXTS = {
+    "en": "Porosity found on the sealing surface after machining, depth exceeds drawing tolerance",
+    "es": "Se encontró porosidad en la superficie de sellado después del maquinado, la profundidad excede la tolerancia",
+    "zh": "加工后密封面发现气孔，深度超出图纸公差要求，需要工程评估",
+}
+
+
+def make_record(record_id: int) -> dict:
+    created = datetime(2023, 1, 1) + timedelta(minutes=37 * record_id)
+    record = {
+        "id": record_id,
+        "is_closed": record_id % 3 == 0,
+        "created_at": created,
+        "updated_at": created,
+        "created_by_id": random.randint(1, 80),
+        "report_number": str(1000 + record_id),
+        "part_number_id": random.randint(1, 150),
+        "work_center_id": random.randint(1, 15),
+        "customer_id": random.randint(1, 6),
+        "prepared_by_id": random.randint(1, 11),
+        "operation": f"OP-{random.randint(10, 90)}",
+        "quantity": random.randint(1, 50),
+        "date": created,
+        "inspection_item_id": random.randint(1, 5),
+        "process_code_id": random.randint(1, 5),
+    }
+    for field in ("defect_description", "process_description", "analysis", "engineering_remarks", "repair_process"):
+        for lang, text in TEXTS.items():
+            record[f"{field}_{lang}"] = text * random.randint(1, 3)
+    return record
+
+
+def build_payloads(records: int) -> dict:
+    """
+    Payloads ya convertidos a tipos JSON (lo que FastAPI entrega al response class)
+    """
+    dmt_rows = [DMTRecordRead(**make_record(i)) for i in range(1, records + 1)]
+    catalog = [EntityRead(id=i, item_number=f"5{i:06d}-101", item_name=f"Part {i}") for i in range(1, 151)]
+    users = [
+        UserRead(id=i, username=f"OPR{i:03d}", email=f"opr{i:03d}@example.com", full_name=f"Operador Núñez {i}", role="Operator")
+        for i in range(1, 81)
+    ]
+    return {
+        f"GET /dmt/ (limit={records})": TypeAdapter(List[DMTRecordRead]).dump_python(dmt_rows, mode="json"),
+        "GET /dmt/{id}": TypeAdapter(DMTRecordRead).dump_python(dmt_rows[0], mode="json"),
+        "GET /entities/partnumber": TypeAdapter(List[EntityRead]).dump_python(catalog, mode="json"),
+        "GET /users/": TypeAdapter(List[UserRead]).dump_python(users, mode="json"),
+    }
+
+
+def time_render(response_class, content, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        response_class(content)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serialization and compression benchmark")
+    parser.add_argument("--records", type=int, default=1000, help="Records in the /dmt/ page")
+    parser.add_argument("--repeat", type=int, default=20, help="Iterations per measurement")
+    args = parser.parse_args()
+
+    random.seed(42)
+    payloads = build_payloads(args.records)
+
+    print(f"orjson: {'yes' if orjson else 'no (json fallback)'} | brotli: {'yes' if brotli else 'no'}")
+    print("-" * 100)
+    print(f"{'Endpoint':<28}{'json ms':>10}{'fast ms':>10}{'speedup':>9}{'identity B':>13}{'gzip B':>10}{'br B':>10}{'ratio':>8}")
+    print("-" * 100)
+
+    for name, content in payloads.items():
+        before_ms = time_render(JSONResponse, content, args.repeat)
+        after_ms = time_render(FastJSONResponse, content, args.repeat)
+        body = FastJSONResponse(content).body
+        gzip_size = len(gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL))
+        br_size = len(brotli.compress(body, quality=COMPRESSION_BR_QUALITY)) if brotli else None
+        best = min(gzip_size, br_size or gzip_size)
+        print(
+            f"{name:<28}{before_ms:>10.2f}{after_ms:>10.2f}{before_ms / after_ms:>8.1f}x"
+            f"{len(body):>13,}{gzip_size:>10,}{(f'{br_size:,}' if br_size else '-'):>10}"
+            f"{len(body) / best:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
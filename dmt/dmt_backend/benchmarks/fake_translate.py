@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Local LibreTranslate stand-in for benchmarks and load tests
+
+Answers POST /translate like LibreTranslate (q as a string or a list)
+after a configurable delay, so translation latency is reproducible and no
+request leaves the machine. The "translation" is the source text tagged
+with the target language. Requests are served by a thread pool, like a
+real instance with several workers.
+
+Usage (from dmt_backend/), standalone for a separately started API:
+    python -m benchmarks.fake_translate [--port 5000] [--latency-ms 150]
+    LIBRETRANSLATE_URL=http://127.0.0.1:5000/translate uvicorn main:app
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+class _TranslateHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            self._reply(400, {"error": "invalid JSON"})
+            return
+
+        delay = server.latency * (1 + server.jitter * (2 * random.random() - 1))
+        time.sleep(max(0.0, delay))
+        with server.lock:
+            server.requests += 1
+
+        if server.fail_ratio and random.random() < server.fail_ratio:
+            self._reply(503, {"error": "simulated failure"})
+            return
+        target = payload.get("target", "")
+        texts = payload.get("q", "")
+        if isinstance(texts, list):
+            translated = [f"[{target}] {text}" for text in texts]
+        else:
+            translated = f"[{target}] {texts}"
+        self._reply(200, {"translatedText": translated})
+
+    def _reply(self, status: int, content: dict):
+        data = json.dumps(content, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeTranslateServer:
+    """
+    Servidor LibreTranslate falso en un hilo (start / stop)
+    """
+
+    def __init__(self, latency_ms: float = 150, jitter: float = 0.2, fail_ratio: float = 0.0,
+                 host: str = "127.0.0.1", port: int = 0):
+        self._server = ThreadingHTTPServer((host, port), _TranslateHandler)
+        self._server.daemon_threads = True
+        self._server.latency = latency_ms / 1000
+        self._server.jitter = jitter
+        self._server.fail_ratio = fail_ratio
+        self._server.requests = 0
+        self._server.lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/translate"
+
+    @property
+    def requests(self) -> int:
+        return self._server.requests
+
+    def start(self) -> "FakeTranslateServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-translate", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local LibreTranslate stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--latency-ms", type=float, default=150, help="Delay per request")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Relative +/- variation of the delay")
+    parser.add_argument("--fail-ratio", type=float, default=0.0, help="Fraction of requests answered with 503")
+    args = parser.parse_args()
+
+    server = FakeTranslateServer(args.latency_ms, args.jitter, args.fail_ratio, args.host, args.port)
+    print(f"Fake LibreTranslate on {server.url} ({args.latency_ms:.0f} ms)")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Synthetic dataset generator for load testing
+
+Builds a production-sized database: users for every role, tens of
+thousands of catalog entries and up to millions of DMT records, all
+inserted with bulk core INSERTs (executemany, one transaction per batch)
+so a 1M-record dataset builds in minutes.
+
+Distributions are shaped like the plant's data:
+- created_at spread over --years, with volume growing over time and most
+  records in the day shift; ids follow created_at like in production
+- work centers, part numbers and customers follow a Zipf-like skew (a few
+  of them account for most of the records)
+- records older than CLOSE_AFTER_DAYS are almost all closed, recent ones
+  are mostly open; closed records have the engineering and quality
+  sections filled in, open ones only partially
+- multilingual (en/es/zh) texts with a long-tailed length distribution
+
+The generator only adds rows (item_numbers / usernames already present are
+skipped), so it can run on top of seed_database.py or a previous run. Ids
+come from id_blocks so the API keeps allocating after the generated
+records. Generated users share the password given by --password. Restart
+the API afterwards: its in-process catalog cache does not see these writes.
+
+Usage (from dmt_backend/):
+    python -m benchmarks.generate_data [--records 1000000] [--catalog-size 20000]
+                                       [--users 300] [--years 3] [--batch-size 5000]
+"""
+
+import argparse
+import bisect
+import itertools
+import math
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Sequence
+from sqlalchemy import insert, select
+from auth import get_password_hash
+from database import engine, init_db
+from models import DMTRecord, User
+from cache import USERS_KEY, BUNDLE_KEY
+from crud.crud_entity import ENTITY_MODELS, catalog_key
+from crud.crud_dmt import report_number_for
+from id_blocks import dmt_ids
+from invalidation import cache_bus
+
+# Entradas por catálogo (partnumber y calibration escalan con --catalog-size)
+CATALOG_SIZES = {
+    "workcenter": 15,
+    "customer": 60,
+    "level": 4,
+    "area": 8,
+    "inspectionitem": 40,
+    "preparedby": 80,
+    "processcode": 30,
+    "disposition": 6,
+    "failurecode": 50,
+}
+
+# Proporción de usuarios por rol
+ROLE_RATIOS = {
+    "Operator": 0.60,
+    "Inspector": 0.22,
+    "Tech Engineer": 0.10,
+    "Quality Engineer": 0.06,
+    "Admin": 0.02,
+}
+
+# Exponente de la distribución Zipf de las referencias a catálogos
+ZIPF_EXPONENT = 1.1
+
+# Registros con más antigüedad que esto están casi todos cerrados
+CLOSE_AFTER_DAYS = 45
+CLOSED_RATIO_OLD = 0.97
+
+# Peso de cada hora del día en created_at (turnos 6-14, 14-22, 22-6)
+HOUR_WEIGHTS = [1] * 6 + [6] * 8 + [4] * 8 + [1] * 2
+
+DMT_COLUMNS = [column.name for column in DMTRecord.__table__.columns]
+
+# Textos distintos pre-armados por campo (los registros eligen uno al azar)
+TEXT_POOL_SIZE = 1024
+
+OPERATIONS = [f"OP-{n}" for n in range(10, 100, 10)]
+DEPARTMENTS = ["Casting", "Machining", "Quality", "Engineering", "Supplier", "Assembly", "Finishing"]
+
+# Fragmentos alineados (en, es, zh) para armar textos multilingües
+FRAGMENTS = {
+    "defect_description": [
+        ("Porosity found on the sealing surface", "Porosidad en la superficie de sellado", "密封面发现气孔"),
+        ("crack detected near the gate area", "grieta detectada cerca de la zona del bebedero", "浇口附近检测到裂纹"),
+        ("bore diameter out of tolerance", "diámetro del barreno fuera de tolerancia", "孔径超出公差"),
+        ("surface roughness exceeds drawing requirement", "la rugosidad excede lo requerido en el plano", "表面粗糙度超出图纸要求"),
+        ("inclusion visible after machining", "inclusión visible después del maquinado", "加工后可见夹杂物"),
+        ("missing thread on the mounting hole", "falta cuerda en el barreno de montaje", "安装孔缺少螺纹"),
+        ("wall thickness below minimum", "espesor de pared por debajo del mínimo", "壁厚低于最小值"),
+        ("shrinkage cavity in the flange", "rechupe en la brida", "法兰处有缩孔"),
+        ("weld bead with undercut", "cordón de soldadura con socavado", "焊缝咬边"),
+        ("dent caused during handling", "golpe causado durante el manejo", "搬运过程中造成凹痕"),
+    ],
+    "process_description": [
+        ("Part was poured at the upper temperature limit", "La pieza se vació en el límite superior de temperatura", "零件在温度上限浇注"),
+        ("shell was stored longer than the standard", "el casco se almacenó más tiempo del estándar", "型壳存放时间超过标准"),
+        ("fixture shows wear on the locating pins", "el dispositivo muestra desgaste en los pernos de localización", "夹具定位销磨损"),
+        ("tool offset was not updated after the change", "el offset de la herramienta no se actualizó tras el cambio", "换刀后未更新刀具补偿"),
+        ("operator skipped the intermediate inspection", "el operador omitió la inspección intermedia", "操作员跳过了中间检验"),
+        ("material lot changed during the shift", "el lote de material cambió durante el turno", "班次中更换了材料批次"),
+    ],
+    "analysis": [
+        ("Root cause is gas entrapment during pouring", "La causa raíz es gas atrapado durante el vaciado", "根本原因是浇注时卷气"),
+        ("dimensional study confirms fixture deviation", "el estudio dimensional confirma la desviación del dispositivo", "尺寸分析确认夹具偏差"),
+        ("metallurgical report shows oxide inclusions", "el reporte metalúrgico muestra inclusiones de óxido", "金相报告显示氧化物夹杂"),
+        ("process parameters were within limits", "los parámetros del proceso estaban dentro de límites", "工艺参数在范围内"),
+        ("similar defects found in the previous lot", "se encontraron defectos similares en el lote anterior", "上一批次发现类似缺陷"),
+        ("supplier certificate does not match the heat", "el certificado del proveedor no corresponde a la colada", "供应商证书与炉号不符"),
+    ],
+    "engineering_remarks": [
+        ("Use as is approved by the customer", "Uso como está aprobado por el cliente", "客户批准原样使用"),
+        ("add the feature to the control plan", "agregar la característica al plan de control", "将该特性加入控制计划"),
+        ("monitor the next three lots", "monitorear los siguientes tres lotes", "监控后续三个批次"),
+        ("update the work instruction", "actualizar la instrucción de trabajo", "更新作业指导书"),
+        ("training given to the operators of the shift", "capacitación impartida a los operadores del turno", "已对该班次操作员进行培训"),
+        ("cost charged to the supplier", "costo cargado al proveedor", "费用由供应商承担"),
+    ],
+    "repair_process": [
+        ("Weld repair and re-inspect with penetrant", "Reparar con soldadura y reinspeccionar con líquidos penetrantes", "焊补后进行渗透复检"),
+        ("re-machine the bore to the oversize", "remaquinar el barreno a sobremedida", "将孔重新加工至加大尺寸"),
+        ("polish the surface and measure roughness", "pulir la superficie y medir rugosidad", "抛光表面并测量粗糙度"),
+        ("re-tap the thread and gauge", "rehacer la cuerda y verificar con calibre", "重新攻丝并用量规检验"),
+        ("heat treat again per specification", "tratar térmicamente de nuevo según especificación", "按规范重新热处理"),
+        ("no repair, scrap the part", "sin reparación, desechar la pieza", "不修复，报废零件"),
+    ],
+}
+
+
+def zipf_cum_weights(size: int) -> List[float]:
+    """
+    Pesos acumulados Zipf para random.choices (el rango 1 es el más frecuente)
+    """
+    return list(itertools.accumulate(1 / (rank ** ZIPF_EXPONENT) for rank in range(1, size + 1)))
+
+
+def build_text_pool(rng: random.Random, fragments: Sequence[tuple]) -> List[tuple]:
+    """
+    Textos (en, es, zh) de longitud con cola larga: la mayoría de 1-3
+    fragmentos, algunos de hasta 15 (reportes detallados)
+    """
+    pool = []
+    for _ in range(TEXT_POOL_SIZE):
+        count = min(15, max(1, int(rng.lognormvariate(0.6, 0.7))))
+        chosen = [rng.choice(fragments) for _ in range(count)]
+        pool.append((
+            ", ".join(item[0] for item in chosen) + ".",
+            ", ".join(item[1] for item in chosen) + ".",
+            "，".join(item[2] for item in chosen) + "。",
+        ))
+    return pool
+
+
+def insert_in_batches(table, rows: List[dict], batch_size: int):
+    for start in range(0, len(rows), batch_size):
+        with engine.begin() as conn:
+            conn.execute(insert(table), rows[start:start + batch_size])
+
+
+def generate_users(rng: random.Random, count: int, password: str, batch_size: int) -> Dict[str, List[int]]:
+    """
+    Usuarios LT000001... por rol; retorna los ids de todos los usuarios por rol
+    """
+    hashed_password = get_password_hash(password)
+    roles = list(ROLE_RATIOS)
+    role_cum_weights = list(itertools.accumulate(ROLE_RATIOS.values()))
+    with engine.connect() as conn:
+        existing = set(conn.execute(select(User.username).where(User.username.like("LT%"))).scalars())
+
+    rows = []
+    for n in range(1, count + 1):
+        username = f"LT{n:06d}"
+        if username in existing:
+            continue
+        rows.append({
+            "username": username,
+            "email": f"{username.lower()}@loadtest.example.com",
+            "full_name": f"Load Test User {n}",
+            "role": rng.choices(roles, cum_weights=role_cum_weights)[0],
+            "hashed_password": hashed_password,
+        })
+    insert_in_batches(User.__table__, rows, batch_size)
+    print(f"  users: {len(rows):,} created, {len(existing):,} already present")
+
+    users_by_role: Dict[str, List[int]] = {role: [] for role in roles}
+    with engine.connect() as conn:
+        for user_id, role in conn.execute(select(User.id, User.role)):
+            users_by_role.setdefault(role, []).append(user_id)
+    return users_by_role
+
+
+def generate_catalogs(rng: random.Random, catalog_size: int, batch_size: int) -> Dict[str, List[int]]:
+    """
+    Entradas de todos los catálogos; retorna los ids de cada catálogo en
+    orden de popularidad (aleatorio, para que no dependa del id)
+    """
+    sizes = dict(CATALOG_SIZES, partnumber=catalog_size, calibration=max(1, catalog_size // 10))
+    ids_by_entity: Dict[str, List[int]] = {}
+    for entity_name, model in ENTITY_MODELS.items():
+        table = model.__table__
+        prefix = entity_name[:4].upper()
+        with engine.connect() as conn:
+            existing = set(conn.execute(select(table.c.item_number)).scalars())
+        rows = [
+            {"item_number": f"{prefix}-{n:06d}", "item_name": f"{entity_name.capitalize()} {n}"}
+            for n in range(1, sizes[entity_name] + 1)
+            if f"{prefix}-{n:06d}" not in existing
+        ]
+        insert_in_batches(table, rows, batch_size)
+        with engine.connect() as conn:
+            ids = list(conn.execute(select(table.c.id)).scalars())
+        rng.shuffle(ids)
+        ids_by_entity[entity_name] = ids
+        print(f"  {entity_name}: {len(rows):,} created, {len(ids):,} total")
+    return ids_by_entity
+
+
+class RecordFactory:
+    """
+    Arma las filas de dmtrecord con las distribuciones del módulo
+    """
+
+    def __init__(self, rng: random.Random, ids_by_entity: Dict[str, List[int]], users_by_role: Dict[str, List[int]], now: datetime):
+        self.rng = rng
+        self.now = now
+        self.catalogs = ids_by_entity
+        self.zipf = {name: zipf_cum_weights(len(ids)) for name, ids in ids_by_entity.items() if ids}
+        self.inspectors = users_by_role.get("Inspector") or users_by_role.get("Admin")
+        self.engineers = users_by_role.get("Tech Engineer") or self.inspectors
+        self.quality = users_by_role.get("Quality Engineer") or self.inspectors
+        self.texts = {field: build_text_pool(rng, fragments) for field, fragments in FRAGMENTS.items()}
+        self.hour_cum_weights = list(itertools.accumulate(HOUR_WEIGHTS))
+
+    def pick(self, entity_name: str):
+        ids = self.catalogs[entity_name]
+        if not ids:
+            return None
+        return ids[bisect.bisect_left(self.zipf[entity_name], self.rng.random() * self.zipf[entity_name][-1])]
+
+    def created_at(self, day: datetime) -> datetime:
+        hour = bisect.bisect_left(self.hour_cum_weights, self.rng.random() * self.hour_cum_weights[-1])
+        return min(self.now, day.replace(hour=hour, minute=self.rng.randrange(60), second=self.rng.randrange(60)))
+
+    def set_text(self, row: dict, field: str):
+        en, es, zh = self.rng.choice(self.texts[field])
+        row[f"{field}_en"], row[f"{field}_es"], row[f"{field}_zh"] = en, es, zh
+
+    def row(self, record_id: int, created_at: datetime) -> dict:
+        rng = self.rng
+        age_days = (self.now - created_at).days
+        if age_days > CLOSE_AFTER_DAYS:
+            is_closed = rng.random() < CLOSED_RATIO_OLD
+        else:
+            is_closed = rng.random() < age_days / CLOSE_AFTER_DAYS * 0.6
+
+        row = dict.fromkeys(DMT_COLUMNS)
+        row.update(
+            id=record_id,
+            report_number=report_number_for(record_id),
+            is_closed=is_closed,
+            created_at=created_at,
+            updated_at=created_at,
+            created_by_id=rng.choice(self.inspectors),
+            part_number_id=self.pick("partnumber"),
+            work_center_id=self.pick("workcenter"),
+            customer_id=self.pick("customer"),
+            level_id=self.pick("level"),
+            area_id=self.pick("area"),
+            prepared_by_id=self.pick("preparedby"),
+            operation=rng.choice(OPERATIONS),
+            quantity=min(500, int(rng.expovariate(0.2)) + 1),
+            serial_number=f"SN{rng.randrange(10 ** 8):08d}" if rng.random() < 0.6 else None,
+            date=created_at - timedelta(hours=rng.randrange(48)),
+            inspection_item_id=self.pick("inspectionitem"),
+            process_code_id=self.pick("processcode"),
+        )
+        self.set_text(row, "defect_description")
+
+        if is_closed or (age_days > 2 and rng.random() < 0.5):
+            self.set_text(row, "process_description")
+            self.set_text(row, "analysis")
+            row["analysis_by_id"] = rng.choice(self.engineers)
+            row["updated_at"] = created_at + timedelta(hours=rng.randrange(4, 72))
+
+        if is_closed or (age_days > 7 and rng.random() < 0.3):
+            disposition_date = created_at + timedelta(days=rng.randrange(1, 15))
+            row.update(
+                final_disposition_id=self.pick("disposition"),
+                disposition_date=disposition_date,
+                engineer_id=rng.choice(self.engineers),
+                failure_code_id=self.pick("failurecode"),
+                rework_hours=round(rng.expovariate(0.5), 1),
+                responsible_department=rng.choice(DEPARTMENTS),
+                material_scrap_cost=round(rng.expovariate(1 / 150), 2),
+                other_cost=round(rng.expovariate(1 / 40), 2) if rng.random() < 0.3 else None,
+                updated_at=disposition_date,
+            )
+            self.set_text(row, "engineering_remarks")
+            self.set_text(row, "repair_process")
+
+        if is_closed:
+            approval_date = row["disposition_date"] + timedelta(days=rng.randrange(0, 10))
+            row.update(
+                disposition_approval_date=approval_date,
+                disposition_approved_by_id=rng.choice(self.quality),
+                sdr_number=f"SDR-{rng.randrange(10 ** 6):06d}" if rng.random() < 0.2 else None,
+                updated_at=approval_date,
+            )
+        return row
+
+
+def generate_records(factory: RecordFactory, count: int, years: float, batch_size: int):
+    """
+    Registros en orden de created_at; cada lote cubre un tramo consecutivo
+    de la línea de tiempo (volumen creciente: densidad proporcional al tiempo)
+    """
+    rng = factory.rng
+    start = factory.now - timedelta(days=365 * years)
+    span_days = 365 * years
+    table = DMTRecord.__table__
+    begin = time.perf_counter()
+    created = 0
+
+    while created < count:
+        size = min(batch_size, count - created)
+        low, high = created / count, (created + size) / count
+        created_dates = sorted(
+            factory.created_at(start + timedelta(days=int(math.sqrt(rng.uniform(low, high)) * span_days)))
+            for _ in range(size)
+        )
+        ids = dmt_ids.allocate_sync(size)
+        rows = [factory.row(record_id, created_at) for record_id, created_at in zip(ids, created_dates)]
+        with engine.begin() as conn:
+            conn.execute(insert(table), rows)
+        created += size
+        elapsed = time.perf_counter() - begin
+        print(f"\r  dmtrecord: {created:,}/{count:,} ({created / elapsed:,.0f} rows/s)", end="", flush=True)
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic data generator for load testing")
+    parser.add_argument("--records", type=int, default=100000, help="DMT records to create")
+    parser.add_argument("--catalog-size", type=int, default=20000, help="Part numbers (calibrations: 1/10)")
+    parser.add_argument("--users", type=int, default=300, help="Users to create (LT000001...)")
+    parser.add_argument("--years", type=float, default=3, help="Years covered by created_at")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Rows per INSERT transaction")
+    parser.add_argument("--password", default="loadtest", help="Password of the generated users")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    init_db()
+    begin = time.perf_counter()
+
+    print("Generating users and catalogs...")
+    users_by_role = generate_users(rng, args.users, args.password, args.batch_size)
+    ids_by_entity = generate_catalogs(rng, args.catalog_size, args.batch_size)
+    # Los workers en marcha descartan sus catálogos y usuarios cacheados
+    cache_bus.publish(*(catalog_key(name) for name in ENTITY_MODELS), USERS_KEY, BUNDLE_KEY)
+
+    if args.records:
+        print("Generating DMT records...")
+        now = datetime.utcnow().replace(microsecond=0)
+        factory = RecordFactory(rng, ids_by_entity, users_by_role, now)
+        generate_records(factory, args.records, args.years, args.batch_size)
+
+    print(f"✓ Done in {time.perf_counter() - begin:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
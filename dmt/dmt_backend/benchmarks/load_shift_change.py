@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+"""
+Shift-change load test
+
+Replays the plant's worst hour against a running instance: every virtual
+user logs in through /auth/token within --ramp-seconds, loads the DMT form
+(one /entities/_bundle request, or with --form-load legacy the eleven
+catalog/user GETs of the old form), then alternates between the feed
+(GET /dmt/?is_closed=false, GET /dmt/{id}) and its role's writes until the
+stage ends:
+
+- Inspector: POST /dmt/ (defect_description translated in the write path)
+- other roles with text fields in ALLOWED_FIELDS_BY_ROLE: PATCH /dmt/{id}
+  on one of those fields (also translated)
+- roles without text fields (Quality Engineer) only read; Admin also
+  exports the CSV
+
+The test runs in stages of increasing concurrent users (--stages). While a
+stage runs, GET /admin/saturation is sampled to find where the server
+saturates: threadpool queueing (tasks waiting for a worker thread), DB
+pool exhaustion (all connections checked out) and translation backlog
+(LibreTranslate calls in flight occupying the threadpool). The saturation
+counters are per process: run the instance with a single worker.
+
+The users are the generate_data ones (--user-prefix, --password); the
+admin account (--admin) is used to list them and to read the saturation
+counters.
+
+Usage (from dmt_backend/):
+    python -m benchmarks.generate_data --records 50000
+    python -m benchmarks.fake_translate --latency-ms 300 &
+    LIBRETRANSLATE_URL=http://127.0.0.1:5000/translate uvicorn main:app --port 8000
+    python -m benchmarks.load_shift_change --url http://127.0.0.1:8000 [--stages 10,25,50,100]
+        [--duration 60] [--roles Operator=0.45,Inspector=0.3,...] [--form-load bundle|legacy]
+"""
+
+import argparse
+import asyncio
+import logging
+import math
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+import httpx
+from crud.crud_dmt import ALLOWED_FIELDS_BY_ROLE, TEXT_FIELDS
+from crud.crud_entity import ENTITY_MODELS
+
+# Proporción de usuarios por rol durante el cambio de turno
+DEFAULT_ROLE_RATIOS = {
+    "Operator": 0.45,
+    "Inspector": 0.30,
+    "Tech Engineer": 0.12,
+    "Quality Engineer": 0.08,
+    "Admin": 0.05,
+}
+
+# Formulario anterior: un GET por catálogo más la lista de usuarios
+LEGACY_FORM_PATHS = [f"/entities/{name}" for name in ENTITY_MODELS if name != "calibration"] + ["/users/"]
+
+# Probabilidad de que la acción de un Admin sea el export CSV
+EXPORT_RATIO = 0.05
+
+# Registros abiertos recordados para los PATCH
+OPEN_IDS_MAX = 500
+
+REQUEST_CLASSES = ("login", "form", "read", "write", "export")
+
+
+def parse_roles(value: str) -> Dict[str, float]:
+    ratios = {}
+    for item in value.split(","):
+        role, _, ratio = item.partition("=")
+        role = role.strip()
+        if role not in ALLOWED_FIELDS_BY_ROLE:
+            raise argparse.ArgumentTypeError(f"unknown role {role!r} (roles: {', '.join(ALLOWED_FIELDS_BY_ROLE)})")
+        ratios[role] = float(ratio)
+    return ratios
+
+
+def assign_roles(count: int, ratios: Dict[str, float]) -> List[str]:
+    """
+    Roles de `count` usuarios según las proporciones (redondeo por mayor residuo)
+    """
+    total = sum(ratios.values())
+    exact = {role: count * ratio / total for role, ratio in ratios.items()}
+    counts = {role: math.floor(value) for role, value in exact.items()}
+    for role in sorted(exact, key=lambda r: exact[r] - counts[r], reverse=True)[:count - sum(counts.values())]:
+        counts[role] += 1
+    return [role for role, n in counts.items() for _ in range(n)]
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(1, math.ceil(fraction * len(sorted_values))) - 1]
+
+
+class StageStats:
+    """
+    Latencias, errores y muestras de saturación de una etapa
+    """
+
+    def __init__(self, users: int):
+        self.users = users
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, int] = defaultdict(int)
+        self.samples: List[dict] = []
+        self.loop_lag_max_ms = 0.0
+        self.translation_calls = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def record(self, request_class: str, elapsed_ms: float, status):
+        self.latencies[request_class].append(elapsed_ms)
+        self.statuses[status] += 1
+
+    @property
+    def requests(self) -> int:
+        return sum(len(values) for values in self.latencies.values())
+
+    @property
+    def errors(self) -> int:
+        return sum(count for status, count in self.statuses.items() if not isinstance(status, int) or status >= 500)
+
+    def peak(self, getter) -> float:
+        return max((getter(sample) for sample in self.samples), default=0)
+
+
+class ShiftChange:
+    def __init__(self, args, client: httpx.AsyncClient):
+        self.args = args
+        self.client = client
+        self.rng = random.Random(args.seed)
+        self.admin_headers: Dict[str, str] = {}
+        self.users_by_role: Dict[str, List[str]] = defaultdict(list)
+        self.catalog_ids: Dict[str, List[int]] = {}
+        self.open_ids: List[int] = []
+        self.stats: Optional[StageStats] = None
+
+    async def login(self, username: str, password: str) -> Optional[str]:
+        response = await self.client.post("/auth/token", data={"username": username, "password": password})
+        if response.status_code != 200:
+            return None
+        return response.json()["access_token"]
+
+    async def setup(self):
+        username, _, password = self.args.admin.partition(":")
+        token = await self.login(username, password)
+        if token is None:
+            raise SystemExit(f"Admin login failed for {username}")
+        self.admin_headers = {"Authorization": f"Bearer {token}"}
+
+        users = (await self.client.get("/users/", headers=self.admin_headers)).json()
+        for user in users:
+            if user["username"].startswith(self.args.user_prefix):
+                self.users_by_role[user["role"]].append(user["username"])
+        missing = [role for role in self.args.roles if not self.users_by_role.get(role)]
+        if missing:
+            raise SystemExit(f"No {self.args.user_prefix}* users for roles {missing} (run benchmarks.generate_data)")
+
+        bundle = (await self.client.get("/entities/_bundle", headers=self.admin_headers)).json()
+        self.catalog_ids = {
+            name: [item["id"] for item in items] for name, items in bundle["catalogs"].items()
+        }
+        feed = await self.client.get("/dmt/?is_closed=false&limit=200", headers=self.admin_headers)
+        self.open_ids = [record["id"] for record in feed.json()]
+
+    async def timed(self, request_class: str, method: str, path: str, headers=None, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, headers=headers, **kwargs)
+            status = response.status_code
+        except httpx.TimeoutException:
+            response, status = None, "timeout"
+        except httpx.TransportError:
+            response, status = None, "connection"
+        self.stats.record(request_class, (time.perf_counter() - start) * 1000, status)
+        return response
+
+    # ---------- acciones de un usuario ----------
+
+    def new_record(self) -> dict:
+        rng = self.rng
+        return {
+            "part_number_id": rng.choice(self.catalog_ids["partnumber"]),
+            "work_center_id": rng.choice(self.catalog_ids["workcenter"]),
+            "customer_id": rng.choice(self.catalog_ids["customer"]),
+            "prepared_by_id": rng.choice(self.catalog_ids["preparedby"]),
+            "inspection_item_id": rng.choice(self.catalog_ids["inspectionitem"]),
+            "process_code_id": rng.choice(self.catalog_ids["processcode"]),
+            "operation": f"OP-{rng.randrange(10, 100, 10)}",
+            "quantity": rng.randint(1, 20),
+            "date": datetime.utcnow().isoformat(),
+            "defect_description": f"Shift change load test {rng.randrange(10 ** 6)}: porosity on the sealing surface",
+        }
+
+    async def write(self, role: str, headers: dict):
+        if role == "Inspector":
+            response = await self.timed("write", "POST", "/dmt/", headers, json=self.new_record())
+            if response is not None and response.status_code == 201:
+                self.open_ids.append(response.json()["id"])
+                del self.open_ids[:-OPEN_IDS_MAX]
+            return
+        text_fields = [field for field in ALLOWED_FIELDS_BY_ROLE[role] if field in TEXT_FIELDS]
+        if not text_fields or not self.open_ids:
+            await self.read(headers)
+            return
+        field = self.rng.choice(text_fields)
+        await self.timed(
+            "write", "PATCH", f"/dmt/{self.rng.choice(self.open_ids)}", headers,
+            json={field: f"Updated during shift change {self.rng.randrange(10 ** 6)}"}
+        )
+
+    async def read(self, headers: dict):
+        if self.open_ids and self.rng.random() < 0.3:
+            await self.timed("read", "GET", f"/dmt/{self.rng.choice(self.open_ids)}", headers)
+        else:
+            await self.timed("read", "GET", "/dmt/?is_closed=false&limit=50", headers)
+
+    async def load_form(self, headers: dict):
+        if self.args.form_load == "legacy":
+            await asyncio.gather(*(self.timed("form", "GET", path, headers) for path in LEGACY_FORM_PATHS))
+        else:
+            await self.timed("form", "GET", "/entities/_bundle", headers)
+
+    async def virtual_user(self, username: str, role: str, start_delay: float, deadline: float):
+        await asyncio.sleep(start_delay)
+        start = time.perf_counter()
+        try:
+            response = await self.client.post(
+                "/auth/token", data={"username": username, "password": self.args.password}
+            )
+            status = response.status_code
+        except httpx.HTTPError:
+            response, status = None, "connection"
+        self.stats.record("login", (time.perf_counter() - start) * 1000, status)
+        if status != 200:
+            return
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        await self.load_form(headers)
+
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(self.rng.expovariate(1000 / self.args.think_ms))
+            if time.perf_counter() >= deadline:
+                break
+            if role == "Admin" and self.rng.random() < EXPORT_RATIO:
+                await self.timed("export", "GET", "/dmt/export/csv", headers)
+            elif self.rng.random() < self.args.write_ratio:
+                await self.write(role, headers)
+            else:
+                await self.read(headers)
+
+    # ---------- etapas ----------
+
+    async def sample_saturation(self, stop: asyncio.Event):
+        while not stop.is_set():
+            try:
+                response = await self.client.get("/admin/saturation", headers=self.admin_headers)
+                if response.status_code == 200:
+                    self.stats.samples.append(response.json())
+            except httpx.HTTPError:
+                pass
+            try:
+                await asyncio.wait_for(stop.wait(), self.args.sample_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run_stage(self, users: int) -> StageStats:
+        self.stats = StageStats(users)
+        await self.client.delete("/admin/loop", headers=self.admin_headers)
+        before = (await self.client.get("/admin/saturation", headers=self.admin_headers)).json()
+
+        roles = assign_roles(users, self.args.roles)
+        self.rng.shuffle(roles)
+        cursor = defaultdict(int)
+        deadline = time.perf_counter() + self.args.ramp_seconds + self.args.duration
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(self.sample_saturation(stop))
+
+        tasks = []
+        for role in roles:
+            candidates = self.users_by_role[role]
+            username = candidates[cursor[role] % len(candidates)]
+            cursor[role] += 1
+            start_delay = self.rng.uniform(0, self.args.ramp_seconds)
+            tasks.append(self.virtual_user(username, role, start_delay, deadline))
+        await asyncio.gather(*tasks)
+
+        stop.set()
+        await sampler
+        self.stats.elapsed = time.perf_counter() - self.stats.started
+        loop = (await self.client.get("/admin/loop", headers=self.admin_headers)).json()
+        self.stats.loop_lag_max_ms = loop["lag"]["max_ms"]
+        after = (await self.client.get("/admin/saturation", headers=self.admin_headers)).json()
+        self.stats.translation_calls = after["translation"]["total"] - before["translation"]["total"]
+        return self.stats
+
+
+def print_stage(stats: StageStats):
+    p95 = {
+        name: percentile(sorted(stats.latencies.get(name, [])), 0.95) for name in REQUEST_CLASSES
+    }
+    pool_peak = stats.peak(lambda s: max((p["checked_out"] for p in s["db_pools"].values()), default=0))
+    print(
+        f"{stats.users:>6}{stats.requests:>8}{stats.requests / stats.elapsed:>8.1f}{stats.errors:>6}"
+        + "".join(f"{p95[name]:>11.0f}" for name in REQUEST_CLASSES)
+        + f"{stats.peak(lambda s: s['threadpool']['waiting']):>6}"
+        + f"{pool_peak:>6}"
+        + f"{stats.peak(lambda s: s['translation']['in_flight']):>6}"
+        + f"{stats.loop_lag_max_ms:>9.0f}"
+    )
+
+
+def saturation_points(stages: List[StageStats], translation_backlog: int) -> List[str]:
+    """
+    Primera etapa en que aparece cada síntoma de saturación
+    """
+    findings = []
+
+    def first(label: str, predicate, detail):
+        for stats in stages:
+            if stats.samples and predicate(stats):
+                findings.append(f"{label}: from {stats.users} users ({detail(stats)})")
+                return
+        findings.append(f"{label}: not reached")
+
+    first(
+        "Threadpool queueing",
+        lambda s: s.peak(lambda x: x["threadpool"]["waiting"]) > 0,
+        lambda s: f"up to {s.peak(lambda x: x['threadpool']['waiting'])} tasks waiting for "
+                  f"{s.samples[0]['threadpool']['total']} threads",
+    )
+    # El writer único de SQLite (capacidad 1) hace cola por diseño: no cuenta como agotamiento
+    def exhausted_pools(stats: StageStats):
+        return sorted({
+            f"{name} {pool['checked_out']}/{pool['capacity']}"
+            for sample in stats.samples for name, pool in sample["db_pools"].items()
+            if pool["exhausted"] and pool["capacity"] > 1
+        })
+
+    first("DB pool exhaustion", lambda s: bool(exhausted_pools(s)), lambda s: ", ".join(exhausted_pools(s)))
+    first(
+        "Translation backlog",
+        lambda s: s.peak(lambda x: x["translation"]["in_flight"]) >= translation_backlog,
+        lambda s: f"{s.peak(lambda x: x['translation']['in_flight'])} LibreTranslate calls in flight, "
+                  f"{s.translation_calls} calls in the stage",
+    )
+    first(
+        "Errors / timeouts",
+        lambda s: s.errors > 0,
+        lambda s: ", ".join(f"{status}: {count}" for status, count in sorted(s.statuses.items(), key=str)
+                            if not isinstance(status, int) or status >= 500),
+    )
+    return findings
+
+
+async def run(args) -> int:
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        harness = ShiftChange(args, client)
+        await harness.setup()
+        print(f"Shift change against {args.url} | roles {args.roles} | form load: {args.form_load}")
+        print("-" * 117)
+        print(f"{'users':>6}{'reqs':>8}{'req/s':>8}{'err':>6}"
+              + "".join(f"{name + ' p95':>11}" for name in REQUEST_CLASSES)
+              + f"{'tpQ':>6}{'pool':>6}{'trans':>6}{'lag ms':>9}")
+        print("-" * 117)
+        stages = []
+        for users in args.stages:
+            stages.append(await harness.run_stage(users))
+            print_stage(stages[-1])
+        print("-" * 117)
+        print("tpQ: peak tasks waiting for the threadpool | pool: peak DB connections checked out | "
+              "trans: peak LibreTranslate calls in flight")
+
+    translation_backlog = args.translation_backlog
+    if translation_backlog is None:
+        total_threads = next((s.samples[0]["threadpool"]["total"] for s in stages if s.samples), 40)
+        translation_backlog = max(1, int(total_threads) // 2)
+    print("\nSaturation points:")
+    for finding in saturation_points(stages, translation_backlog):
+        print(f"  - {finding}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shift-change load test")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Base URL of the running API")
+    parser.add_argument("--stages", type=lambda v: [int(n) for n in v.split(",")], default=[10, 25, 50, 100],
+                        help="Concurrent users per stage, comma-separated")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds per stage after the ramp-up")
+    parser.add_argument("--ramp-seconds", type=float, default=10, help="Window in which the users log in")
+    parser.add_argument("--think-ms", type=float, default=2000, help="Mean think time between actions")
+    parser.add_argument("--write-ratio", type=float, default=0.2, help="Fraction of actions that write")
+    parser.add_argument("--roles", type=parse_roles, default=DEFAULT_ROLE_RATIOS,
+                        help="Role ratios, e.g. Operator=0.45,Inspector=0.3,\"Tech Engineer\"=0.12")
+    parser.add_argument("--form-load", choices=("bundle", "legacy"), default="bundle",
+                        help="bundle: one /entities/_bundle; legacy: eleven catalog/user GETs")
+    parser.add_argument("--user-prefix", default="LT", help="Usernames used as virtual users")
+    parser.add_argument("--password", default="loadtest", help="Password of the virtual users")
+    parser.add_argument("--admin", default="ADM001:admin123", help="Admin USER:PASSWORD")
+    parser.add_argument("--sample-interval", type=float, default=0.25, help="Seconds between saturation samples")
+    parser.add_argument("--translation-backlog", type=int,
+                        help="In-flight translations that count as backlog (default: half the threadpool)")
+    parser.add_argument("--timeout", type=float, default=60, help="Client timeout per request (s)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    # Un log INFO de httpx por request taparía la tabla
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
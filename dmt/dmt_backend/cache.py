@@ -0,0 +1,118 @@
+"""
+In-process cache for catalog data (ENTITY_MODELS)
+
+Catalogs change a few times a month but are read on every form view, so
+reads are served from pre-serialized JSON bytes instead of hitting the
+database and Pydantic on every request.
+
+Each catalog has a version counter that is bumped by the CRUD write
+functions (create/update/delete). Bumping the version drops every cached
+page of that catalog.
+
+The form bootstrap bundle (every catalog plus the user list) is cached
+under BUNDLE_KEY and is invalidated together with any catalog or user
+change, so its version works as the combined version.
+
+With several workers, invalidation.py keeps the versions in step: every
+write also bumps a global version in the database and the other workers
+apply it, so version ETags match across workers.
+"""
+
+import threading
+from typing import Dict, Hashable, Optional, Tuple
+
+
+# Nombres especiales en el cache (los catálogos usan el nombre del entity)
+USERS_KEY = "_users"
+BUNDLE_KEY = "_bundle"
+
+
+class CatalogCache:
+    """
+    Cache de catálogos con contador de versión por nombre
+
+    Entries are stored per (name, key), where key identifies the page
+    (e.g. (skip, limit)). A value is only stored if the version it was
+    built from is still current, so a read that races with a write never
+    repopulates the cache with stale data.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions: Dict[str, int] = {}
+        self._entries: Dict[str, Dict[Hashable, bytes]] = {}
+
+    def version(self, name: str) -> int:
+        """
+        Versión actual del catálogo
+        """
+        return self._versions.get(name, 0)
+
+    def get(self, name: str, key: Hashable) -> Optional[bytes]:
+        """
+        Obtener bytes cacheados o None
+        """
+        entries = self._entries.get(name)
+        if entries is None:
+            return None
+        return entries.get(key)
+
+    def put(self, name: str, version: int, key: Hashable, payload: bytes) -> bool:
+        """
+        Guardar bytes si la versión sigue vigente
+        Retorna False si el catálogo cambió mientras se construía el payload
+        """
+        with self._lock:
+            if self._versions.get(name, 0) != version:
+                return False
+            self._entries.setdefault(name, {})[key] = payload
+            return True
+
+    def invalidate(self, name: str) -> int:
+        """
+        Incrementar la versión y descartar las entradas del catálogo
+        Retorna la nueva versión
+        """
+        with self._lock:
+            new_version = self._versions.get(name, 0) + 1
+            self._versions[name] = new_version
+            self._entries.pop(name, None)
+            return new_version
+
+    def advance(self, name: str, version: int, changed: bool = False) -> bool:
+        """
+        Llevar la versión a `version` si la local es menor (bus de invalidación)
+        changed=True (cambio de otro worker): descartar las entradas aunque la
+        versión local ya sea igual o mayor (invalidaciones propias sin publicar)
+        Retorna True si descartó las entradas del catálogo
+        """
+        with self._lock:
+            if self._versions.get(name, 0) < version:
+                self._versions[name] = version
+            elif not changed:
+                return False
+            self._entries.pop(name, None)
+            return True
+
+    def clear(self):
+        """
+        Descartar todas las entradas e incrementar todas las versiones
+        """
+        with self._lock:
+            for name in set(self._versions) | set(self._entries):
+                self._versions[name] = self._versions.get(name, 0) + 1
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Tuple[int, int]]:
+        """
+        (versión, número de entradas) por catálogo
+        """
+        names = set(self._versions) | set(self._entries)
+        return {
+            name: (self.version(name), len(self._entries.get(name, {})))
+            for name in sorted(names)
+        }
+
+
+# Instancia global usada por crud_entity
+catalog_cache = CatalogCache()
@@ -0,0 +1,198 @@
+"""
+Bulk catalog import (CSV / JSON lines)
+
+The uploaded file is parsed incrementally in the threadpool, in batches of
+CATALOG_IMPORT_BATCH_SIZE rows, so memory stays bounded for large files
+(Starlette spools multipart uploads larger than 1 MB to disk). Each batch
+is upserted on item_number with the dialect's native statement:
+
+- SQLite / PostgreSQL: INSERT ... ON CONFLICT (item_number) DO UPDATE
+- MySQL / MariaDB:     INSERT ... ON DUPLICATE KEY UPDATE
+
+Rows whose item_name did not change are not written at all, which is what
+makes the weekly full refresh of a large catalog fast.
+
+Accepted formats:
+    CSV         header with item_number and item_name columns (any order,
+                extra columns ignored), UTF-8 with or without BOM
+    JSON lines  one {"item_number": ..., "item_name": ...} object per line
+
+Configuration (environment variables):
+    CATALOG_IMPORT_BATCH_SIZE   Rows per upsert statement (default: 2000)
+"""
+
+import csv
+import io
+import json
+import os
+from typing import Iterator, List, Optional, Tuple
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from starlette.concurrency import run_in_threadpool
+
+CATALOG_IMPORT_BATCH_SIZE = int(os.getenv("CATALOG_IMPORT_BATCH_SIZE", "2000"))
+
+# Errores de parseo incluidos en la respuesta (el total siempre se cuenta)
+MAX_ERROR_SAMPLES = 20
+
+# Longitudes máximas de EntityBase
+ITEM_NUMBER_MAX_LENGTH = 100
+ITEM_NAME_MAX_LENGTH = 255
+
+IMPORT_FORMATS = ("csv", "jsonl")
+
+
+class ImportReport:
+    """
+    Contadores de una importación
+    """
+
+    def __init__(self, entity_name: str):
+        self.entity_name = entity_name
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.duplicates = 0
+        self.errors = 0
+        self.error_samples: List[str] = []
+
+    def add_error(self, line_number: int, message: str):
+        self.errors += 1
+        if len(self.error_samples) < MAX_ERROR_SAMPLES:
+            self.error_samples.append(f"line {line_number}: {message}")
+
+    def as_dict(self) -> dict:
+        return {
+            "entity": self.entity_name,
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "unchanged": self.unchanged,
+            "duplicates": self.duplicates,
+            "errors": self.errors,
+            "error_samples": self.error_samples,
+        }
+
+
+def detect_format(filename: Optional[str], content_type: Optional[str]) -> str:
+    """
+    csv o jsonl según la extensión o el content type del archivo
+    """
+    name = (filename or "").lower()
+    if name.endswith((".jsonl", ".ndjson")) or (content_type or "").startswith(
+        ("application/x-ndjson", "application/jsonl", "application/x-jsonlines")
+    ):
+        return "jsonl"
+    return "csv"
+
+
+def normalize_row(data) -> Tuple[Optional[dict], Optional[str]]:
+    """
+    Validar una fila; retorna (fila, None) o (None, mensaje de error)
+    """
+    if not isinstance(data, dict):
+        return None, "expected an object with item_number and item_name"
+    item_number = str(data.get("item_number") or "").strip()
+    item_name = str(data.get("item_name") or "").strip()
+    if not item_number:
+        return None, "item_number is required"
+    if not item_name:
+        return None, "item_name is required"
+    if len(item_number) > ITEM_NUMBER_MAX_LENGTH:
+        return None, f"item_number longer than {ITEM_NUMBER_MAX_LENGTH} characters"
+    if len(item_name) > ITEM_NAME_MAX_LENGTH:
+        return None, f"item_name longer than {ITEM_NAME_MAX_LENGTH} characters"
+    return {"item_number": item_number, "item_name": item_name}, None
+
+
+def iter_catalog_rows(binary_file, file_format: str) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """
+    Recorrer el archivo: (número de línea, fila o None, error o None)
+
+    Raises:
+        ValueError: Si el encabezado del CSV no tiene item_number e item_name
+    """
+    text = io.TextIOWrapper(binary_file, encoding="utf-8-sig", errors="replace", newline="")
+    try:
+        if file_format == "jsonl":
+            for line_number, line in enumerate(text, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    data = json.loads(line)
+                except ValueError as e:
+                    yield line_number, None, f"invalid JSON: {e}"
+                    continue
+                yield (line_number, *normalize_row(data))
+            return
+
+        reader = csv.reader(text)
+        header = next(reader, None) or []
+        columns = {name.strip().lower(): position for position, name in enumerate(header)}
+        if "item_number" not in columns or "item_name" not in columns:
+            raise ValueError("CSV header must include item_number and item_name columns")
+        number_column, name_column = columns["item_number"], columns["item_name"]
+
+        for row in reader:
+            if not any(value.strip() for value in row):
+                continue
+            data = {
+                "item_number": row[number_column] if number_column < len(row) else "",
+                "item_name": row[name_column] if name_column < len(row) else "",
+            }
+            yield (reader.line_num, *normalize_row(data))
+    finally:
+        # No cerrar el archivo subido junto con el wrapper
+        text.detach()
+
+
+def _next_chunk(rows: Iterator, size: int) -> list:
+    chunk = []
+    for item in rows:
+        chunk.append(item)
+        if len(chunk) >= size:
+            break
+    return chunk
+
+
+async def read_catalog_batches(binary_file, file_format: str, report: ImportReport, batch_size: int = CATALOG_IMPORT_BATCH_SIZE):
+    """
+    Lotes de filas válidas (sin item_number repetidos dentro del lote)
+    El parseo corre en el threadpool; los errores se registran en `report`
+    """
+    rows = iter_catalog_rows(binary_file, file_format)
+    while True:
+        chunk = await run_in_threadpool(_next_chunk, rows, batch_size)
+        if not chunk:
+            return
+
+        batch = {}
+        for line_number, row, error in chunk:
+            report.rows += 1
+            if error:
+                report.add_error(line_number, error)
+            else:
+                # La última aparición de un item_number gana
+                if row["item_number"] in batch:
+                    report.duplicates += 1
+                batch[row["item_number"]] = row
+        if batch:
+            yield list(batch.values())
+
+
+def upsert_statement(model, dialect_name: str):
+    """
+    INSERT con upsert nativo sobre item_number, o None si el dialecto no lo soporta
+    """
+    table = model.__table__
+    if dialect_name in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect_name == "sqlite" else postgresql.insert
+        statement = insert(table)
+        return statement.on_conflict_do_update(
+            index_elements=[table.c.item_number],
+            set_={"item_name": statement.excluded.item_name}
+        )
+    if dialect_name in ("mysql", "mariadb"):
+        statement = mysql.insert(table)
+        return statement.on_duplicate_key_update(item_name=statement.inserted.item_name)
+    return None
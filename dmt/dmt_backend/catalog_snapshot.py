@@ -0,0 +1,507 @@
+"""
+Shared-memory snapshot of the catalogs (ENTITY_MODELS) and the user directory
+
+Instead of every worker loading and serializing its own copy of each
+catalog, the catalogs are compiled into one read-only file that all workers
+mmap, so the operating system keeps a single copy of the pages. A worker
+that starts with a current file serves catalogs without touching the
+database.
+
+File layout (little-endian):
+
+    header    magic "DMTSNAP2", section count, database epoch, build time (ns)
+    sections  name, kind, version, offset, length (one per table or blob)
+    table     rows, columns, column directory, then
+              ids (int64, sorted), key order (uint32 row positions sorted
+              by the first column), and per column the string offsets
+              (uint32, rows + 1) and the UTF-8 string table
+    blob      pre-serialized bundle JSON and its gzip
+
+Catalog tables have (item_number, item_name) columns, the user table
+(username, full_name, role). id -> label is a binary search over the
+mapped ids and item_number -> id a binary search over the key order,
+without loading the table into Python objects.
+
+Each section carries the global version (invalidation.py) it was built
+from, and is only used while it matches the worker's catalog_cache version;
+otherwise the regular path (database + catalog_cache) answers. Versions
+are small counters that start over in every new database, so the header
+also carries the database's shared epoch (the ETag epoch in the
+cache_version table) and a worker only maps a file with its own database's
+epoch that was built after the worker started: a file left by another
+database, or by this one before it was re-created or restored, is rebuilt
+instead of adopted. After a
+catalog or user write, the bus wakes a background thread in each worker:
+the first one to take the file lock rebuilds the file (temporary file +
+os.replace, so readers always see a complete snapshot) and the others map
+it. Requires the invalidation bus (CACHE_BUS != off).
+
+Configuration (environment variables):
+    CATALOG_SNAPSHOT        1 (default) to build and use the snapshot
+    CATALOG_SNAPSHOT_PATH   File path (default: temp dir, one per database:
+                            absolute file path for SQLite, server and name otherwise)
+"""
+
+import bisect
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from cache import catalog_cache, USERS_KEY, BUNDLE_KEY
+from database import DATABASE_URL, engine
+from invalidation import cache_bus, read_epoch, read_versions
+from metrics import Counter, GaugeCallback
+from responses import dumps
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: sin lock entre procesos (os.replace sigue siendo atómico)
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+
+def database_identity(database_url: str) -> str:
+    """
+    Base de datos a la que apunta la URL: ruta absoluta resuelta en SQLite
+    (sqlite:///./dmt.db depende del directorio actual), servidor y nombre en
+    las demás (sin driver, usuario ni password)
+    """
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if backend == "sqlite":
+        database = url.database or ""
+        if database and database != ":memory:" and not database.startswith("file:"):
+            database = os.path.realpath(database)
+        return f"sqlite:{database}"
+    return f"{backend}://{url.host or ''}:{url.port or ''}/{url.database or ''}"
+
+
+CATALOG_SNAPSHOT_ENABLED = os.getenv("CATALOG_SNAPSHOT", "1") == "1"
+CATALOG_SNAPSHOT_PATH = os.getenv("CATALOG_SNAPSHOT_PATH") or os.path.join(
+    tempfile.gettempdir(),
+    "dmt_catalog_snapshot_"
+    f"{hashlib.sha256(database_identity(DATABASE_URL).encode('utf-8')).hexdigest()[:12]}.bin"
+)
+
+MAGIC = b"DMTSNAP2"
+HEADER = struct.Struct("<8sIIQQ")      # magic, secciones, reservado, epoch, construido (ns)
+SECTION = struct.Struct("<24sIIQQQ")   # nombre, tipo, reservado, versión, offset, largo
+TABLE = struct.Struct("<II")           # filas, columnas
+KIND_TABLE = 1
+KIND_BLOB = 2
+
+# Secciones con el bundle ya serializado (versión de BUNDLE_KEY)
+BUNDLE_JSON = BUNDLE_KEY
+BUNDLE_GZIP = BUNDLE_KEY + ".gz"
+
+REBUILDS = Counter("dmt_catalog_snapshot_rebuilds_total", "Catalog snapshot files written by this worker")
+
+
+def _pad(buffer: bytearray):
+    buffer.extend(b"\0" * (-len(buffer) % 8))
+
+
+def encode_table(rows: Sequence[tuple], columns: int) -> bytes:
+    """
+    Filas (id, columna0, columna1, ...) -> sección de tabla
+    """
+    rows = sorted(rows, key=lambda row: row[0])
+    strings = [[(row[column + 1] or "").encode("utf-8") for row in rows] for column in range(columns)]
+    key_order = sorted(range(len(rows)), key=lambda index: strings[0][index]) if columns else []
+
+    buffer = bytearray(TABLE.pack(len(rows), columns))
+    directory_at = len(buffer)
+    buffer.extend(b"\0" * (16 * columns))
+    _pad(buffer)
+    buffer.extend(array("q", [row[0] for row in rows]).tobytes())
+    buffer.extend(array("I", key_order).tobytes())
+
+    directory = []
+    for values in strings:
+        _pad(buffer)
+        offsets_at = len(buffer)
+        offsets = array("I", [0])
+        for value in values:
+            offsets.append(offsets[-1] + len(value))
+        buffer.extend(offsets.tobytes())
+        blob_at = len(buffer)
+        buffer.extend(b"".join(values))
+        directory.extend((offsets_at, blob_at))
+    struct.pack_into(f"<{2 * columns}Q", buffer, directory_at, *directory)
+    return bytes(buffer)
+
+
+def encode_snapshot(sections: List[Tuple[str, int, int, bytes]], epoch: int, built_at: int) -> bytes:
+    """
+    Secciones (nombre, tipo, versión, datos) -> archivo completo
+    `epoch` identifica la base de datos; `built_at` en ns (time.time_ns)
+    """
+    buffer = bytearray(HEADER.pack(MAGIC, len(sections), 0, epoch, built_at))
+    directory_at = len(buffer)
+    buffer.extend(b"\0" * (SECTION.size * len(sections)))
+    for index, (name, kind, version, data) in enumerate(sections):
+        _pad(buffer)
+        SECTION.pack_into(
+            buffer, directory_at + index * SECTION.size,
+            name.encode("utf-8"), kind, 0, version, len(buffer), len(data)
+        )
+        buffer.extend(data)
+    return bytes(buffer)
+
+
+class SnapshotTable:
+    """
+    Tabla mapeada: ids ordenados, orden por clave y columnas de strings
+    """
+
+    def __init__(self, view: memoryview):
+        self.rows, columns = TABLE.unpack_from(view, 0)
+        directory = struct.unpack_from(f"<{2 * columns}Q", view, TABLE.size)
+        position = TABLE.size + 16 * columns
+        position += -position % 8
+        self.ids = view[position:position + 8 * self.rows].cast("q")
+        position += 8 * self.rows
+        self.key_order = view[position:position + 4 * self.rows].cast("I")
+        self.columns = []
+        for offsets_at, blob_at in zip(directory[::2], directory[1::2]):
+            offsets = view[offsets_at:offsets_at + 4 * (self.rows + 1)].cast("I")
+            self.columns.append((offsets, view[blob_at:blob_at + offsets[self.rows]]))
+
+    def row_for_id(self, record_id: int) -> Optional[int]:
+        index = bisect.bisect_left(self.ids, record_id)
+        if index < self.rows and self.ids[index] == record_id:
+            return index
+        return None
+
+    def row_for_key(self, key: str) -> Optional[int]:
+        target = key.encode("utf-8")
+        offsets, blob = self.columns[0]
+        low, high = 0, self.rows
+        while low < high:
+            middle = (low + high) // 2
+            row = self.key_order[middle]
+            if blob[offsets[row]:offsets[row + 1]].tobytes() < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.rows:
+            row = self.key_order[low]
+            if blob[offsets[row]:offsets[row + 1]] == target:
+                return row
+        return None
+
+    def value(self, column: int, row: int) -> str:
+        offsets, blob = self.columns[column]
+        return str(blob[offsets[row]:offsets[row + 1]], "utf-8")
+
+
+class CatalogSnapshot:
+    """
+    Archivo de snapshot mapeado en memoria (solo lectura)
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as file:
+            stat = os.fstat(file.fileno())
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        self.size = stat.st_size
+        view = memoryview(self._mmap)
+        magic, sections, _, self.epoch, self.built_at = HEADER.unpack_from(view, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a catalog snapshot")
+
+        self.versions: Dict[str, int] = {}
+        self.tables: Dict[str, SnapshotTable] = {}
+        self.blobs: Dict[str, memoryview] = {}
+        for index in range(sections):
+            name, kind, _, version, offset, length = SECTION.unpack_from(view, HEADER.size + index * SECTION.size)
+            name = name.rstrip(b"\0").decode("utf-8")
+            section = view[offset:offset + length]
+            if kind == KIND_TABLE:
+                self.tables[name] = SnapshotTable(section)
+            else:
+                self.blobs[name] = section
+            self.versions[name] = version
+
+    def label(self, name: str, record_id: Optional[int]) -> str:
+        """
+        "item_number - item_name" del registro (o "username - full_name" en _users)
+        """
+        table = self.tables[name]
+        row = table.row_for_id(record_id) if record_id is not None else None
+        if row is None:
+            return ""
+        return f"{table.value(0, row)} - {table.value(1, row)}"
+
+    def find_id(self, name: str, item_number: str) -> Optional[int]:
+        """
+        Id del registro con ese item_number (username en _users)
+        """
+        table = self.tables[name]
+        row = table.row_for_key(item_number)
+        return table.ids[row] if row is not None else None
+
+    def page(self, name: str, skip: int, limit: int) -> List[dict]:
+        """
+        Página en orden de id, con la forma de EntityRead
+        """
+        table = self.tables[name]
+        return [
+            {"id": table.ids[row], "item_number": table.value(0, row), "item_name": table.value(1, row)}
+            for row in range(min(skip, table.rows), min(skip + limit, table.rows))
+        ]
+
+
+def build_snapshot(connection) -> bytes:
+    """
+    Leer catálogos, usuarios y sus versiones globales y armar el archivo
+    Las versiones se leen antes que los datos: una escritura concurrente
+    deja el snapshot con datos más nuevos que su versión, nunca más viejos
+    """
+    from crud.crud_entity import ENTITY_MODELS, BUNDLE_USERS_STATEMENT, catalog_key, serialize_catalog_bundle
+
+    versions = read_versions(connection)
+    epoch = read_epoch(connection) or 0
+    built_at = time.time_ns()
+    catalogs = {
+        name: connection.execute(
+            select(model.id, model.item_number, model.item_name).order_by(model.id)
+        ).all()
+        for name, model in ENTITY_MODELS.items()
+    }
+    users = connection.execute(BUNDLE_USERS_STATEMENT).all()
+
+    sections = [
+        (catalog_key(name), KIND_TABLE, versions.get(catalog_key(name), 0), encode_table(rows, 2))
+        for name, rows in catalogs.items()
+    ]
+    sections.append((USERS_KEY, KIND_TABLE, versions.get(USERS_KEY, 0), encode_table(users, 3)))
+    bundle_version = versions.get(BUNDLE_KEY, 0)
+    payload, compressed = serialize_catalog_bundle(bundle_version, catalogs, users)
+    sections.append((BUNDLE_JSON, KIND_BLOB, bundle_version, payload))
+    sections.append((BUNDLE_GZIP, KIND_BLOB, bundle_version, compressed))
+    return encode_snapshot(sections, epoch, built_at)
+
+
+class SnapshotStore:
+    """
+    Snapshot vigente de este worker y el hilo que lo mantiene al día
+    """
+
+    def __init__(self, path: str = CATALOG_SNAPSHOT_PATH):
+        self.path = path
+        self.enabled = CATALOG_SNAPSHOT_ENABLED and cache_bus.enabled
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._thread: Optional[threading.Thread] = None
+        self._dirty = threading.Event()
+        self._stop = False
+        self._last_error: Optional[str] = None
+        # Solo se usan archivos construidos después de iniciar este worker
+        self._started_ns = time.time_ns()
+        # La base de datos ya no es la del bus (recreada o cambiada en caliente)
+        self._foreign_database = False
+
+    # ----- lectura (requests) -----
+
+    def current(self, *names: str) -> Optional[CatalogSnapshot]:
+        """
+        Snapshot si está al día para todos los nombres, si no None
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            return None
+        for name in names:
+            if snapshot.versions.get(name) != catalog_cache.version(name):
+                return None
+        return snapshot
+
+    def page_json(self, name: str, skip: int, limit: int) -> Optional[bytes]:
+        """
+        Página del catálogo como JSON (None: usar la base de datos)
+        """
+        snapshot = self.current(name)
+        if snapshot is None or name not in snapshot.tables:
+            return None
+        return dumps(snapshot.page(name, skip, limit))
+
+    def bundle(self) -> Optional[Tuple[int, bytes, bytes]]:
+        """
+        (versión, JSON, gzip) del bundle (None: usar la base de datos)
+        """
+        snapshot = self.current(BUNDLE_KEY)
+        if snapshot is None:
+            return None
+        return (
+            snapshot.versions[BUNDLE_JSON],
+            snapshot.blobs[BUNDLE_JSON].tobytes(),
+            snapshot.blobs[BUNDLE_GZIP].tobytes(),
+        )
+
+    # ----- mantenimiento (hilo) -----
+
+    def _wanted(self) -> Dict[str, int]:
+        from crud.crud_entity import ENTITY_MODELS, catalog_key
+        names = [catalog_key(name) for name in ENTITY_MODELS] + [USERS_KEY, BUNDLE_KEY]
+        return {name: catalog_cache.version(name) for name in names}
+
+    def _stale(self) -> bool:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return True
+        # Una versión del snapshot mayor que la local no es vieja: el bus la aplicará
+        return any(snapshot.versions.get(name, -1) < version for name, version in self._wanted().items())
+
+    def _usable(self, snapshot: CatalogSnapshot) -> bool:
+        # Misma base de datos que el bus y construido después de iniciar el
+        # worker: un archivo anterior puede ser de una base ya borrada o restaurada
+        return (
+            cache_bus.epoch is not None
+            and snapshot.epoch == cache_bus.epoch
+            and snapshot.built_at >= self._started_ns
+        )
+
+    def _remap(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.identity == (stat.st_ino, stat.st_mtime_ns, stat.st_size):
+            return
+        try:
+            mapped = CatalogSnapshot(self.path)
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning("Could not map catalog snapshot %s: %s", self.path, e)
+            return
+        if self._usable(mapped):
+            # El mapa anterior se libera cuando no quedan lecturas en curso
+            self._snapshot = mapped
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def refresh(self):
+        """
+        Mapear el archivo más nuevo y reconstruirlo si sigue viejo
+        """
+        if self._foreign_database or cache_bus.epoch is None:
+            return
+        self._remap()
+        if not self._stale():
+            return
+        with self._file_lock():
+            # Otro worker pudo reconstruirlo mientras esperábamos el lock
+            self._remap()
+            if not self._stale():
+                return
+            with engine.connect() as connection:
+                data = build_snapshot(connection)
+            temporary = f"{self.path}.{os.getpid()}.tmp"
+            with open(temporary, "wb") as file:
+                file.write(data)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary, self.path)
+            REBUILDS.inc()
+            if HEADER.unpack_from(data, 0)[3] != cache_bus.epoch:
+                # La base de datos cambió con el proceso corriendo: las versiones
+                # locales ya no la describen, no usar snapshots hasta reiniciar
+                self._foreign_database = True
+                self._snapshot = None
+                raise RuntimeError("database epoch changed; restart the workers to re-enable the catalog snapshot")
+            self._remap()
+
+    def mark_dirty(self, names=None):
+        """
+        Pedir una actualización al hilo (listener del bus)
+        """
+        self._dirty.set()
+
+    def start(self):
+        """
+        Mapear o construir el snapshot en segundo plano (lifespan, después del bus)
+        """
+        if not self.enabled or self._thread is not None:
+            return
+        self._stop = False
+        self._started_ns = time.time_ns()
+        cache_bus.add_listener(self.mark_dirty)
+        self._dirty.set()
+        self._thread = threading.Thread(target=self._run, name="catalog-snapshot", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Detener el hilo (shutdown)
+        """
+        if self._thread is None:
+            return
+        self._stop = True
+        self._dirty.set()
+        self._thread.join(timeout=10)
+        self._thread = None
+
+    def _run(self):
+        while True:
+            self._dirty.wait()
+            if self._stop:
+                return
+            self._dirty.clear()
+            try:
+                self.refresh()
+                if not self._foreign_database:
+                    self._last_error = None
+            except Exception as e:
+                self._last_error = f"{type(e).__name__}: {e}"
+                logger.warning("Catalog snapshot refresh failed: %s", e)
+
+    def status(self) -> dict:
+        """
+        Estado del snapshot (GET /admin/cache)
+        """
+        snapshot = self._snapshot
+        return {
+            "enabled": self.enabled,
+            "path": self.path,
+            "epoch": snapshot.epoch if snapshot else None,
+            "built_at": snapshot.built_at / 1e9 if snapshot else None,
+            "size_bytes": snapshot.size if snapshot else None,
+            "versions": dict(sorted(snapshot.versions.items())) if snapshot else {},
+            "current": sorted(
+                name for name in (snapshot.versions if snapshot else {})
+                if name != BUNDLE_GZIP and self.current(name) is not None
+            ),
+            "rebuilds": REBUILDS.total(),
+            "last_error": self._last_error,
+        }
+
+
+# Instancia global (un mapa por worker, el mismo archivo para todos)
+catalog_snapshot = SnapshotStore()
+
+GaugeCallback(
+    "dmt_catalog_snapshot_bytes", "Size of the mapped catalog snapshot", (),
+    lambda: {(): catalog_snapshot._snapshot.size} if catalog_snapshot._snapshot else {}
+)
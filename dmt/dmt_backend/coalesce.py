@@ -0,0 +1,122 @@
+"""
+Single-flight coalescing of identical concurrent reads
+
+At shift start dozens of clients ask for the same catalog, user list and
+first page of /dmt/ within the same second, and each request used to run
+its own query and serialization. Read endpoints now go through
+single_flight.run(route, key, compute): the first request for a key (the
+leader) runs compute() and the ones that arrive while it is in flight (the
+followers) await the same result, the serialized JSON bytes.
+
+The key is the route, the normalized query parameters and an authorization
+class (e.g. every authenticated role sees the same catalog page; readers
+routed to the primary and to replicas never share). It also includes the
+number of commits seen by this worker, so a read that starts after a local
+write never joins a computation that started before it. Only in-flight
+work is shared: nothing is kept after the leader finishes.
+
+The query runs in the leader's context (SQL stats and trace spans are
+attributed to the leader) but on a session of its own, opened by compute()
+on the same engine as the leader's (database.shared_read_session): if the
+leader is cancelled, its request session closes while the shielded query
+goes on for the followers.
+
+Configuration (environment variables):
+    COALESCE_ENABLED    1 (default) or 0
+"""
+
+import asyncio
+import os
+import threading
+from typing import Awaitable, Callable, Dict, Hashable, List, TypeVar
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from metrics import Counter
+
+COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "1") == "1"
+
+COALESCED = Counter(
+    "dmt_coalesce_requests_total", "Coalesced reads by route (role: leader runs the query, follower shares it)",
+    ("route", "role")
+)
+
+T = TypeVar("T")
+
+# Commits de este proceso (cualquier engine); forma parte de la clave
+_commits_lock = threading.Lock()
+_commits = 0
+
+
+def _after_commit(connection):
+    global _commits
+    with _commits_lock:
+        _commits += 1
+
+
+def install_coalescing():
+    """
+    Registrar el contador de commits (idempotente)
+    """
+    if not COALESCE_ENABLED or event.contains(Engine, "commit", _after_commit):
+        return
+    event.listen(Engine, "commit", _after_commit)
+
+
+class SingleFlight:
+    """
+    Cálculos en curso por clave y conteo de líderes / seguidores por ruta
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        self._stats: Dict[str, List[int]] = {}
+
+    async def run(self, route: str, key: Hashable, compute: Callable[[], Awaitable[T]]) -> T:
+        """
+        Resultado de compute(), compartido con los requests idénticos en curso
+        """
+        if not COALESCE_ENABLED:
+            return await compute()
+
+        full_key = (route, key, _commits)
+        stats = self._stats.setdefault(route, [0, 0])
+        task = self._in_flight.get(full_key)
+        if task is not None:
+            stats[1] += 1
+            COALESCED.labels(route, "follower").inc()
+            return await asyncio.shield(task)
+
+        stats[0] += 1
+        COALESCED.labels(route, "leader").inc()
+        task = asyncio.ensure_future(compute())
+        self._in_flight[full_key] = task
+
+        def forget(_):
+            if self._in_flight.get(full_key) is task:
+                del self._in_flight[full_key]
+
+        task.add_done_callback(forget)
+        # shield: si el líder se cancela, los seguidores siguen esperando el resultado
+        return await asyncio.shield(task)
+
+    def status(self) -> dict:
+        """
+        Líderes, seguidores y proporción deduplicada por ruta (GET /admin/coalescing)
+        """
+        routes = {}
+        for route, (leaders, followers) in sorted(self._stats.items()):
+            total = leaders + followers
+            routes[route] = {
+                "requests": total,
+                "executions": leaders,
+                "shared": followers,
+                "dedup_ratio": round(followers / total, 4) if total else 0.0,
+            }
+        return {"enabled": COALESCE_ENABLED, "in_flight": len(self._in_flight), "routes": routes}
+
+    def reset(self):
+        self._stats.clear()
+
+
+# Instancia global (por worker)
+single_flight = SingleFlight()
@@ -0,0 +1,202 @@
+"""
+Response compression middleware (brotli / gzip)
+
+Compresses text and JSON responses above a size threshold using the best
+encoding the client accepts: brotli when the optional `brotli` package is
+installed, gzip otherwise. Responses that already carry a Content-Encoding
+(e.g. the pre-compressed /entities/_bundle) and event streams are passed
+through untouched. A strong ETag on a compressed response is turned into
+a weak one, since the bytes on the wire differ from the identity variant.
+
+Configuration (environment variables):
+    COMPRESSION_MIN_SIZE   Minimum body size in bytes (default: 1024)
+    COMPRESSION_GZIP_LEVEL gzip level 1-9 (default: 6)
+    COMPRESSION_BR_QUALITY brotli quality 0-11 (default: 4)
+"""
+
+import os
+import zlib
+from typing import Dict, Optional, Sequence
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional
+    brotli = None
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BR_QUALITY = int(os.getenv("COMPRESSION_BR_QUALITY", "4"))
+
+# Tipos de contenido que vale la pena comprimir
+COMPRESSIBLE_TYPES = ("application/json", "text/csv", "text/plain", "text/html", "application/javascript")
+
+
+def _is_compressible(content_type: str) -> bool:
+    content_type = content_type.split(";")[0].strip().lower()
+    return content_type in COMPRESSIBLE_TYPES or content_type.endswith("+json")
+
+
+class _Compressor:
+    """
+    Interfaz común sobre zlib (gzip) y brotli
+    """
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._obj = brotli.Compressor(quality=COMPRESSION_BR_QUALITY)
+        else:
+            self._obj = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._obj.process(data)
+        return self._obj.compress(data)
+
+    def finish(self) -> bytes:
+        return self._obj.finish() if self.encoding == "br" else self._obj.flush()
+
+
+def _accepted_codings(accept_encoding: str) -> Dict[str, float]:
+    """
+    Codificaciones de Accept-Encoding con su q (1 si falta, 0 si no es un número)
+    """
+    codings = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name.strip():
+            codings[name.strip().lower()] = q
+    return codings
+
+
+def choose_encoding(accept_encoding: str, offered: Sequence[str] = ("br", "gzip")) -> Optional[str]:
+    """
+    Elegir una de `offered` según Accept-Encoding (None: sin comprimir)
+    Gana la de mayor q (q=0 la rechaza); a igual q, el orden de `offered`
+    "*" vale para las codificaciones que no se nombran
+    """
+    codings = _accepted_codings(accept_encoding)
+    chosen, chosen_q = None, 0.0
+    for encoding in offered:
+        if encoding == "br" and brotli is None:
+            continue
+        q = codings.get(encoding, codings.get("*", 0.0))
+        if q > chosen_q:
+            chosen, chosen_q = encoding, q
+    return chosen
+
+
+class CompressionMiddleware:
+    """
+    Middleware ASGI de compresión para respuestas HTTP
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for name, value in scope.get("headers", []):
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+
+        encoding = choose_encoding(accept_encoding)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(send, encoding, self.minimum_size)
+        await self.app(scope, receive, responder)
+
+
+class _CompressionResponder:
+    """
+    Intercepta los mensajes de respuesta y comprime el cuerpo si aplica
+    """
+
+    def __init__(self, send, encoding: str, minimum_size: int):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start_message = None
+        self.compressor: Optional[_Compressor] = None
+        self.passthrough = False
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            headers = {name.lower(): value for name, value in message.get("headers", [])}
+            content_type = headers.get(b"content-type", b"").decode("latin-1")
+            self.passthrough = (
+                b"content-encoding" in headers
+                or message["status"] in (204, 304)
+                or not _is_compressible(content_type)
+            )
+            if self.passthrough:
+                await self.send(message)
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is None:
+            # Primer fragmento: decidir si se comprime
+            if not more_body and len(body) < self.minimum_size:
+                self.passthrough = True
+                await self.send(self.start_message)
+                await self.send(message)
+                return
+
+            self.compressor = _Compressor(self.encoding)
+            headers = []
+            for name, value in self.start_message.get("headers", []):
+                if name.lower() in (b"content-length", b"vary"):
+                    continue
+                if name.lower() == b"etag" and not value.startswith(b"W/"):
+                    value = b"W/" + value
+                headers.append((name, value))
+            vary = b", ".join(
+                value for name, value in self.start_message.get("headers", [])
+                if name.lower() == b"vary"
+            )
+            if b"accept-encoding" not in vary.lower():
+                vary = vary + b", Accept-Encoding" if vary else b"Accept-Encoding"
+            headers.append((b"content-encoding", self.encoding.encode("latin-1")))
+            headers.append((b"vary", vary))
+
+            if not more_body:
+                # Respuesta completa en un solo mensaje
+                compressed = self.compressor.compress(body) + self.compressor.finish()
+                headers.append((b"content-length", str(len(compressed)).encode("latin-1")))
+                self.start_message["headers"] = headers
+                await self.send(self.start_message)
+                await self.send({"type": "http.response.body", "body": compressed})
+                return
+
+            # Respuesta en streaming (ej. export CSV): sin Content-Length
+            self.start_message["headers"] = headers
+            await self.send(self.start_message)
+
+        chunk = self.compressor.compress(body)
+        if not more_body:
+            chunk += self.compressor.finish()
+        if chunk or not more_body:
+            await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
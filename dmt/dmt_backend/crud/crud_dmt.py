@@ -1,9 +1,15 @@
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from datetime import datetime
 from sqlmodel import Session, select
-from models import DMTRecord, User
+from models import (
+    DMTRecord, User, PartNumber, WorkCenter, Customer, Level, Area,
+    PreparedBy, InspectionItem, ProcessCode
+)
 from schemas import DMTRecordCreate, DMTRecordUpdate
 from translation_free import translate_field_to_all_languages
+from id_blocks import dmt_ids
+from tracing import traced
+from dmt_events import record_event, filter_state, update_kind, notify_committed
 
 # Definición de campos permitidos por rol
 # NOTE: Text fields are provided in a single language and auto-translated
@@ -51,29 +57,60 @@ ALLOWED_FIELDS_BY_ROLE = {
 }
 
 
-def create_dmt(session: Session, dmt_data: DMTRecordCreate, created_by_id: int, language: str = 'en') -> DMTRecord:
+# Text fields that are translated to all languages on update
+TEXT_FIELDS = {
+    'defect_description': ['defect_description_en', 'defect_description_es', 'defect_description_zh'],
+    'process_description': ['process_description_en', 'process_description_es', 'process_description_zh'],
+    'analysis': ['analysis_en', 'analysis_es', 'analysis_zh'],
+    'repair_process': ['repair_process_en', 'repair_process_es', 'repair_process_zh'],
+    'engineering_remarks': ['engineering_remarks_en', 'engineering_remarks_es', 'engineering_remarks_zh']
+}
+
+# Catálogos referenciados por DMTRecordCreate (validados en POST /dmt/bulk)
+CREATE_REFERENCE_FIELDS = {
+    'part_number_id': PartNumber,
+    'work_center_id': WorkCenter,
+    'customer_id': Customer,
+    'level_id': Level,
+    'area_id': Area,
+    'prepared_by_id': PreparedBy,
+    'inspection_item_id': InspectionItem,
+    'process_code_id': ProcessCode,
+}
+
+# report_number = REPORT_NUMBER_OFFSET + id (ids reservados en id_blocks.py)
+REPORT_NUMBER_OFFSET = 1000
+
+
+def report_number_for(dmt_id: int) -> str:
     """
-    Crear nuevo DMT Record con traducción automática
-    Solo Inspector puede crear
+    Report number por defecto de un DMT Record
+    """
+    return str(REPORT_NUMBER_OFFSET + dmt_id)
 
-    Args:
-        session: Database session
-        dmt_data: DMT record data from request
-        created_by_id: ID of user creating the record
-        language: Language of input text ('en', 'es', 'zh'). Default: 'en'
 
-    Returns:
-        Created DMT record with all text fields translated to all languages
+def dmt_record_row(db_dmt: DMTRecord) -> Dict[str, Any]:
     """
-    # Translate defect_description to all languages
-    defect_translations = translate_field_to_all_languages(
-        dmt_data.defect_description, language
-    ) if dmt_data.defect_description else {'en': '', 'es': '', 'zh': ''}
+    Valores de columnas de un DMTRecord (para INSERT con executemany)
+    """
+    return {column.name: getattr(db_dmt, column.name) for column in DMTRecord.__table__.columns}
 
-    # Generate report number if not provided (1000 + auto-increment)
-    report_number = dmt_data.report_number if dmt_data.report_number else None
 
-    db_dmt = DMTRecord(
+def build_dmt_record(
+    dmt_data: DMTRecordCreate,
+    created_by_id: int,
+    defect_translations: Dict[str, str],
+    dmt_id: int
+) -> DMTRecord:
+    """
+    Construir la instancia DMTRecord (sin guardar) a partir del payload, las
+    traducciones ya resueltas de defect_description y el id reservado
+    """
+    # Generate report number if not provided (1000 + id)
+    report_number = dmt_data.report_number if dmt_data.report_number else report_number_for(dmt_id)
+
+    return DMTRecord(
+        id=dmt_id,
         created_by_id=created_by_id,
         part_number_id=dmt_data.part_number_id,
         work_center_id=dmt_data.work_center_id,
@@ -93,20 +130,37 @@ def create_dmt(session: Session, dmt_data: DMTRecordCreate, created_by_id: int,
         report_number=report_number,
         is_closed=False
     )
-    session.add(db_dmt)
-    session.commit()
-    session.refresh(db_dmt)
 
-    # Auto-generate report number after creation if not provided
-    if not report_number:
-        db_dmt.report_number = str(1000 + db_dmt.id)
-        session.add(db_dmt)
-        session.commit()
-        session.refresh(db_dmt)
 
+@traced()
+def create_dmt(session: Session, dmt_data: DMTRecordCreate, created_by_id: int, language: str = 'en') -> DMTRecord:
+    """
+    Crear nuevo DMT Record con traducción automática
+    Solo Inspector puede crear
+
+    Args:
+        session: Database session
+        dmt_data: DMT record data from request
+        created_by_id: ID of user creating the record
+        language: Language of input text ('en', 'es', 'zh'). Default: 'en'
+
+    Returns:
+        Created DMT record with all text fields translated to all languages
+    """
+    # Translate defect_description to all languages
+    defect_translations = translate_field_to_all_languages(
+        dmt_data.defect_description, language
+    ) if dmt_data.defect_description else {'en': '', 'es': '', 'zh': ''}
+
+    db_dmt = build_dmt_record(dmt_data, created_by_id, defect_translations, dmt_ids.allocate_sync()[0])
+    session.add(db_dmt)
+    record_event(session, "created", db_dmt)
+    session.commit()
+    notify_committed()
     return db_dmt
 
 
+@traced()
 def get_dmt_by_id(session: Session, dmt_id: int) -> Optional[DMTRecord]:
     """
     Obtener DMT Record por ID
@@ -114,22 +168,27 @@ def get_dmt_by_id(session: Session, dmt_id: int) -> Optional[DMTRecord]:
     return session.get(DMTRecord, dmt_id)
 
 
-def list_dmt(
-    session: Session,
-    skip: int = 0,
-    limit: int = 100,
+@traced()
+def get_dmt_version(session: Session, dmt_id: int) -> Optional[Tuple[int, Optional[datetime]]]:
+    """
+    Obtener solo (id, updated_at) de un DMT Record, para validar ETags
+    sin cargar la fila completa
+    """
+    statement = select(DMTRecord.id, DMTRecord.updated_at).where(DMTRecord.id == dmt_id)
+    return session.exec(statement).first()
+
+
+def apply_dmt_filters(
+    statement,
     is_closed: Optional[bool] = None,
     created_by_id: Optional[int] = None,
     part_number_id: Optional[int] = None,
     created_after: Optional[datetime] = None,
     created_before: Optional[datetime] = None
-) -> List[DMTRecord]:
+):
     """
-    Listar DMT Records con filtros opcionales
+    Aplicar los filtros de listado a un statement sobre DMTRecord
     """
-    statement = select(DMTRecord)
-
-    # Aplicar filtros
     if is_closed is not None:
         statement = statement.where(DMTRecord.is_closed == is_closed)
     if created_by_id is not None:
@@ -140,40 +199,68 @@ def list_dmt(
         statement = statement.where(DMTRecord.created_at >= created_after)
     if created_before is not None:
         statement = statement.where(DMTRecord.created_at <= created_before)
+    return statement
 
-    statement = statement.offset(skip).limit(limit)
+
+@traced()
+def list_dmt(
+    session: Session,
+    skip: int = 0,
+    limit: int = 100,
+    is_closed: Optional[bool] = None,
+    created_by_id: Optional[int] = None,
+    part_number_id: Optional[int] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None
+) -> List[DMTRecord]:
+    """
+    Listar DMT Records con filtros opcionales
+    """
+    statement = apply_dmt_filters(
+        select(DMTRecord), is_closed, created_by_id, part_number_id,
+        created_after, created_before
+    )
+    statement = statement.order_by(DMTRecord.id).offset(skip).limit(limit)
     results = session.exec(statement).all()
     return results
 
 
-def update_dmt_partial_with_field_control(
+@traced()
+def list_dmt_versions(
     session: Session,
-    dmt_id: int,
-    update_data: DMTRecordUpdate,
-    user_role: str,
-    language: str = 'en'
-) -> Optional[DMTRecord]:
+    skip: int = 0,
+    limit: int = 100,
+    is_closed: Optional[bool] = None,
+    created_by_id: Optional[int] = None,
+    part_number_id: Optional[int] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None
+) -> List[Tuple[int, Optional[datetime]]]:
     """
-    Actualizar DMT Record con control de campos por rol y traducción automática
+    Igual que list_dmt pero solo retorna (id, updated_at) de cada fila
+    Usado para validar el ETag del listado sin cargar los textos
+    """
+    statement = apply_dmt_filters(
+        select(DMTRecord.id, DMTRecord.updated_at), is_closed, created_by_id,
+        part_number_id, created_after, created_before
+    )
+    # Mismo orden que list_dmt: ambos deben ver las mismas filas
+    statement = statement.order_by(DMTRecord.id).offset(skip).limit(limit)
+    return session.exec(statement).all()
 
-    Args:
-        session: Sesión de base de datos
-        dmt_id: ID del DMT Record
-        update_data: Datos a actualizar
-        user_role: Rol del usuario que hace la actualización
-        language: Language of input text ('en', 'es', 'zh'). Default: 'en'
+
+@traced()
+def validate_dmt_update(db_dmt: DMTRecord, update_data: DMTRecordUpdate, user_role: str) -> Dict[str, Any]:
+    """
+    Validar una actualización según el rol y el estado del record
 
     Returns:
-        DMTRecord actualizado o None si no existe
+        Diccionario con los campos enviados (exclude_unset)
 
     Raises:
-        ValueError: Si el usuario intenta editar campos no permitidos para su rol
+        ValueError: Si el record está cerrado, el rol no puede editar un campo
+                    o faltan campos requeridos para cerrar
     """
-    # Obtener el record
-    db_dmt = session.get(DMTRecord, dmt_id)
-    if not db_dmt:
-        return None
-
     # Si está cerrado, no se puede editar
     if db_dmt.is_closed:
         raise ValueError("Cannot edit closed DMT Record")
@@ -210,32 +297,73 @@ def update_dmt_partial_with_field_control(
                     f"Quality Engineer must provide '{field}' to close the record."
                 )
 
-    # Handle text field translation
-    # Define text fields that need translation
-    text_fields = {
-        'defect_description': ['defect_description_en', 'defect_description_es', 'defect_description_zh'],
-        'process_description': ['process_description_en', 'process_description_es', 'process_description_zh'],
-        'analysis': ['analysis_en', 'analysis_es', 'analysis_zh'],
-        'repair_process': ['repair_process_en', 'repair_process_es', 'repair_process_zh'],
-        'engineering_remarks': ['engineering_remarks_en', 'engineering_remarks_es', 'engineering_remarks_zh']
-    }
+    return update_dict
+
+
+def apply_dmt_update(db_dmt: DMTRecord, update_dict: Dict[str, Any], translations: Dict[str, Dict[str, str]]):
+    """
+    Aplicar los campos validados al record
 
-    # Aplicar las actualizaciones
+    Args:
+        translations: {field_name: {'en', 'es', 'zh'}} para los campos de texto
+    """
     for field_name, value in update_dict.items():
         # Check if this is a text field that needs translation
-        if field_name in text_fields and value:
-            # Translate to all languages
-            translations = translate_field_to_all_languages(value, language)
-
+        if field_name in translations:
             # Set all language versions
-            setattr(db_dmt, f'{field_name}_en', translations['en'])
-            setattr(db_dmt, f'{field_name}_es', translations['es'])
-            setattr(db_dmt, f'{field_name}_zh', translations['zh'])
+            setattr(db_dmt, f'{field_name}_en', translations[field_name]['en'])
+            setattr(db_dmt, f'{field_name}_es', translations[field_name]['es'])
+            setattr(db_dmt, f'{field_name}_zh', translations[field_name]['zh'])
         else:
             # Non-text fields or numeric fields - set directly
             setattr(db_dmt, field_name, value)
 
+    db_dmt.updated_at = datetime.utcnow()
+
+
+@traced()
+def update_dmt_partial_with_field_control(
+    session: Session,
+    dmt_id: int,
+    update_data: DMTRecordUpdate,
+    user_role: str,
+    language: str = 'en'
+) -> Optional[DMTRecord]:
+    """
+    Actualizar DMT Record con control de campos por rol y traducción automática
+
+    Args:
+        session: Sesión de base de datos
+        dmt_id: ID del DMT Record
+        update_data: Datos a actualizar
+        user_role: Rol del usuario que hace la actualización
+        language: Language of input text ('en', 'es', 'zh'). Default: 'en'
+
+    Returns:
+        DMTRecord actualizado o None si no existe
+
+    Raises:
+        ValueError: Si el usuario intenta editar campos no permitidos para su rol
+    """
+    # Obtener el record
+    db_dmt = session.get(DMTRecord, dmt_id)
+    if not db_dmt:
+        return None
+
+    update_dict = validate_dmt_update(db_dmt, update_data, user_role)
+
+    # Traducir los campos de texto a todos los idiomas
+    translations = {
+        field_name: translate_field_to_all_languages(value, language)
+        for field_name, value in update_dict.items()
+        if field_name in TEXT_FIELDS and value
+    }
+
+    previous = filter_state(db_dmt)
+    apply_dmt_update(db_dmt, update_dict, translations)
     session.add(db_dmt)
+    record_event(session, update_kind(previous, db_dmt), db_dmt, previous)
     session.commit()
+    notify_committed()
     session.refresh(db_dmt)
     return db_dmt
\ No newline at end of file
@@ -0,0 +1,248 @@
+"""
+Async variants of crud_dmt for the API routers (AsyncSession)
+
+Validation rules, field permissions and record construction are shared
+with crud_dmt. Translation calls are blocking HTTP requests, so they run
+in the threadpool instead of on the event loop.
+"""
+import os
+from typing import Optional, List, Dict, Tuple
+from datetime import datetime
+from sqlalchemy.orm import selectinload
+from sqlalchemy import insert
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from models import DMTRecord, User
+from schemas import DMTRecordCreate, DMTRecordUpdate
+from translation_free import translate_field_to_all_languages, translate_texts_to_all_languages
+from database import release_connection
+from id_blocks import dmt_ids
+from tracing import traced
+from dmt_events import record_event, record_events, filter_state, update_kind, notify_committed
+from crud.crud_dmt import (
+    TEXT_FIELDS, CREATE_REFERENCE_FIELDS, build_dmt_record, dmt_record_row,
+    validate_dmt_update, apply_dmt_update, apply_dmt_filters
+)
+
+# Máximo de records por request en POST /dmt/bulk
+DMT_BULK_MAX_ITEMS = int(os.getenv("DMT_BULK_MAX_ITEMS", "1000"))
+
+# Relaciones usadas por el export CSV (se cargan en bloque, sin N+1)
+EXPORT_RELATIONSHIPS = (
+    DMTRecord.part_number, DMTRecord.work_center, DMTRecord.customer, DMTRecord.level,
+    DMTRecord.area, DMTRecord.prepared_by, DMTRecord.inspection_item, DMTRecord.process_code,
+    DMTRecord.final_disposition, DMTRecord.failure_code,
+)
+
+
+@traced()
+async def create_dmt(session: AsyncSession, dmt_data: DMTRecordCreate, created_by_id: int, language: str = 'en') -> DMTRecord:
+    """
+    Crear nuevo DMT Record con traducción automática (async)
+    Ver crud_dmt.create_dmt
+    """
+    defect_translations = await run_in_threadpool(
+        translate_field_to_all_languages, dmt_data.defect_description, language
+    ) if dmt_data.defect_description else {'en': '', 'es': '', 'zh': ''}
+
+    # Id reservado antes del INSERT: report_number va en la misma sentencia
+    # (un INSERT y un commit, sin refresh)
+    await release_connection(session)
+    dmt_id = (await dmt_ids.allocate())[0]
+    db_dmt = build_dmt_record(dmt_data, created_by_id, defect_translations, dmt_id)
+    session.add(db_dmt)
+    record_event(session, "created", db_dmt)
+    await session.commit()
+    notify_committed()
+    return db_dmt
+
+
+@traced()
+async def find_missing_references(session: AsyncSession, items: List[DMTRecordCreate]) -> Dict[int, List[str]]:
+    """
+    Referencias a catálogos que no existen, por posición del item
+    Una consulta por catálogo para todo el lote
+    """
+    errors: Dict[int, List[str]] = {}
+    for field_name, model in CREATE_REFERENCE_FIELDS.items():
+        referenced = {getattr(item, field_name) for item in items} - {None}
+        if not referenced:
+            continue
+        existing = set((await session.exec(select(model.id).where(model.id.in_(referenced)))).all())
+        for position, item in enumerate(items):
+            value = getattr(item, field_name)
+            if value is not None and value not in existing:
+                errors.setdefault(position, []).append(f"{field_name}: {model.__name__} {value} not found")
+    return errors
+
+
+@traced()
+async def create_dmt_bulk(
+    session: AsyncSession,
+    items: List[DMTRecordCreate],
+    created_by_id: int,
+    language: str = 'en'
+) -> List[DMTRecord]:
+    """
+    Crear varios DMT Records en una sola transacción
+
+    Descriptions are translated together (identical texts once, batched
+    requests), ids come from one block reservation and the rows are
+    written with a single executemany INSERT and one commit.
+    """
+    if not items:
+        return []
+
+    await release_connection(session)
+    translations = await run_in_threadpool(
+        translate_texts_to_all_languages, [item.defect_description for item in items], language
+    )
+    dmt_ids_block = await dmt_ids.allocate(len(items))
+
+    records = [
+        build_dmt_record(item, created_by_id, translations[item.defect_description], dmt_id)
+        for item, dmt_id in zip(items, dmt_ids_block)
+    ]
+    await session.execute(insert(DMTRecord), [dmt_record_row(record) for record in records])
+    record_events(session, "created", records)
+    await session.commit()
+    notify_committed()
+    return records
+
+
+@traced()
+async def get_dmt_by_id(session: AsyncSession, dmt_id: int) -> Optional[DMTRecord]:
+    """
+    Obtener DMT Record por ID (async)
+    """
+    return await session.get(DMTRecord, dmt_id)
+
+
+@traced()
+async def get_dmt_version(session: AsyncSession, dmt_id: int) -> Optional[Tuple[int, Optional[datetime]]]:
+    """
+    Obtener solo (id, updated_at) de un DMT Record (async)
+    """
+    statement = select(DMTRecord.id, DMTRecord.updated_at).where(DMTRecord.id == dmt_id)
+    return (await session.exec(statement)).first()
+
+
+@traced()
+async def list_dmt(
+    session: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    is_closed: Optional[bool] = None,
+    created_by_id: Optional[int] = None,
+    part_number_id: Optional[int] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    with_relationships: bool = False
+) -> List[DMTRecord]:
+    """
+    Listar DMT Records con filtros opcionales (async)
+
+    with_relationships=True carga los catálogos relacionados en bloque
+    (necesario en async: no hay lazy-load implícito)
+    """
+    statement = apply_dmt_filters(
+        select(DMTRecord), is_closed, created_by_id, part_number_id,
+        created_after, created_before
+    )
+    if with_relationships:
+        statement = statement.options(*(selectinload(rel) for rel in EXPORT_RELATIONSHIPS))
+    statement = statement.order_by(DMTRecord.id).offset(skip).limit(limit)
+    return (await session.exec(statement)).all()
+
+
+@traced()
+async def list_dmt_versions(
+    session: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    is_closed: Optional[bool] = None,
+    created_by_id: Optional[int] = None,
+    part_number_id: Optional[int] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None
+) -> List[Tuple[int, Optional[datetime]]]:
+    """
+    Igual que list_dmt pero solo retorna (id, updated_at) de cada fila (async)
+    """
+    statement = apply_dmt_filters(
+        select(DMTRecord.id, DMTRecord.updated_at), is_closed, created_by_id,
+        part_number_id, created_after, created_before
+    )
+    statement = statement.order_by(DMTRecord.id).offset(skip).limit(limit)
+    return (await session.exec(statement)).all()
+
+
+@traced()
+async def get_users_by_ids(session: AsyncSession, user_ids) -> Dict[int, User]:
+    """
+    Cargar varios usuarios en una sola consulta {id: User}
+    """
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return {}
+    users = (await session.exec(select(User).where(User.id.in_(user_ids)))).all()
+    return {user.id: user for user in users}
+
+
+@traced()
+async def update_dmt_partial_with_field_control(
+    session: AsyncSession,
+    dmt_id: int,
+    update_data: DMTRecordUpdate,
+    user_role: str,
+    language: str = 'en'
+) -> Optional[DMTRecord]:
+    """
+    Actualizar DMT Record con control de campos por rol y traducción automática (async)
+    Ver crud_dmt.update_dmt_partial_with_field_control
+
+    Raises:
+        ValueError: Si el usuario intenta editar campos no permitidos para su rol
+    """
+    db_dmt = await session.get(DMTRecord, dmt_id)
+    if not db_dmt:
+        return None
+
+    update_dict = validate_dmt_update(db_dmt, update_data, user_role)
+    if any(field_name in TEXT_FIELDS and value for field_name, value in update_dict.items()):
+        await release_connection(session)
+
+    # Traducir los campos de texto a todos los idiomas (fuera del event loop)
+    translations = {}
+    for field_name, value in update_dict.items():
+        if field_name in TEXT_FIELDS and value:
+            translations[field_name] = await run_in_threadpool(
+                translate_field_to_all_languages, value, language
+            )
+
+    previous = filter_state(db_dmt)
+    apply_dmt_update(db_dmt, update_dict, translations)
+    session.add(db_dmt)
+    record_event(session, update_kind(previous, db_dmt), db_dmt, previous)
+    await session.commit()
+    notify_committed()
+    await session.refresh(db_dmt)
+    return db_dmt
+
+
+@traced()
+async def delete_dmt(session: AsyncSession, dmt_id: int) -> Optional[DMTRecord]:
+    """
+    Eliminar un DMT Record (async)
+    Retorna el record eliminado o None si no existe
+    """
+    db_dmt = await session.get(DMTRecord, dmt_id)
+    if not db_dmt:
+        return None
+
+    await session.delete(db_dmt)
+    record_event(session, "deleted", db_dmt)
+    await session.commit()
+    notify_committed()
+    return db_dmt
@@ -1,10 +1,15 @@
-from typing import Optional, List, Type
+import gzip
+from typing import Optional, List, Type, Tuple
 from sqlmodel import Session, select
 from models import (
-    PartNumber, WorkCenter, Customer, Level, Area,
+    User, PartNumber, WorkCenter, Customer, Level, Area,
     Calibration, InspectionItem, PreparedBy, ProcessCode, Disposition, FailureCode
 )
 from schemas import EntityCreate
+from cache import catalog_cache, BUNDLE_KEY
+from responses import dumps
+from invalidation import cache_bus
+from catalog_snapshot import catalog_snapshot
 
 # Mapeo de nombres de entities a modelos
 ENTITY_MODELS = {
@@ -21,6 +26,33 @@ ENTITY_MODELS = {
     "failurecode": FailureCode,
 }
 
+# Lista reducida de usuarios incluida en el bundle
+BUNDLE_USERS_STATEMENT = select(User.id, User.username, User.full_name, User.role).order_by(User.id)
+
+
+def catalog_key(entity_name: str) -> str:
+    """
+    Nombre del catálogo en el cache
+    """
+    return entity_name.lower()
+
+
+def invalidate_catalog(entity_name: str):
+    """
+    Descartar el catálogo y el bundle del cache (llamar después del commit)
+    y avisar a los demás workers
+    """
+    catalog_cache.invalidate(catalog_key(entity_name))
+    catalog_cache.invalidate(BUNDLE_KEY)
+    cache_bus.publish(catalog_key(entity_name), BUNDLE_KEY)
+
+
+def catalog_version(entity_name: str) -> int:
+    """
+    Versión actual del catálogo (cambia con cada create/update/delete)
+    """
+    return catalog_cache.version(catalog_key(entity_name))
+
 
 def get_entity_model(entity_name: str) -> Optional[Type]:
     """
@@ -43,6 +75,7 @@ def create_entity(session: Session, entity_name: str, entity_data: EntityCreate)
     )
     session.add(db_entity)
     session.commit()
+    invalidate_catalog(entity_name)
     session.refresh(db_entity)
     return db_entity
 
@@ -71,6 +104,117 @@ def list_entities(session: Session, entity_name: str, skip: int = 0, limit: int
     return results
 
 
+def entity_rows_to_dicts(rows) -> List[dict]:
+    """
+    Filas (id, item_number, item_name) -> forma de EntityRead
+    """
+    return [{"id": row[0], "item_number": row[1], "item_name": row[2]} for row in rows]
+
+
+def catalog_page_statement(model, skip: int, limit: int):
+    """
+    Consulta de una página de catálogo (solo las columnas de EntityRead)
+    """
+    return (
+        select(model.id, model.item_number, model.item_name)
+        .order_by(model.id)
+        .offset(skip)
+        .limit(limit)
+    )
+
+
+def list_entities_json(session: Session, entity_name: str, skip: int = 0, limit: int = 100) -> bytes:
+    """
+    Listar registros del catálogo como JSON ya serializado (servido desde cache)
+
+    Misma forma que List[EntityRead]. Se arma desde el snapshot compartido
+    (catalog_snapshot) si está al día; si no, solo consulta la base de datos
+    cuando la página no está en cache o el catálogo cambió desde la última lectura.
+    """
+    model = get_entity_model(entity_name)
+    if not model:
+        raise ValueError(f"Entity '{entity_name}' not found")
+
+    name = catalog_key(entity_name)
+    payload = catalog_snapshot.page_json(name, skip, limit)
+    if payload is not None:
+        return payload
+
+    key = (skip, limit)
+    payload = catalog_cache.get(name, key)
+    if payload is not None:
+        return payload
+
+    version = catalog_cache.version(name)
+    rows = session.exec(catalog_page_statement(model, skip, limit)).all()
+    payload = dumps(entity_rows_to_dicts(rows))
+    catalog_cache.put(name, version, key, payload)
+    return payload
+
+
+def get_catalog_bundle(session: Session) -> Tuple[int, bytes, bytes]:
+    """
+    Todos los catálogos de ENTITY_MODELS más la lista reducida de usuarios
+    en una sola respuesta, para el arranque del formulario DMT
+
+    Retorna (versión, JSON, JSON comprimido con gzip). La versión combinada
+    cambia cada vez que cambia cualquier catálogo o usuario.
+    """
+    cached = get_cached_catalog_bundle()
+    if cached is not None:
+        return cached
+
+    version = catalog_cache.version(BUNDLE_KEY)
+    catalogs = {
+        name: session.exec(
+            select(model.id, model.item_number, model.item_name).order_by(model.id)
+        ).all()
+        for name, model in ENTITY_MODELS.items()
+    }
+    users = session.exec(BUNDLE_USERS_STATEMENT).all()
+    return store_catalog_bundle(version, catalogs, users)
+
+
+def get_cached_catalog_bundle() -> Optional[Tuple[int, bytes, bytes]]:
+    """
+    Bundle desde el snapshot compartido o el cache, o None si hay que reconstruirlo
+    """
+    shared = catalog_snapshot.bundle()
+    if shared is not None:
+        return shared
+
+    payload = catalog_cache.get(BUNDLE_KEY, "json")
+    compressed = catalog_cache.get(BUNDLE_KEY, "gzip")
+    if payload is not None and compressed is not None:
+        return catalog_cache.version(BUNDLE_KEY), payload, compressed
+    return None
+
+
+def serialize_catalog_bundle(version: int, catalogs: dict, users) -> Tuple[bytes, bytes]:
+    """
+    Bundle como JSON y JSON comprimido con gzip (también para catalog_snapshot)
+    """
+    payload = dumps({
+        "version": version,
+        "catalogs": {name: entity_rows_to_dicts(rows) for name, rows in catalogs.items()},
+        "users": [
+            {"id": row[0], "username": row[1], "full_name": row[2], "role": row[3]}
+            for row in users
+        ],
+    })
+    return payload, gzip.compress(payload, compresslevel=6)
+
+
+def store_catalog_bundle(version: int, catalogs: dict, users) -> Tuple[int, bytes, bytes]:
+    """
+    Serializar, comprimir y guardar el bundle construido desde la versión dada
+    """
+    payload, compressed = serialize_catalog_bundle(version, catalogs, users)
+    catalog_cache.put(BUNDLE_KEY, version, "json", payload)
+    catalog_cache.put(BUNDLE_KEY, version, "gzip", compressed)
+    return version, payload, compressed
+
+
 def update_entity(session: Session, entity_name: str, entity_id: int, entity_data: EntityCreate):
     """
     Actualizar un registro del catálogo
@@ -88,6 +232,7 @@ def update_entity(session: Session, entity_name: str, entity_id: int, entity_dat
 
     session.add(db_entity)
     session.commit()
+    invalidate_catalog(entity_name)
     session.refresh(db_entity)
     return db_entity
 
@@ -106,4 +251,5 @@ def delete_entity(session: Session, entity_name: str, entity_id: int) -> bool:
 
     session.delete(db_entity)
     session.commit()
+    invalidate_catalog(entity_name)
     return True
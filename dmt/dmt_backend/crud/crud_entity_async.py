@@ -0,0 +1,204 @@
+"""
+Async variants of crud_entity for the API routers (AsyncSession)
+
+Cache handling (versions, invalidation, serialized pages and bundle) is
+shared with crud_entity.
+"""
+from typing import AsyncIterator, List, Tuple
+from sqlalchemy import bindparam, insert, update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from schemas import EntityCreate
+from cache import catalog_cache, BUNDLE_KEY
+from crud.crud_entity import (
+    ENTITY_MODELS, BUNDLE_USERS_STATEMENT, get_entity_model, catalog_key, invalidate_catalog,
+    entity_rows_to_dicts, catalog_page_statement, get_cached_catalog_bundle, store_catalog_bundle
+)
+from responses import dumps
+from catalog_import import ImportReport, upsert_statement
+from catalog_snapshot import catalog_snapshot
+
+
+async def create_entity(session: AsyncSession, entity_name: str, entity_data: EntityCreate):
+    """
+    Crear un nuevo registro en el catálogo especificado (async)
+    """
+    model = get_entity_model(entity_name)
+    if not model:
+        raise ValueError(f"Entity '{entity_name}' not found")
+
+    db_entity = model(
+        item_number=entity_data.item_number,
+        item_name=entity_data.item_name
+    )
+    session.add(db_entity)
+    await session.commit()
+    invalidate_catalog(entity_name)
+    await session.refresh(db_entity)
+    return db_entity
+
+
+async def get_entity(session: AsyncSession, entity_name: str, entity_id: int):
+    """
+    Obtener un registro específico del catálogo por ID (async)
+    """
+    model = get_entity_model(entity_name)
+    if not model:
+        raise ValueError(f"Entity '{entity_name}' not found")
+
+    return await session.get(model, entity_id)
+
+
+async def list_entities(session: AsyncSession, entity_name: str, skip: int = 0, limit: int = 100) -> List:
+    """
+    Listar todos los registros del catálogo con paginación (async)
+    """
+    model = get_entity_model(entity_name)
+    if not model:
+        raise ValueError(f"Entity '{entity_name}' not found")
+
+    statement = select(model).offset(skip).limit(limit)
+    return (await session.exec(statement)).all()
+
+
+async def list_entities_json(session: AsyncSession, entity_name: str, skip: int = 0, limit: int = 100) -> bytes:
+    """
+    Listar registros del catálogo como JSON ya serializado (async)
+    Ver crud_entity.list_entities_json
+    """
+    model = get_entity_model(entity_name)
+    if not model:
+        raise ValueError(f"Entity '{entity_name}' not found")
+
+    name = catalog_key(entity_name)
+    payload = catalog_snapshot.page_json(name, skip, limit)
+    if payload is not None:
+        return payload
+
+    key = (skip, limit)
+    payload = catalog_cache.get(name, key)
+    if payload is not None:
+        return payload
+
+    version = catalog_cache.version(name)
+    rows = (await session.exec(catalog_page_statement(model, skip, limit))).all()
+    payload = dumps(entity_rows_to_dicts(rows))
+    catalog_cache.put(name, version, key, payload)
+    return payload
+
+
+async def get_catalog_bundle(session: AsyncSession) -> Tuple[int, bytes, bytes]:
+    """
+    Bundle de catálogos + usuarios (async)
+    Ver crud_entity.get_catalog_bundle
+    """
+    cached = get_cached_catalog_bundle()
+    if cached is not None:
+        return cached
+
+    version = catalog_cache.version(BUNDLE_KEY)
+    catalogs = {}
+    for name, model in ENTITY_MODELS.items():
+        statement = select(model.id, model.item_number, model.item_name).order_by(model.id)
+        catalogs[name] = (await session.exec(statement)).all()
+    users = (await session.exec(BUNDLE_USERS_STATEMENT)).all()
+    return store_catalog_bundle(version, catalogs, users)
+
+
+async def update_entity(session: AsyncSession, entity_name: str, entity_id: int, entity_data: EntityCreate):
+    """
+    Actualizar un registro del catálogo (async)
+    """
+    model = get_entity_model(entity_name)
+    if not model:
+        raise ValueError(f"Entity '{entity_name}' not found")
+
+    db_entity = await session.get(model, entity_id)
+    if not db_entity:
+        return None
+
+    db_entity.item_number = entity_data.item_number
+    db_entity.item_name = entity_data.item_name
+
+    session.add(db_entity)
+    await session.commit()
+    invalidate_catalog(entity_name)
+    await session.refresh(db_entity)
+    return db_entity
+
+
+async def delete_entity(session: AsyncSession, entity_name: str, entity_id: int) -> bool:
+    """
+    Eliminar un registro del catálogo (async)
+    """
+    model = get_entity_model(entity_name)
+    if not model:
+        raise ValueError(f"Entity '{entity_name}' not found")
+
+    db_entity = await session.get(model, entity_id)
+    if not db_entity:
+        return False
+
+    await session.delete(db_entity)
+    await session.commit()
+    invalidate_catalog(entity_name)
+    return True
+
+
+async def import_entities(
+    session: AsyncSession,
+    entity_name: str,
+    batches: AsyncIterator[List[dict]],
+    report: ImportReport
+) -> ImportReport:
+    """
+    Upsert por item_number de lotes de filas {item_number, item_name} (async)
+
+    Each batch is compared against the stored names with one query, so only
+    new and renamed rows are written (native ON CONFLICT / ON DUPLICATE KEY
+    upsert, executemany). Everything runs in one transaction; the catalog
+    cache is invalidated once after the commit.
+    """
+    model = get_entity_model(entity_name)
+    if not model:
+        raise ValueError(f"Entity '{entity_name}' not found")
+
+    dialect_name = session.bind.dialect.name
+    statement = upsert_statement(model, dialect_name)
+    table = model.__table__
+
+    async for batch in batches:
+        existing = dict((await session.exec(
+            select(model.item_number, model.item_name)
+            .where(model.item_number.in_([row["item_number"] for row in batch]))
+        )).all())
+
+        new_rows = [row for row in batch if row["item_number"] not in existing]
+        changed_rows = [
+            row for row in batch
+            if row["item_number"] in existing and existing[row["item_number"]] != row["item_name"]
+        ]
+        report.inserted += len(new_rows)
+        report.updated += len(changed_rows)
+        report.unchanged += len(batch) - len(new_rows) - len(changed_rows)
+
+        if statement is not None:
+            if new_rows or changed_rows:
+                await session.execute(statement, new_rows + changed_rows)
+            continue
+
+        # Dialecto sin upsert nativo: UPDATE e INSERT separados (executemany)
+        if changed_rows:
+            await session.execute(
+                update(table)
+                .where(table.c.item_number == bindparam("match_item_number"))
+                .values(item_name=bindparam("new_item_name")),
+                [{"match_item_number": row["item_number"], "new_item_name": row["item_name"]} for row in changed_rows]
+            )
+        if new_rows:
+            await session.execute(insert(table), new_rows)
+
+    await session.commit()
+    if report.inserted or report.updated:
+        invalidate_catalog(entity_name)
+    return report
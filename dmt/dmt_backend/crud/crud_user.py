@@ -1,8 +1,22 @@
-from typing import Optional, List
+from typing import Dict, Optional, List, Tuple
+from sqlalchemy import insert
 from sqlmodel import Session, select
 from models import User
 from schemas import UserCreate, UserUpdate
 from auth import get_password_hash, verify_password
+from cache import catalog_cache, USERS_KEY, BUNDLE_KEY
+from invalidation import cache_bus
+from user_import import conflicts_statement, find_conflicts, hash_passwords, user_rows
+
+
+def invalidate_users():
+    """
+    Descartar la lista de usuarios y el bundle del cache (llamar después del commit)
+    y avisar a los demás workers
+    """
+    catalog_cache.invalidate(USERS_KEY)
+    catalog_cache.invalidate(BUNDLE_KEY)
+    cache_bus.publish(USERS_KEY, BUNDLE_KEY)
 
 
 def create_user(session: Session, user_data: UserCreate) -> User:
@@ -19,10 +33,34 @@ def create_user(session: Session, user_data: UserCreate) -> User:
     )
     session.add(db_user)
     session.commit()
+    invalidate_users()
     session.refresh(db_user)
     return db_user
 
 
+def create_users_bulk(session: Session, users: List[UserCreate]) -> Tuple[Dict[int, User], Dict[int, List[str]]]:
+    """
+    Create several users in one transaction.
+    Returns (created users, conflict errors), both keyed by position in `users`.
+    """
+    conflicts = find_conflicts(users, session.exec(conflicts_statement(users)).all())
+    positions = [position for position in range(len(users)) if position not in conflicts]
+    if not positions:
+        return {}, conflicts
+
+    to_create = [users[position] for position in positions]
+    hashed_passwords = hash_passwords([user.password for user in to_create])
+    session.execute(insert(User), user_rows(to_create, hashed_passwords))
+    session.commit()
+    invalidate_users()
+
+    by_username = {
+        user.username: user
+        for user in session.exec(select(User).where(User.username.in_([user.username for user in to_create])))
+    }
+    return {position: by_username[users[position].username] for position in positions}, conflicts
+
+
 def get_user_by_username(session: Session, username: str) -> Optional[User]:
     """
     Get a user by username.
@@ -65,6 +103,7 @@ def update_user(session: Session, user: User, user_update: UserUpdate) -> User:
             
     session.add(user)
     session.commit()
+    invalidate_users()
     session.refresh(user)
     return user
 
@@ -75,6 +114,7 @@ def delete_user(session: Session, user: User):
     """
     session.delete(user)
     session.commit()
+    invalidate_users()
 
 
 def authenticate_user(session: Session, username: str, password: str) -> Optional[User]:
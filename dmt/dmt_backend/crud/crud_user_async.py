@@ -0,0 +1,141 @@
+"""
+Async variants of crud_user for the API routers (AsyncSession)
+
+Password hashing and verification (pbkdf2) are CPU-bound, so they run in
+the threadpool instead of on the event loop; bulk creation hashes across
+the user_import process pool.
+"""
+from typing import Dict, Optional, List, Tuple
+from sqlalchemy import insert
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from models import User
+from schemas import UserCreate, UserRead, UserUpdate
+from auth import get_password_hash, verify_password
+from crud.crud_user import invalidate_users
+from database import release_connection
+from responses import dump_models
+from user_import import conflicts_statement, find_conflicts, hash_passwords, user_rows
+
+
+async def create_user(session: AsyncSession, user_data: UserCreate) -> User:
+    """
+    Create a new user with a hashed password (async).
+    """
+    await release_connection(session)
+    hashed_password = await run_in_threadpool(get_password_hash, user_data.password)
+    db_user = User(
+        username=user_data.username,
+        email=user_data.email,
+        full_name=user_data.full_name,
+        role=user_data.role,
+        hashed_password=hashed_password
+    )
+    session.add(db_user)
+    await session.commit()
+    invalidate_users()
+    await session.refresh(db_user)
+    return db_user
+
+
+async def create_users_bulk(session: AsyncSession, users: List[UserCreate]) -> Tuple[Dict[int, User], Dict[int, List[str]]]:
+    """
+    Create several users in one transaction (async).
+    Returns (created users, conflict errors), both keyed by position in `users`.
+    """
+    conflicts = find_conflicts(users, (await session.exec(conflicts_statement(users))).all())
+    positions = [position for position in range(len(users)) if position not in conflicts]
+    if not positions:
+        return {}, conflicts
+
+    to_create = [users[position] for position in positions]
+    await release_connection(session)
+    hashed_passwords = await run_in_threadpool(hash_passwords, [user.password for user in to_create])
+    await session.execute(insert(User), user_rows(to_create, hashed_passwords))
+    await session.commit()
+    invalidate_users()
+
+    statement = select(User).where(User.username.in_([user.username for user in to_create]))
+    by_username = {user.username: user for user in (await session.exec(statement)).all()}
+    return {position: by_username[users[position].username] for position in positions}, conflicts
+
+
+async def get_user_by_username(session: AsyncSession, username: str) -> Optional[User]:
+    """
+    Get a user by username (async).
+    """
+    statement = select(User).where(User.username == username)
+    return (await session.exec(statement)).first()
+
+
+async def get_user(session: AsyncSession, user_id: int) -> Optional[User]:
+    """
+    Get a user by ID (async).
+    """
+    return await session.get(User, user_id)
+
+
+async def list_users(session: AsyncSession, skip: int = 0, limit: Optional[int] = 100, role: Optional[str] = None) -> List[User]:
+    """
+    List users with pagination, optionally filtered by role (async).
+    limit=None returns every user.
+    """
+    statement = select(User)
+    if role:
+        statement = statement.where(User.role == role)
+    statement = statement.offset(skip)
+    if limit is not None:
+        statement = statement.limit(limit)
+    return (await session.exec(statement)).all()
+
+
+async def list_users_json(session: AsyncSession, role: Optional[str] = None) -> bytes:
+    """
+    Todos los usuarios (opcionalmente por rol) como JSON de List[UserRead]
+    """
+    return dump_models(UserRead, await list_users(session, limit=None, role=role))
+
+
+async def update_user(session: AsyncSession, user: User, user_update: UserUpdate) -> User:
+    """
+    Update a user's details (async).
+    """
+    update_data = user_update.model_dump(exclude_unset=True)
+
+    if "password" in update_data and update_data["password"]:
+        await release_connection(session)
+        user.hashed_password = await run_in_threadpool(get_password_hash, update_data["password"])
+
+    # Update other fields
+    for key, value in update_data.items():
+        if key != "password":
+            setattr(user, key, value)
+
+    session.add(user)
+    await session.commit()
+    invalidate_users()
+    await session.refresh(user)
+    return user
+
+
+async def delete_user(session: AsyncSession, user: User):
+    """
+    Delete a user (async).
+    """
+    await session.delete(user)
+    await session.commit()
+    invalidate_users()
+
+
+async def authenticate_user(session: AsyncSession, username: str, password: str) -> Optional[User]:
+    """
+    Authenticate a user by verifying username and password (async).
+    Returns the User if credentials are valid, otherwise None.
+    """
+    user = await get_user_by_username(session, username)
+    if not user:
+        return None
+    if not await run_in_threadpool(verify_password, password, user.hashed_password):
+        return None
+    return user
@@ -1,5 +1,16 @@
+import hashlib
 import os
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, delete, event, insert, inspect, select
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlmodel import SQLModel, create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from fastapi import Request
+from sql_monitor import install_sql_monitor
+from tracing import install_tracing
+from coalesce import install_coalescing
+from replicas import DATABASE_REPLICA_URLS, Replica, ReplicaRouter, read_your_writes_token
 
 # Database configuration - Database agnostic with SQLite as default
 #
@@ -17,6 +28,14 @@ DATABASE_URL = os.getenv(
     "sqlite:///./dmt.db"  # SQLite default - file-based, no server needed
 )
 
+# SQL logging: echo prints every statement synchronously, so it is only for
+# local debugging (SQL_ECHO=1). Timing, slow queries and per-request counts
+# come from sql_monitor.py.
+SQL_ECHO = os.getenv("SQL_ECHO", "0") == "1"
+install_sql_monitor()
+install_tracing()
+install_coalescing()
+
 # Detect database type from URL
 db_type = DATABASE_URL.split(':')[0].split('+')[0]
 
@@ -25,28 +44,385 @@ if db_type == 'sqlite':
     # SQLite-specific configuration
     engine = create_engine(
         DATABASE_URL,
-        echo=True,  # Set to False in production
+        echo=SQL_ECHO,
         connect_args={"check_same_thread": False}  # Required for SQLite with FastAPI
     )
 else:
     # MySQL, PostgreSQL, Oracle configuration
     engine = create_engine(
         DATABASE_URL,
-        echo=True,  # Set to False in production
+        echo=SQL_ECHO,
         pool_pre_ping=True,
         pool_recycle=3600
     )
 
-def init_db():
+# SQLite production profile
+#
+# SQLITE_PROFILE=production (default) applies on every connection:
+# - journal_mode=WAL: readers no longer block on the writer (and vice versa)
+# - synchronous=NORMAL: safe with WAL, one fsync per checkpoint instead of per commit
+# - busy_timeout: wait for the write lock instead of failing with "database is locked"
+# - mmap_size / cache_size: keep hot pages in memory
+# and routes API writes through a single-connection writer engine (see below).
+# SQLITE_PROFILE=basic keeps SQLite defaults.
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "production")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", str(64 * 1024)))
+SQLITE_WRITE_TIMEOUT = int(os.getenv("SQLITE_WRITE_TIMEOUT", "60"))
+
+sqlite_production = db_type == 'sqlite' and SQLITE_PROFILE == "production"
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record=None):
+    """
+    Aplicar los PRAGMA del perfil de producción a una conexión SQLite nueva
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+if sqlite_production:
+    event.listen(engine, "connect", apply_sqlite_pragmas)
+
+# Async engine used by the API routers
+#
+# The async driver is derived from DATABASE_URL:
+# - SQLite: sqlite+aiosqlite:///./dmt.db        (pip install aiosqlite)
+# - PostgreSQL: postgresql+asyncpg://...         (pip install asyncpg)
+# - MySQL/MariaDB: mysql+asyncmy://...           (pip install asyncmy)
+# - Oracle: oracle+oracledb_async://...          (pip install oracledb)
+#
+# Set ASYNC_DATABASE_URL to override it. Concurrent database work in the API
+# is bounded by this pool (DB_POOL_SIZE + DB_MAX_OVERFLOW connections,
+# waiting up to DB_POOL_TIMEOUT seconds), not by the threadpool.
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+asyncmy",
+    "mariadb": "mysql+asyncmy",
+    "oracle": "oracle+oracledb_async",
+}
+
+
+def to_async_url(url: str) -> str:
+    """
+    Convertir un DATABASE_URL síncrono a su equivalente con driver async
+    """
+    scheme, rest = url.split(":", 1)
+    base = scheme.split("+")[0]
+    if base not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for database type '{base}'")
+    return f"{ASYNC_DRIVERS[base]}:{rest}"
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(DATABASE_URL)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+if db_type == 'sqlite':
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        echo=SQL_ECHO,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT
+    )
+else:
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        echo=SQL_ECHO,
+        pool_pre_ping=True,
+        pool_recycle=3600,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT
+    )
+
+# Single writer for SQLite
+#
+# SQLite allows one writer at a time. With the production profile, API
+# writes go through a dedicated engine whose pool holds exactly one
+# connection, so write transactions queue in the pool (FIFO, up to
+# SQLITE_WRITE_TIMEOUT seconds) instead of racing for the file lock, while
+# reads use the regular pool and scale across connections. Write
+# transactions start with BEGIN IMMEDIATE so the lock is taken up front and
+# a transaction never fails upgrading from read to write.
+# Other databases use the same engine for reads and writes.
+if sqlite_production:
+    event.listen(async_engine.sync_engine, "connect", apply_sqlite_pragmas)
+
+    async_write_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        echo=SQL_ECHO,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=SQLITE_WRITE_TIMEOUT
+    )
+
+    @event.listens_for(async_write_engine.sync_engine, "connect")
+    def _connect_writer(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection)
+        # El driver no abre transacciones por su cuenta: BEGIN lo emite el evento "begin"
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(async_write_engine.sync_engine, "begin")
+    def _begin_immediate(connection):
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+else:
+    async_write_engine = async_engine
+
+# expire_on_commit=False: los objetos siguen usables después del commit
+# (en async no se permite el lazy-load implícito de atributos expirados)
+async_session_factory = async_sessionmaker(
+    async_engine, class_=AsyncSession, expire_on_commit=False
+)
+async_write_session_factory = async_sessionmaker(
+    async_write_engine, class_=AsyncSession, expire_on_commit=False
+)
+
+# Read replicas (DATABASE_REPLICA_URLS, see replicas.py)
+# get_async_session routes reads to a healthy replica; writes and
+# get_async_primary_session always use the primary.
+def create_replica(name: str, url: str) -> Replica:
+    """
+    Engine async y session factory de una réplica
+    """
+    replica_engine = create_async_engine(
+        to_async_url(url),
+        echo=SQL_ECHO,
+        pool_pre_ping=True,
+        pool_recycle=3600,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT
+    )
+    return Replica(
+        name,
+        replica_engine,
+        async_sessionmaker(replica_engine, class_=AsyncSession, expire_on_commit=False)
+    )
+
+
+replica_router = ReplicaRouter([
+    create_replica(f"replica-{index}", url)
+    for index, url in enumerate(DATABASE_REPLICA_URLS, start=1)
+])
+
+
+# Fast boot
+#
+# create_all inspects every table on each worker boot (one or more round
+# trips per table). With DB_FAST_BOOT=1 (default) init_db instead reads the
+# fingerprint of the schema it last created or verified (one query) and
+# only runs create_all when it differs from the models' fingerprint, e.g.
+# after a deploy that changes the models, or on a new database.
+# create_all only adds missing tables and never alters existing ones, so
+# after it init_db compares each table's live columns (inspector) with the
+# models: a missing column needs a migration script and stops the boot, and
+# the new fingerprint is only stored once the schema really matches.
+# Tables dropped outside the app are not noticed: use DB_FAST_BOOT=0 (or
+# delete the schema_fingerprint row) to force the full check.
+DB_FAST_BOOT = os.getenv("DB_FAST_BOOT", "1") == "1"
+
+schema_metadata = MetaData()
+schema_fingerprint_table = Table(
+    "schema_fingerprint", schema_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("fingerprint", String(64), nullable=False),
+    Column("updated_at", DateTime, nullable=False),
+)
+
+
+def schema_fingerprint() -> str:
+    """
+    sha256 de las tablas del modelo: columnas (tipo, nulos, pk), índices y FKs
+    """
+    parts = []
+    for table in sorted(SQLModel.metadata.tables.values(), key=lambda table: table.name):
+        parts.append(f"table {table.name}")
+        for column in table.columns:
+            parts.append(f"column {column.name} {column.type!r} {column.nullable} {column.primary_key}")
+        for index in sorted(table.indexes, key=lambda index: index.name or ""):
+            parts.append(f"index {index.name} {index.unique} {[column.name for column in index.columns]}")
+        for foreign_key in sorted(table.foreign_keys, key=lambda foreign_key: foreign_key.parent.name):
+            parts.append(f"fk {foreign_key.parent.name} {foreign_key.target_fullname}")
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def stored_schema_fingerprint():
     """
-    Inicializar la base de datos creando todas las tablas
-    Usar SQLModel.metadata.create_all(engine)
+    Huella guardada por el último init_db (None si no hay o la tabla no existe)
     """
+    try:
+        with engine.connect() as connection:
+            return connection.execute(
+                select(schema_fingerprint_table.c.fingerprint).where(schema_fingerprint_table.c.id == 1)
+            ).scalar()
+    except SQLAlchemyError:
+        return None
+
+
+def missing_columns() -> list:
+    """
+    Columnas de los modelos que no existen en la base ("tabla.columna")
+    """
+    inspector = inspect(engine)
+    missing = []
+    for table in sorted(SQLModel.metadata.tables.values(), key=lambda table: table.name):
+        live = {column["name"] for column in inspector.get_columns(table.name)}
+        missing += [f"{table.name}.{column.name}" for column in table.columns if column.name not in live]
+    return missing
+
+
+def store_schema_fingerprint(fingerprint: str):
+    schema_metadata.create_all(engine)
+    try:
+        with engine.begin() as connection:
+            connection.execute(delete(schema_fingerprint_table))
+            connection.execute(insert(schema_fingerprint_table).values(
+                id=1, fingerprint=fingerprint, updated_at=datetime.utcnow()
+            ))
+    except IntegrityError:
+        # Otro worker la guardó al mismo tiempo
+        pass
+
+
+def init_db() -> str:
+    """
+    Inicializar la base de datos creando las tablas que falten
+    Con DB_FAST_BOOT, si la huella guardada coincide con la del modelo se
+    omite create_all. Retorna cómo se verificó: "fingerprint" o "create_all"
+    """
+    fingerprint = schema_fingerprint()
+    if DB_FAST_BOOT and stored_schema_fingerprint() == fingerprint:
+        return "fingerprint"
     SQLModel.metadata.create_all(engine)
+    missing = missing_columns()
+    if missing:
+        # create_all no altera tablas existentes: hace falta una migración
+        raise RuntimeError(
+            "Database schema is behind the models, run the migration scripts first. "
+            f"Missing columns: {', '.join(missing)}"
+        )
+    store_schema_fingerprint(fingerprint)
+    return "create_all"
+
 
 def get_session():
     """
-    Dependency para obtener sesión de base de datos
+    Dependency para obtener sesión de base de datos (síncrona)
+    Usada por scripts y tareas fuera del event loop
     """
     with Session(engine) as session:
         yield session
+
+
+async def get_async_session(request: Request):
+    """
+    Dependency para obtener sesión async de lectura
+    Usa una réplica si hay réplicas sanas y el llamador no escribió recientemente
+    """
+    factory = replica_router.read_session_factory(read_your_writes_token(request)) or async_session_factory
+    async with factory() as session:
+        yield session
+
+
+async def get_async_primary_session():
+    """
+    Dependency de lectura que siempre usa el primario
+
+    For reads whose result is tied to the in-process version counters
+    (catalog cache, version ETags): data read from a lagging replica would
+    be cached or validated under the new version.
+    """
+    async with async_session_factory() as session:
+        yield session
+
+
+async def get_async_write_session(request: Request):
+    """
+    Dependency para endpoints que escriben (POST/PUT/PATCH/DELETE)
+    Con SQLite en perfil de producción usa el writer único
+    Cada commit abre la ventana read-your-writes (token en la respuesta)
+    """
+    async with async_write_session_factory() as session:
+        if replica_router.enabled:
+            def mark_write(_):
+                request.state.read_your_writes = replica_router.write_token()
+            event.listen(session.sync_session, "after_commit", mark_write)
+        yield session
+
+
+def read_class(session: AsyncSession) -> str:
+    """
+    "primary" o "replica" según el engine de la sesión de lectura
+    (clase de autorización de coalesce: nunca se comparten entre sí)
+    """
+    return "primary" if session.bind is async_engine else "replica"
+
+
+def shared_read_session(session: AsyncSession) -> AsyncSession:
+    """
+    Sesión propia sobre el mismo engine que `session` (primario o réplica)
+    Para consultas compartidas entre requests (coalesce): la sesión del
+    request se cierra con él, aunque otros sigan esperando el resultado
+    """
+    return AsyncSession(session.bind, expire_on_commit=False)
+
+
+async def release_connection(session: AsyncSession):
+    """
+    Terminar la transacción de lectura en curso para devolver la conexión al
+    pool antes de trabajo lento (traducción, hash de password)
+
+    With the single SQLite writer this keeps the write lock free while the
+    request waits on LibreTranslate or bcrypt. Loaded objects stay usable
+    (expire_on_commit=False).
+    """
+    if session.in_transaction():
+        await session.commit()
+
+
+def pool_status() -> dict:
+    """
+    Conexiones en uso por pool: engine síncrono y pools async
+    (GET /admin/saturation, /metrics)
+    """
+    engines = {"sync": engine, "primary": async_engine}
+    if async_write_engine is not async_engine:
+        engines["writer"] = async_write_engine
+    for replica in replica_router.replicas:
+        engines[replica.name] = replica.engine
+
+    status = {}
+    for name, db_engine in engines.items():
+        pool = getattr(db_engine, "sync_engine", db_engine).pool
+        if not hasattr(pool, "checkedout"):
+            continue
+        capacity = pool.size() + max(0, getattr(pool, "_max_overflow", 0))
+        checked_out = pool.checkedout()
+        status[name] = {
+            "capacity": capacity,
+            "checked_out": checked_out,
+            "overflow": max(0, pool.overflow()),
+            "exhausted": checked_out >= capacity,
+        }
+    return status
+
+
+async def dispose_engines():
+    """
+    Cerrar los pools de conexiones async (shutdown)
+    """
+    await replica_router.stop()
+    await async_engine.dispose()
+    if async_write_engine is not async_engine:
+        await async_write_engine.dispose()
@@ -1,20 +1,19 @@
 from typing import List
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlmodel import Session
-from jose import JWTError
-from database import get_session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from database import get_async_session
 from auth import verify_token
 from models import User
-from crud.crud_user import get_user_by_username
+from crud.crud_user_async import get_user_by_username
 
 # OAuth2 scheme para extraer token del header Authorization
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
 
-def get_current_user(
+async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ) -> User:
     """
     Dependency para obtener el usuario actual desde el JWT token
@@ -34,15 +33,17 @@ def get_current_user(
             raise credentials_exception
 
         # Obtener usuario de la base de datos
-        user = get_user_by_username(session, token_data.username)
+        user = await get_user_by_username(session, token_data.username)
         if user is None:
             print(f"User not found in database: {token_data.username}")
             raise credentials_exception
 
+        # Terminar la transacción de lectura: si no, la conexión queda tomada del
+        # pool hasta el final de la request (p. ej. durante la traducción)
+        # close() hace rollback (sin commit) y deja `user` desasociado pero cargado
+        await session.close()
+
         return user
-    except JWTError as e:
-        print(f"JWTError in get_current_user: {e}")
-        raise credentials_exception
     except HTTPException:
         # Re-raise HTTP exceptions without wrapping
         raise
@@ -59,7 +60,7 @@ def role_required(allowed_roles: List[str]):
     Uso:
         @router.get("/admin-only", dependencies=[Depends(role_required(["Admin"]))])
     """
-    def role_checker(current_user: User = Depends(get_current_user)) -> User:
+    async def role_checker(current_user: User = Depends(get_current_user)) -> User:
         if current_user.role not in allowed_roles:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -0,0 +1,503 @@
+"""
+Live feed of DMT record changes (server-sent events)
+
+The dashboard feed (dmt_feed.js) used to download the whole filtered list
+from GET /dmt/ on every refresh. GET /dmt/events now keeps a stream open and
+pushes one compact event per change, so clients patch the rows they show:
+
+    event: created | updated | closed | deleted
+    id:    position in the dmt_event table (global, same in every worker)
+    data:  {"id": ..., "report_number": ..., "is_closed": ..., ...}
+
+How it works:
+
+- crud_dmt / crud_dmt_async add a dmt_event row in the same transaction as
+  the change (record_event), so an event exists if and only if the change
+  was committed, whichever worker handled it.
+- After the commit the writer publishes EVENTS_KEY on the invalidation bus
+  (invalidation.py). Every worker's bus sees the new version (at once in
+  the writer, via NOTIFY or the next poll in the others) and the hub reads
+  the new rows in the bus thread.
+- The hub keeps the last DMT_EVENTS_REPLAY events in memory and fans each
+  one out to the subscribers whose filters (same as GET /dmt/) match the
+  record before or after the change, so a record that leaves a filter
+  (e.g. closed, with is_closed=false) is removed from that view.
+- A reconnect with Last-Event-ID gets the buffered events after that id; if
+  they are no longer buffered the stream starts with a `reset` event and
+  the client reloads the list once.
+
+Concurrent transactions can commit their events out of id order, so ids
+skipped by a read are read again until they show up or GAP_TIMEOUT_S
+passes (rolled back). A subscriber that falls DMT_EVENTS_QUEUE events
+behind is disconnected (it reconnects and replays), and streams are closed
+after DMT_EVENTS_MAX_STREAM_S so the reconnect validates the token again.
+
+Configuration (environment variables):
+    DMT_EVENTS_ENABLED          1 (default) or 0
+    DMT_EVENTS_REPLAY           Events kept in memory for reconnects (default: 1000)
+    DMT_EVENTS_KEEP             Rows kept in the dmt_event table (default: 10000)
+    DMT_EVENTS_QUEUE            Pending events per subscriber (default: 256)
+    DMT_EVENTS_MAX_SUBSCRIBERS  Open streams per worker (default: 500)
+    DMT_EVENTS_HEARTBEAT_S      Keep-alive comment on idle streams (default: 15)
+    DMT_EVENTS_MAX_STREAM_S     Stream duration before a reconnect (default: 900)
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set
+from sqlalchemy import delete, func, or_, select
+from sqlalchemy.exc import SQLAlchemyError
+from database import engine
+from invalidation import cache_bus
+from metrics import Counter, GaugeCallback
+from models import DMTEvent, DMTRecord
+from responses import dumps
+
+logger = logging.getLogger(__name__)
+
+DMT_EVENTS_ENABLED = os.getenv("DMT_EVENTS_ENABLED", "1") == "1"
+DMT_EVENTS_REPLAY = int(os.getenv("DMT_EVENTS_REPLAY", "1000"))
+DMT_EVENTS_KEEP = int(os.getenv("DMT_EVENTS_KEEP", "10000"))
+DMT_EVENTS_QUEUE = int(os.getenv("DMT_EVENTS_QUEUE", "256"))
+DMT_EVENTS_MAX_SUBSCRIBERS = int(os.getenv("DMT_EVENTS_MAX_SUBSCRIBERS", "500"))
+DMT_EVENTS_HEARTBEAT_S = float(os.getenv("DMT_EVENTS_HEARTBEAT_S", "15"))
+DMT_EVENTS_MAX_STREAM_S = float(os.getenv("DMT_EVENTS_MAX_STREAM_S", "900"))
+
+# Nombre publicado en el bus de invalidación después de cada commit
+EVENTS_KEY = "dmt_events"
+
+# Campos del record en cada evento (los que muestra el feed y los filtros)
+EVENT_FIELDS = (
+    "id", "report_number", "is_closed", "created_at", "updated_at", "created_by_id",
+    "part_number_id", "work_center_id", "customer_id", "final_disposition_id", "failure_code_id",
+)
+# Campos filtrables que un update puede cambiar (se guarda su valor anterior)
+FILTER_FIELDS = ("is_closed", "created_by_id", "part_number_id")
+
+# Filas por lectura y espera máxima de un id salteado (transacción en curso)
+FETCH_BATCH = 1000
+GAP_TIMEOUT_S = 10.0
+
+# Reconexión sugerida al cliente (campo retry de SSE)
+RETRY_MS = 3000
+
+EVENTS = Counter("dmt_feed_events_total", "DMT change events read from the event table", ("kind",))
+DELIVERED = Counter("dmt_feed_delivered_total", "Events sent to feed subscribers (replay included)")
+DROPPED = Counter(
+    "dmt_feed_disconnects_total", "Streams closed by the server (reason: lagging, expired, shutdown)",
+    ("reason",)
+)
+ERRORS = Counter("dmt_feed_errors_total", "Failed feed operations", ("operation",))
+
+
+def event_record(dmt: DMTRecord) -> Dict[str, Any]:
+    """
+    Campos compactos del record (fechas en ISO 8601, como en GET /dmt/)
+    """
+    record = {}
+    for field_name in EVENT_FIELDS:
+        value = getattr(dmt, field_name)
+        record[field_name] = value.isoformat() if isinstance(value, datetime) else value
+    return record
+
+
+def filter_state(dmt: DMTRecord) -> Dict[str, Any]:
+    """
+    Valores filtrables antes de un update (pasar a record_event como `previous`)
+    """
+    return {field_name: getattr(dmt, field_name) for field_name in FILTER_FIELDS}
+
+
+def record_event(session, kind: str, dmt: DMTRecord, previous: Optional[Dict[str, Any]] = None):
+    """
+    Agregar el evento a la transacción de `session` (antes del commit)
+    """
+    record_events(session, kind, [dmt], previous)
+
+
+def record_events(session, kind: str, dmts: Iterable[DMTRecord], previous: Optional[Dict[str, Any]] = None):
+    """
+    Igual que record_event para varios records (alta masiva)
+    """
+    if not DMT_EVENTS_ENABLED:
+        return
+    for dmt in dmts:
+        payload = {"record": event_record(dmt)}
+        if previous:
+            payload["previous"] = previous
+        session.add(DMTEvent(kind=kind, record_id=dmt.id, payload=dumps(payload).decode("utf-8")))
+
+
+def update_kind(previous: Dict[str, Any], dmt: DMTRecord) -> str:
+    """
+    "closed" si el update cerró el record, si no "updated"
+    """
+    return "closed" if dmt.is_closed and not previous.get("is_closed") else "updated"
+
+
+def notify_committed():
+    """
+    Avisar a los workers que hay eventos nuevos (llamar después del commit)
+    """
+    if not DMT_EVENTS_ENABLED:
+        return
+    if cache_bus.enabled:
+        cache_bus.publish(EVENTS_KEY)
+    else:
+        # Sin bus (un solo worker): leer los eventos en el threadpool
+        dmt_feed.wake()
+
+
+def _parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # created_at se guarda en UTC sin zona horaria
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class EventFilter:
+    """
+    Filtros de un suscriptor (los mismos de GET /dmt/)
+    """
+
+    def __init__(self, is_closed: Optional[bool] = None, created_by_id: Optional[int] = None,
+                 part_number_id: Optional[int] = None, created_after: Optional[datetime] = None,
+                 created_before: Optional[datetime] = None):
+        self.is_closed = is_closed
+        self.created_by_id = created_by_id
+        self.part_number_id = part_number_id
+        self.created_after = _naive_utc(created_after)
+        self.created_before = _naive_utc(created_before)
+
+    def _matches(self, state: Dict[str, Any], created_at: Optional[datetime]) -> bool:
+        if self.is_closed is not None and state.get("is_closed") != self.is_closed:
+            return False
+        if self.created_by_id is not None and state.get("created_by_id") != self.created_by_id:
+            return False
+        if self.part_number_id is not None and state.get("part_number_id") != self.part_number_id:
+            return False
+        if self.created_after is not None and (created_at is None or created_at < self.created_after):
+            return False
+        if self.created_before is not None and (created_at is None or created_at > self.created_before):
+            return False
+        return True
+
+    def matches(self, event: "FeedEvent") -> bool:
+        """
+        True si el record cumple los filtros antes o después del cambio
+        """
+        created_at = event.created_at
+        if self._matches(event.record, created_at):
+            return True
+        return event.previous is not None and self._matches(event.previous, created_at)
+
+
+class FeedEvent:
+    """
+    Evento leído de la tabla, con el mensaje SSE ya armado
+    """
+
+    __slots__ = ("id", "kind", "record", "previous", "created_at", "message")
+
+    def __init__(self, event_id: int, kind: str, payload: str):
+        data = json.loads(payload)
+        self.id = event_id
+        self.kind = kind
+        self.record = data["record"]
+        self.previous = data.get("previous")
+        self.created_at = _parse_datetime(self.record.get("created_at"))
+        self.message = (
+            f"id: {event_id}\nevent: {kind}\ndata: ".encode("utf-8")
+            + dumps(self.record) + b"\n\n"
+        )
+
+
+class Subscriber:
+    """
+    Stream abierto: filtros y eventos pendientes de enviar
+    """
+
+    def __init__(self, event_filter: EventFilter, user_id: Optional[int] = None):
+        self.filter = event_filter
+        self.user_id = user_id
+        self.pending: Deque[FeedEvent] = deque()
+        self.wakeup = asyncio.Event()
+        self.closed: Optional[str] = None
+        # Los eventos a repetir ya no están en el buffer: el cliente recarga la lista
+        self.reset = False
+        self.connected_at = time.time()
+        self.sent = 0
+
+    def push(self, event: FeedEvent):
+        if len(self.pending) >= DMT_EVENTS_QUEUE:
+            self.close("lagging")
+            return
+        self.pending.append(event)
+        self.wakeup.set()
+
+    def close(self, reason: str):
+        if self.closed is None:
+            self.closed = reason
+            self.pending.clear()
+            self.wakeup.set()
+
+
+class DMTEventHub:
+    """
+    Lee los eventos nuevos, los guarda para reconexiones y los reparte a
+    los suscriptores de este worker
+    """
+
+    def __init__(self, replay: int = DMT_EVENTS_REPLAY):
+        self.enabled = DMT_EVENTS_ENABLED
+        self._buffer: Deque[FeedEvent] = deque(maxlen=replay)
+        self._subscribers: Set[Subscriber] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._fetch_lock = threading.Lock()
+        # Último id leído y ids salteados (transacciones sin commit todavía)
+        self._watermark = 0
+        self._gaps: Dict[int, float] = {}
+        # Los eventos con id <= _floor ya no están en el buffer
+        self._floor = 0
+        self._fetches = 0
+        self._last_error: Optional[str] = None
+
+    # ----- lectura (hilo del bus o threadpool) -----
+
+    def start(self):
+        """
+        Empezar desde el último evento existente y escuchar el bus (lifespan)
+        """
+        if not self.enabled or self._loop is not None:
+            return
+        try:
+            with engine.connect() as connection:
+                self._watermark = connection.execute(
+                    select(func.coalesce(func.max(DMTEvent.id), 0))
+                ).scalar_one()
+        except SQLAlchemyError as e:
+            ERRORS.labels("start").inc()
+            logger.warning("DMT feed could not read the last event id: %s", e)
+        self._floor = self._watermark
+        self._loop = asyncio.get_running_loop()
+        cache_bus.add_listener(self._on_bus)
+
+    def stop(self):
+        """
+        Cerrar los streams abiertos (shutdown)
+        """
+        for subscriber in list(self._subscribers):
+            subscriber.close("shutdown")
+            DROPPED.labels("shutdown").inc()
+        self._loop = None
+
+    def _on_bus(self, names: Set[str]):
+        if EVENTS_KEY in names:
+            self.fetch()
+
+    def wake(self):
+        """
+        Leer los eventos nuevos en el threadpool (sin bus)
+        """
+        loop = self._loop
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.run_in_executor, None, self.fetch)
+
+    def fetch(self):
+        """
+        Leer los eventos nuevos (y los ids salteados) y entregarlos en el event loop
+        """
+        loop = self._loop
+        if loop is None:
+            return
+        with self._fetch_lock:
+            events: List[FeedEvent] = []
+            try:
+                with engine.connect() as connection:
+                    while True:
+                        rows = self._read(connection)
+                        events.extend(self._accept(rows))
+                        if len(rows) < FETCH_BATCH:
+                            break
+                self._last_error = None
+                self._fetches += 1
+                if self._fetches % 100 == 0:
+                    self._prune()
+            except SQLAlchemyError as e:
+                ERRORS.labels("fetch").inc()
+                self._last_error = f"{type(e).__name__}: {e}"
+                logger.warning("DMT feed could not read events: %s", e)
+        if events:
+            try:
+                loop.call_soon_threadsafe(self._deliver, events)
+            except RuntimeError:
+                # El event loop ya se cerró (shutdown)
+                pass
+
+    def _read(self, connection):
+        table = DMTEvent.__table__
+        condition = table.c.id > self._watermark
+        if self._gaps:
+            condition = or_(condition, table.c.id.in_(list(self._gaps)))
+        return connection.execute(
+            select(table.c.id, table.c.kind, table.c.payload)
+            .where(condition)
+            .order_by(table.c.id)
+            .limit(FETCH_BATCH)
+        ).all()
+
+    def _accept(self, rows) -> List[FeedEvent]:
+        now = time.monotonic()
+        events = []
+        for event_id, kind, payload in rows:
+            if event_id in self._gaps:
+                del self._gaps[event_id]
+            elif event_id <= self._watermark:
+                continue
+            else:
+                # Ids intermedios sin fila todavía: transacciones sin commit
+                for missing in range(self._watermark + 1, event_id):
+                    self._gaps[missing] = now
+                self._watermark = event_id
+            try:
+                events.append(FeedEvent(event_id, kind, payload))
+            except (ValueError, KeyError) as e:
+                ERRORS.labels("decode").inc()
+                logger.warning("DMT feed skipped malformed event %s: %s", event_id, e)
+                continue
+            EVENTS.labels(kind).inc()
+        for missing, since in list(self._gaps.items()):
+            if now - since > GAP_TIMEOUT_S:
+                # Rollback (o un commit muy lento): no se espera más
+                del self._gaps[missing]
+        return events
+
+    def _prune(self):
+        table = DMTEvent.__table__
+        limit = self._watermark - DMT_EVENTS_KEEP
+        if limit <= 0:
+            return
+        try:
+            # Transacción propia: la conexión de fetch ya tiene una abierta (autobegin)
+            with engine.begin() as connection:
+                connection.execute(delete(table).where(table.c.id <= limit))
+        except SQLAlchemyError as e:
+            # Otro worker borrando al mismo tiempo: se reintenta en la próxima poda
+            ERRORS.labels("prune").inc()
+            logger.warning("DMT feed could not prune old events: %s", e)
+
+    # ----- reparto (event loop) -----
+
+    def _deliver(self, events: List[FeedEvent]):
+        for event in events:
+            if len(self._buffer) == self._buffer.maxlen:
+                self._floor = max(self._floor, self._buffer[0].id)
+            self._buffer.append(event)
+            for subscriber in list(self._subscribers):
+                if subscriber.closed is None and subscriber.filter.matches(event):
+                    subscriber.push(event)
+                    if subscriber.closed == "lagging":
+                        DROPPED.labels("lagging").inc()
+
+    def full(self) -> bool:
+        """
+        True si se alcanzó DMT_EVENTS_MAX_SUBSCRIBERS (el endpoint responde 503)
+        """
+        return len(self._subscribers) >= DMT_EVENTS_MAX_SUBSCRIBERS
+
+    def subscribe(self, event_filter: EventFilter, last_event_id: Optional[int] = None,
+                  user_id: Optional[int] = None) -> Subscriber:
+        """
+        Registrar un suscriptor
+
+        Con `last_event_id` (reconexión) los eventos posteriores del buffer que
+        cumplen los filtros quedan pendientes; se registra en el mismo paso del
+        event loop, así que ningún evento se repite ni se pierde
+        """
+        subscriber = Subscriber(event_filter, user_id)
+        if last_event_id is not None:
+            if last_event_id < self._floor:
+                subscriber.reset = True
+            else:
+                subscriber.pending.extend(
+                    event for event in self._buffer
+                    if event.id > last_event_id and event_filter.matches(event)
+                )
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._subscribers.discard(subscriber)
+
+    async def stream(self, event_filter: EventFilter, last_event_id: Optional[int] = None,
+                     user_id: Optional[int] = None):
+        """
+        Mensajes SSE para un suscriptor nuevo hasta que se desconecta o se cierra el stream
+        (se registra al empezar a enviar: un cliente que se va antes no queda registrado)
+        """
+        subscriber = self.subscribe(event_filter, last_event_id, user_id)
+        try:
+            yield f"retry: {RETRY_MS}\n\n".encode("utf-8")
+            if subscriber.reset:
+                yield b"event: reset\ndata: {}\n\n"
+            if subscriber.pending:
+                subscriber.wakeup.set()
+
+            expires = time.monotonic() + DMT_EVENTS_MAX_STREAM_S
+            while subscriber.closed is None:
+                remaining = expires - time.monotonic()
+                if remaining <= 0:
+                    subscriber.close("expired")
+                    DROPPED.labels("expired").inc()
+                    break
+                try:
+                    await asyncio.wait_for(subscriber.wakeup.wait(), min(DMT_EVENTS_HEARTBEAT_S, remaining))
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                subscriber.wakeup.clear()
+                while subscriber.pending:
+                    event = subscriber.pending.popleft()
+                    subscriber.sent += 1
+                    DELIVERED.inc()
+                    yield event.message
+        finally:
+            self.unsubscribe(subscriber)
+
+    def status(self) -> dict:
+        """
+        Suscriptores, buffer y lectura de eventos (GET /admin/feed)
+        """
+        return {
+            "enabled": self.enabled,
+            "running": self._loop is not None,
+            "subscribers": len(self._subscribers),
+            "max_subscribers": DMT_EVENTS_MAX_SUBSCRIBERS,
+            "last_event_id": self._watermark,
+            "buffered": len(self._buffer),
+            "replay_from": self._floor,
+            "pending_gaps": len(self._gaps),
+            "events": EVENTS.total(),
+            "delivered": DELIVERED.total(),
+            "disconnects": DROPPED.total(),
+            "last_error": self._last_error,
+        }
+
+
+# Instancia global (por worker)
+dmt_feed = DMTEventHub()
+
+GaugeCallback(
+    "dmt_feed_subscribers", "Open DMT feed streams", (),
+    lambda: {(): len(dmt_feed._subscribers)}
+)
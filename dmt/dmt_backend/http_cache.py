@@ -0,0 +1,116 @@
+"""
+HTTP validators (ETag / If-None-Match) and Cache-Control policies
+
+Catalog and user ETags are derived from the in-process version counters in
+cache.py, so a matching If-None-Match is answered with 304 before the
+handler queries its data. CACHE_EPOCH changes on every process start, so a
+version number reused after a restart never validates an old copy. With the
+invalidation bus (invalidation.py) the versions are global and persisted,
+so the workers share an epoch stored in the database instead.
+
+DMT record ETags are derived from each row's id and updated_at, so they
+stay valid across restarts and workers.
+"""
+
+import hashlib
+import uuid
+from typing import Iterable, Optional, Tuple
+from datetime import datetime
+from fastapi import Request, Response, status
+
+# Token único por proceso
+CACHE_EPOCH = uuid.uuid4().hex[:8]
+
+
+def set_cache_epoch(epoch: str):
+    """
+    Usar un epoch compartido por todos los workers (invalidation.py)
+    """
+    global CACHE_EPOCH
+    CACHE_EPOCH = epoch
+
+# Políticas de Cache-Control por recurso
+# no-cache: el navegador guarda la copia pero revalida siempre (304 barato)
+CATALOG_CACHE_CONTROL = "private, no-cache"
+USER_CACHE_CONTROL = "private, no-cache"
+DMT_RECORD_CACHE_CONTROL = "private, no-cache"
+DMT_EXPORT_CACHE_CONTROL = "private, no-store"
+
+
+def make_etag(*parts) -> str:
+    """
+    Construir un ETag fuerte a partir de sus componentes
+    """
+    return '"' + "-".join(str(part) for part in parts) + '"'
+
+
+def version_etag(*parts) -> str:
+    """
+    ETag basado en contadores de versión en memoria (incluye CACHE_EPOCH)
+    """
+    return make_etag(CACHE_EPOCH, *parts)
+
+
+def rows_etag(prefix: str, rows: Iterable[Tuple[int, Optional[datetime]]]) -> str:
+    """
+    ETag para una lista de registros a partir de sus pares (id, updated_at)
+    """
+    digest = hashlib.sha1()
+    for row_id, updated_at in rows:
+        digest.update(f"{row_id}:{updated_at.isoformat() if updated_at else ''};".encode())
+    return make_etag(prefix, digest.hexdigest()[:20])
+
+
+def row_etag(prefix: str, row_id: int, updated_at: Optional[datetime]) -> str:
+    """
+    ETag para un solo registro a partir de su id y updated_at
+    """
+    stamp = updated_at.strftime("%Y%m%d%H%M%S%f") if updated_at else "0"
+    return make_etag(prefix, row_id, stamp)
+
+
+def if_none_match(request: Request, *etags: str) -> bool:
+    """
+    True si el If-None-Match del request coincide con alguno de los ETags
+
+    Uses the weak comparison required for If-None-Match (RFC 9110), so a
+    W/ prefix added by a proxy still matches.
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+
+    candidates = set()
+    for value in header.split(","):
+        value = value.strip()
+        if value.startswith("W/"):
+            value = value[2:]
+        candidates.add(value)
+    return any(etag in candidates for etag in etags)
+
+
+def has_conditional(request: Request) -> bool:
+    """
+    True si el request trae If-None-Match
+    """
+    return "if-none-match" in request.headers
+
+
+def not_modified(etag: str, cache_control: str, vary: Optional[str] = None) -> Response:
+    """
+    Respuesta 304 con los mismos validadores que tendría la respuesta 200
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if vary:
+        headers["Vary"] = vary
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+
+def set_validators(response: Response, etag: str, cache_control: str):
+    """
+    Agregar ETag y Cache-Control a la respuesta
+    """
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
@@ -0,0 +1,167 @@
+"""
+Id block allocator for DMT records (hi/lo)
+
+Each process reserves blocks of DMT_ID_BLOCK_SIZE ids, in a short
+transaction of its own, and hands them out from memory. Knowing the id
+before the INSERT lets create_dmt write report_number = 1000 + id in the
+same statement: one INSERT and one commit per record, and no window where
+report_number is NULL.
+
+Where the ids come from:
+- PostgreSQL: the table's own SERIAL sequence (nextval), so an INSERT that
+  leaves the id to the database (manual SQL, ops tooling) never collides
+  with reserved ids. Rows inserted with explicit ids before (idsequence
+  blocks) are caught up with setval on the next reservation.
+- Other databases (SQLite, MySQL/MariaDB): the idsequence table. Their
+  autoincrement only continues after the highest existing id and does not
+  know about reserved ids, so every insert into dmtrecord must take its id
+  from here (see the DMTRecord model).
+
+Ids left in a block when a process stops are not reused, so report numbers
+can have gaps of up to DMT_ID_BLOCK_SIZE per process restart.
+
+Configuration (environment variables):
+    DMT_ID_BLOCK_SIZE   Ids reserved per round-trip (default: 20)
+"""
+
+import asyncio
+import os
+import threading
+from collections import deque
+from typing import List
+from sqlalchemy import cast, func, insert, literal, select, update
+from sqlalchemy.dialects.postgresql import REGCLASS
+from sqlalchemy.exc import IntegrityError
+from database import engine, async_write_engine
+from models import IdSequence, DMTRecord
+
+DMT_ID_BLOCK_SIZE = int(os.getenv("DMT_ID_BLOCK_SIZE", "20"))
+
+
+def reserve_block(connection, name: str, model, size: int) -> List[int]:
+    """
+    Reservar `size` ids (se ejecuta dentro de la transacción de `connection`)
+    PostgreSQL: de la secuencia de la tabla; otras bases: de idsequence
+    """
+    if connection.dialect.name == "postgresql":
+        ids = _reserve_from_sequence(connection, model, size)
+        if ids is not None:
+            return ids
+    start = _reserve_from_table(connection, name, model, size)
+    return list(range(start, start + size))
+
+
+def _reserve_from_sequence(connection, model, size: int):
+    table = model.__table__
+    name = connection.execute(select(func.pg_get_serial_sequence(table.name, "id"))).scalar()
+    if name is None:
+        # id sin secuencia propia (tabla creada a mano): usar idsequence
+        return None
+    sequence = cast(literal(name), REGCLASS)
+    # Filas con ids explícitos de antes (bloques de idsequence): adelantar la secuencia
+    highest = select(func.max(table.c.id)).scalar_subquery()
+    connection.execute(
+        select(func.setval(sequence, highest))
+        .where(highest > func.coalesce(func.pg_sequence_last_value(sequence), 0))
+    )
+    ids = connection.execute(
+        select(func.nextval(sequence)).select_from(func.generate_series(1, size))
+    ).scalars().all()
+    return sorted(ids)
+
+
+def _reserve_from_table(connection, name: str, model, size: int) -> int:
+    table = IdSequence.__table__
+    result = connection.execute(
+        update(table)
+        .where(table.c.name == name)
+        .values(next_value=table.c.next_value + size)
+    )
+    if result.rowcount == 0:
+        # Primera reserva: continuar después del id más alto existente
+        start = connection.execute(select(func.coalesce(func.max(model.id), 0) + 1)).scalar_one()
+        connection.execute(insert(table).values(name=name, next_value=start + size))
+        return start
+
+    next_value = connection.execute(
+        select(table.c.next_value).where(table.c.name == name)
+    ).scalar_one()
+    return next_value - size
+
+
+class IdBlockAllocator:
+    """
+    Entrega ids de bloques reservados en la base de datos
+    """
+
+    def __init__(self, model, block_size: int = DMT_ID_BLOCK_SIZE):
+        self.model = model
+        self.name = model.__tablename__
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._async_lock = asyncio.Lock()
+        self._ids = deque()
+
+    def _take(self, count: int) -> List[int]:
+        with self._lock:
+            return [self._ids.popleft() for _ in range(min(count, len(self._ids)))]
+
+    def _add_block(self, ids: List[int]):
+        with self._lock:
+            self._ids.extend(ids)
+
+    def _block_size_for(self, missing: int) -> int:
+        return max(self.block_size, missing)
+
+    async def allocate(self, count: int = 1) -> List[int]:
+        """
+        Obtener `count` ids nuevos (async)
+
+        Reserving a block uses the primary/writer engine: with the SQLite
+        single writer, call this before the caller's write session starts a
+        transaction (see database.release_connection).
+        """
+        ids = self._take(count)
+        if len(ids) == count:
+            return ids
+        async with self._async_lock:
+            ids += self._take(count - len(ids))
+            while len(ids) < count:
+                size = self._block_size_for(count - len(ids))
+                self._add_block(await self._reserve_async(size))
+                ids += self._take(count - len(ids))
+        return ids
+
+    def allocate_sync(self, count: int = 1) -> List[int]:
+        """
+        Obtener `count` ids nuevos (scripts, engine síncrono)
+        """
+        ids = self._take(count)
+        while len(ids) < count:
+            size = self._block_size_for(count - len(ids))
+            self._add_block(self._reserve_sync(size))
+            ids += self._take(count - len(ids))
+        return ids
+
+    async def _reserve_async(self, size: int) -> List[int]:
+        for attempt in range(2):
+            try:
+                async with async_write_engine.begin() as conn:
+                    return await conn.run_sync(reserve_block, self.name, self.model, size)
+            except IntegrityError:
+                # Otro proceso creó la fila de la secuencia al mismo tiempo
+                if attempt:
+                    raise
+
+    def _reserve_sync(self, size: int) -> List[int]:
+        for attempt in range(2):
+            try:
+                with engine.begin() as conn:
+                    return reserve_block(conn, self.name, self.model, size)
+            except IntegrityError:
+                if attempt:
+                    raise
+
+
+# Ids de DMTRecord (report_number = 1000 + id)
+dmt_ids = IdBlockAllocator(DMTRecord)
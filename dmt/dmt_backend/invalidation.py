@@ -0,0 +1,431 @@
+"""
+Cross-worker invalidation bus for the catalog cache (cache.py)
+
+Each uvicorn worker has its own catalog_cache, so an Admin edit handled by
+one worker used to leave the catalogs, the user list and the bundle stale
+in the others until they restarted. The bus uses the database itself, no
+extra services:
+
+- Writes (crud_entity.invalidate_catalog, crud_user.invalidate_users)
+  invalidate the local cache and publish the names; a background thread
+  bumps their rows in the cache_version table in one short transaction,
+  once per local invalidation (several writes before a flush add up), so
+  the local versions never run ahead of the global ones.
+- Every worker applies versions newer than the ones it has seen
+  (catalog_cache.advance): the entries are dropped even if the local
+  version is already as high (own invalidations not yet published), so
+  local versions follow the global ones and version ETags are the same in
+  every worker.
+- PostgreSQL (psycopg2): the bump also sends NOTIFY and workers LISTEN on a
+  dedicated connection, so changes arrive in a few milliseconds; the table
+  is still read every CACHE_BUS_RESYNC_S and while the listener reconnects.
+- SQLite, MariaDB/MySQL and others: the table (one row per catalog) is read
+  every CACHE_BUS_POLL_MS.
+
+dmt_events.py publishes EVENTS_KEY after each DMT record commit through the
+same bus, so every worker's live feed reads the new events (no cache entry
+uses that name).
+
+A worker skips the bumps it published itself when no other bump happened in
+between, so its own writes do not drop its cache twice. Since versions are
+global and never go back, the workers also share the ETag epoch (a random
+number stored under EPOCH_KEY when the table is first used).
+
+Configuration (environment variables):
+    CACHE_BUS           auto (default: LISTEN/NOTIFY on PostgreSQL, polling
+                        otherwise), poll, or off (single worker)
+    CACHE_BUS_POLL_MS   Polling interval (default: 100)
+    CACHE_BUS_RESYNC_S  Full read interval while listening (default: 30)
+"""
+
+import logging
+import os
+import random
+import select
+import socket
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set
+from sqlalchemy import create_engine, func, insert, update
+from sqlalchemy import select as sql_select
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.pool import NullPool
+from cache import CatalogCache, catalog_cache
+from database import DATABASE_URL, db_type, engine
+from http_cache import set_cache_epoch
+from metrics import Counter
+from models import CacheVersion
+
+logger = logging.getLogger(__name__)
+
+CACHE_BUS = os.getenv("CACHE_BUS", "auto").lower()
+CACHE_BUS_POLL_MS = int(os.getenv("CACHE_BUS_POLL_MS", "100"))
+CACHE_BUS_RESYNC_S = float(os.getenv("CACHE_BUS_RESYNC_S", "30"))
+CACHE_BUS_ENABLED = CACHE_BUS != "off"
+CACHE_BUS_CHANNEL = "dmt_cache_invalidation"
+
+# Fila con el epoch de los ETags (no es un nombre del cache)
+EPOCH_KEY = "_epoch"
+
+PUBLISHED = Counter("dmt_cache_bus_published_total", "Cache version bumps written to the database")
+APPLIED = Counter(
+    "dmt_cache_bus_applied_total", "Invalidations applied from other workers' bumps (source: poll or notify)",
+    ("source",)
+)
+ERRORS = Counter("dmt_cache_bus_errors_total", "Failed bus operations", ("operation",))
+
+
+def bump_versions(connection, increments: Dict[str, int]) -> Dict[str, int]:
+    """
+    Incrementar la versión global de cada nombre en `increments[nombre]`
+    (una vez por invalidación local); retorna las nuevas versiones
+    (se ejecuta dentro de la transacción de `connection`)
+    """
+    table = CacheVersion.__table__
+    now = datetime.utcnow()
+    versions = {}
+    # Orden fijo: dos workers bloquean las filas en el mismo orden
+    for name in sorted(increments):
+        step = increments[name]
+        result = connection.execute(
+            update(table)
+            .where(table.c.name == name)
+            .values(version=table.c.version + step, updated_at=now)
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(table).values(name=name, version=step, updated_at=now))
+            versions[name] = step
+        else:
+            versions[name] = connection.execute(
+                sql_select(table.c.version).where(table.c.name == name)
+            ).scalar_one()
+    if db_type == "postgresql" and versions:
+        # Se entrega al hacer commit, solo si la transacción se confirma
+        payload = ",".join(f"{name}:{version}" for name, version in versions.items())
+        connection.execute(sql_select(func.pg_notify(CACHE_BUS_CHANNEL, payload)))
+    return versions
+
+
+def read_versions(connection) -> Dict[str, int]:
+    """
+    Versión global de todos los nombres
+    """
+    table = CacheVersion.__table__
+    return dict(connection.execute(sql_select(table.c.name, table.c.version)).all())
+
+
+def read_epoch(connection) -> Optional[int]:
+    """
+    Epoch guardado en esta base de datos (None si todavía no hay)
+    """
+    table = CacheVersion.__table__
+    return connection.execute(sql_select(table.c.version).where(table.c.name == EPOCH_KEY)).scalar()
+
+
+def shared_epoch(connection) -> int:
+    """
+    Epoch de los ETags compartido por los workers (se crea la primera vez)
+    También identifica la base de datos (catalog_snapshot.py)
+    """
+    table = CacheVersion.__table__
+    epoch = read_epoch(connection)
+    if epoch is None:
+        epoch = random.randrange(1, 2 ** 31)
+        connection.execute(insert(table).values(name=EPOCH_KEY, version=epoch, updated_at=datetime.utcnow()))
+    return epoch
+
+
+def parse_notification(payload: str) -> Dict[str, int]:
+    """
+    "nombre:versión,..." -> {nombre: versión}
+    """
+    versions = {}
+    for item in payload.split(","):
+        name, _, version = item.rpartition(":")
+        if name and version.isdigit():
+            versions[name] = int(version)
+    return versions
+
+
+class InvalidationBus:
+    """
+    Publica los cambios de este worker y aplica los de los demás
+    """
+
+    def __init__(self, cache: CatalogCache = catalog_cache, mode: str = CACHE_BUS):
+        self.cache = cache
+        self.listen = mode == "auto" and db_type == "postgresql" and engine.dialect.driver == "psycopg2"
+        self.enabled = mode != "off"
+        self.poll_interval = CACHE_BUS_POLL_MS / 1000
+        self._lock = threading.Lock()
+        # Invalidaciones locales sin escribir, por nombre
+        self._pending: Dict[str, int] = {}
+        self._seen: Dict[str, int] = {}
+        self._synced = False
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._wake_r: Optional[socket.socket] = None
+        self._wake_w: Optional[socket.socket] = None
+        self._listen_engine = None
+        self._listener = None
+        self._last_poll: Optional[float] = None
+        self._listeners: List[Callable[[Set[str]], None]] = []
+        # Epoch compartido de la base de datos (None hasta start o si no se pudo leer)
+        self.epoch: Optional[int] = None
+
+    def add_listener(self, callback: Callable[[Set[str]], None]):
+        """
+        Llamar `callback(nombres)` cada vez que cambian versiones locales
+        (por escrituras de este worker o de otros; desde el hilo del bus)
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, names: Set[str]):
+        for callback in self._listeners:
+            try:
+                callback(names)
+            except Exception as e:
+                logger.warning("Cache bus listener failed: %s", e)
+
+    # ----- publicar -----
+
+    def publish(self, *names: str):
+        """
+        Publicar la invalidación de `names` (llamar después del commit y de
+        invalidar el cache local). Con el hilo en marcha no bloquea: el hilo
+        escribe la versión enseguida. Sin hilo (scripts) escribe aquí mismo.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            for name in names:
+                self._pending[name] = self._pending.get(name, 0) + 1
+        if self._thread is not None:
+            self._wake()
+        else:
+            self.flush()
+
+    def flush(self):
+        """
+        Escribir las versiones pendientes (una transacción)
+        """
+        with self._lock:
+            increments, self._pending = self._pending, {}
+        if not increments:
+            return
+        for attempt in range(2):
+            try:
+                with engine.begin() as connection:
+                    versions = bump_versions(connection, increments)
+                break
+            except IntegrityError:
+                # Otro worker insertó la misma fila nueva: reintentar con UPDATE
+                if attempt:
+                    ERRORS.labels("publish").inc()
+                    return
+            except SQLAlchemyError as e:
+                ERRORS.labels("publish").inc()
+                logger.warning("Cache bus publish failed (%s): %s", ", ".join(sorted(increments)), e)
+                if self._thread is not None:
+                    with self._lock:
+                        for name, step in increments.items():
+                            self._pending[name] = self._pending.get(name, 0) + step
+                return
+        PUBLISHED.inc(sum(increments.values()))
+
+        with self._lock:
+            for name, version in versions.items():
+                # Solo si nadie más la incrementó entre la última versión vista y esta
+                if self._seen.get(name, 0) == version - increments[name]:
+                    self._seen[name] = version
+                    self.cache.advance(name, version)
+        self._notify(set(versions))
+
+    # ----- aplicar -----
+
+    def apply(self, versions: Dict[str, int], source: str):
+        """
+        Aplicar versiones globales más nuevas que las vistas
+        """
+        changed = set()
+        with self._lock:
+            for name, version in versions.items():
+                if name == EPOCH_KEY or version <= self._seen.get(name, 0):
+                    continue
+                self._seen[name] = version
+                changed.add(name)
+                if self.cache.advance(name, version, changed=True) and self._synced:
+                    APPLIED.labels(source).inc()
+            self._synced = True
+        if changed:
+            self._notify(changed)
+
+    def poll(self):
+        """
+        Leer la tabla de versiones y aplicar los cambios
+        """
+        try:
+            with engine.connect() as connection:
+                versions = read_versions(connection)
+        except SQLAlchemyError as e:
+            ERRORS.labels("poll").inc()
+            logger.warning("Cache bus poll failed: %s", e)
+            return
+        self._last_poll = time.time()
+        self.apply(versions, "poll")
+
+    def _connect_listener(self):
+        try:
+            if self._listen_engine is None:
+                # Conexión propia, fuera del pool: queda abierta escuchando
+                self._listen_engine = create_engine(DATABASE_URL, poolclass=NullPool)
+            connection = self._listen_engine.raw_connection()
+            dbapi_connection = connection.driver_connection
+            dbapi_connection.autocommit = True
+            with dbapi_connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {CACHE_BUS_CHANNEL}")
+            return connection
+        except Exception as e:
+            ERRORS.labels("listen").inc()
+            logger.warning("Cache bus LISTEN failed, polling until it reconnects: %s", e)
+            return None
+
+    def _close_listener(self):
+        if self._listener is not None:
+            try:
+                self._listener.close()
+            except Exception:
+                pass
+            self._listener = None
+
+    def _read_notifications(self):
+        dbapi_connection = self._listener.driver_connection
+        try:
+            dbapi_connection.poll()
+        except Exception as e:
+            ERRORS.labels("listen").inc()
+            logger.warning("Cache bus listener lost: %s", e)
+            self._close_listener()
+            return
+        while dbapi_connection.notifies:
+            notification = dbapi_connection.notifies.pop(0)
+            self.apply(parse_notification(notification.payload), "notify")
+
+    # ----- hilo -----
+
+    def start(self):
+        """
+        Tomar el epoch compartido, leer las versiones actuales e iniciar el
+        hilo del bus (lifespan)
+        """
+        if not self.enabled or self._thread is not None:
+            return
+        for attempt in range(2):
+            try:
+                with engine.begin() as connection:
+                    epoch = shared_epoch(connection)
+                self.epoch = epoch
+                set_cache_epoch(f"{epoch:08x}")
+                break
+            except IntegrityError:
+                # Otro worker creó el epoch al mismo tiempo: leerlo
+                continue
+            except SQLAlchemyError as e:
+                ERRORS.labels("epoch").inc()
+                logger.warning("Cache bus could not read the shared ETag epoch: %s", e)
+                break
+        self.poll()
+        self._stop.clear()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._thread = threading.Thread(target=self._run, name="cache-bus", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Escribir lo pendiente y detener el hilo (shutdown)
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake()
+        self._thread.join(timeout=10)
+        self._thread = None
+        self._close_listener()
+        if self._listen_engine is not None:
+            self._listen_engine.dispose()
+            self._listen_engine = None
+        for sock in (self._wake_r, self._wake_w):
+            sock.close()
+        self._wake_r = self._wake_w = None
+        self.flush()
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b"\0")
+        except (AttributeError, OSError):
+            # Ya hay un aviso pendiente (buffer lleno) o el bus se detuvo
+            pass
+
+    def _drain_wake(self):
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _run(self):
+        next_poll = time.monotonic() + self.poll_interval
+        while not self._stop.is_set():
+            self.flush()
+
+            if self.listen and self._listener is None:
+                self._listener = self._connect_listener()
+                if self._listener is not None:
+                    # Lo publicado mientras no escuchaba solo está en la tabla
+                    next_poll = 0.0
+
+            now = time.monotonic()
+            if now >= next_poll:
+                self.poll()
+                interval = CACHE_BUS_RESYNC_S if self._listener is not None else self.poll_interval
+                next_poll = now + interval
+
+            sockets = [self._wake_r]
+            if self._listener is not None:
+                sockets.append(self._listener.driver_connection)
+            try:
+                readable, _, _ = select.select(sockets, [], [], max(0.0, next_poll - time.monotonic()))
+            except (OSError, ValueError):
+                self._close_listener()
+                continue
+            if self._wake_r in readable:
+                self._drain_wake()
+            if self._listener is not None and self._listener.driver_connection in readable:
+                self._read_notifications()
+
+    def status(self) -> dict:
+        """
+        Estado del bus (GET /admin/cache)
+        """
+        with self._lock:
+            versions = dict(sorted(self._seen.items()))
+            pending = sum(self._pending.values())
+        return {
+            "enabled": self.enabled,
+            "running": self._thread is not None,
+            "mode": "notify" if self.listen else "poll",
+            "listening": self._listener is not None,
+            "poll_interval_ms": CACHE_BUS_POLL_MS,
+            "last_poll_age_s": round(time.time() - self._last_poll, 3) if self._last_poll else None,
+            "pending": pending,
+            "published": PUBLISHED.total(),
+            "applied": APPLIED.total(),
+            "versions": versions,
+        }
+
+
+# Instancia global (un bus por worker)
+cache_bus = InvalidationBus()
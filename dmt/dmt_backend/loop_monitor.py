@@ -0,0 +1,243 @@
+"""
+Event-loop lag monitor (stall detector)
+
+A heartbeat task wakes up every LOOP_MONITOR_INTERVAL seconds and records
+how late it woke up: that delay is time the loop spent running something
+that did not yield. A watchdog thread watches the heartbeat; when it is
+overdue by more than LOOP_STALL_THRESHOLD_MS it captures the stack of the
+event-loop thread, which points at the sync call (requests.post,
+session.commit(), bcrypt, ...) that is blocking every other request.
+
+Lag histogram, recent stalls and offenders grouped by code location are
+exposed through GET /admin/loop (Admin only).
+
+Configuration (environment variables):
+    LOOP_MONITOR_ENABLED     1/0 (default: 1)
+    LOOP_MONITOR_INTERVAL    Heartbeat interval in seconds (default: 0.05)
+    LOOP_STALL_THRESHOLD_MS  Stall threshold in ms (default: 100)
+    LOOP_MONITOR_MAX_STALLS  Recent stalls kept in memory (default: 50)
+    LOOP_MONITOR_ASYNCIO_DEBUG  1 = also enable asyncio debug mode, which
+                             logs every slow callback (staging only)
+"""
+
+import asyncio
+import bisect
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "1") == "1"
+LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.05"))
+LOOP_STALL_THRESHOLD_MS = float(os.getenv("LOOP_STALL_THRESHOLD_MS", "100"))
+LOOP_MONITOR_MAX_STALLS = int(os.getenv("LOOP_MONITOR_MAX_STALLS", "50"))
+LOOP_MONITOR_ASYNCIO_DEBUG = os.getenv("LOOP_MONITOR_ASYNCIO_DEBUG", "0") == "1"
+
+# Límites superiores (ms) de los buckets del histograma de lag
+LAG_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Frames guardados por stall
+STACK_LIMIT = 25
+
+# Directorio del backend: se usa para ubicar el frame "culpable" en el código de la app
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _app_location(frames: List[traceback.FrameSummary]) -> str:
+    """
+    Frame más profundo que pertenece al código de la app (file:line in func)
+    """
+    for frame in reversed(frames):
+        if frame.filename.startswith(APP_ROOT) and frame.filename != __file__:
+            return f"{os.path.relpath(frame.filename, APP_ROOT)}:{frame.lineno} in {frame.name}"
+    if frames:
+        frame = frames[-1]
+        return f"{frame.filename}:{frame.lineno} in {frame.name}"
+    return "unknown"
+
+
+class LoopMonitor:
+    """
+    Mide el lag del event loop y registra los stalls con su stack trace
+    """
+
+    def __init__(
+        self,
+        interval: float = LOOP_MONITOR_INTERVAL,
+        threshold_ms: float = LOOP_STALL_THRESHOLD_MS,
+        max_stalls: int = LOOP_MONITOR_MAX_STALLS
+    ):
+        self.interval = interval
+        self.threshold = threshold_ms / 1000
+        self.max_stalls = max_stalls
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = 0.0
+        self._beat_seq = 0
+        self._pending: Optional[dict] = None
+        self.reset()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def reset(self):
+        """
+        Descartar las estadísticas acumuladas
+        """
+        with self._lock:
+            self._bucket_counts = [0] * (len(LAG_BUCKETS_MS) + 1)
+            self._samples = 0
+            self._lag_sum_ms = 0.0
+            self._lag_max_ms = 0.0
+            self._stalls_total = 0
+            self._stalls = deque(maxlen=self.max_stalls)
+            self._offenders: Dict[str, dict] = {}
+            self._since = datetime.utcnow()
+
+    def start(self):
+        """
+        Iniciar el heartbeat y el watchdog (llamar desde el event loop)
+        """
+        if self._task is not None:
+            return
+        loop = asyncio.get_running_loop()
+        if LOOP_MONITOR_ASYNCIO_DEBUG:
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.threshold
+
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.perf_counter()
+        self._stop_event.clear()
+        self._task = loop.create_task(self._heartbeat(), name="loop-monitor")
+        self._thread = threading.Thread(target=self._watchdog, name="loop-monitor", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        """
+        Detener el heartbeat y el watchdog
+        """
+        if self._task is None:
+            return
+        self._stop_event.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._thread.join(timeout=1)
+        self._task = None
+        self._thread = None
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            self._record_lag(now, max(0.0, now - expected))
+
+    def _record_lag(self, now: float, lag: float):
+        lag_ms = lag * 1000
+        with self._lock:
+            self._last_beat = now
+            self._beat_seq += 1
+            self._samples += 1
+            self._lag_sum_ms += lag_ms
+            self._lag_max_ms = max(self._lag_max_ms, lag_ms)
+            self._bucket_counts[bisect.bisect_left(LAG_BUCKETS_MS, lag_ms)] += 1
+
+            stall, self._pending = self._pending, None
+            if stall is None and lag < self.threshold:
+                return
+            if stall is None:
+                # El watchdog no alcanzó a capturar el stack
+                stall = {"at": datetime.utcnow().isoformat(), "location": "unknown", "stack": []}
+            stall["duration_ms"] = round(lag_ms, 1)
+            self._stalls.appendleft(stall)
+            self._stalls_total += 1
+
+            offender = self._offenders.setdefault(
+                stall["location"], {"location": stall["location"], "count": 0, "total_ms": 0.0, "max_ms": 0.0}
+            )
+            offender["count"] += 1
+            offender["total_ms"] += lag_ms
+            offender["max_ms"] = max(offender["max_ms"], lag_ms)
+            offender["last_seen"] = stall["at"]
+
+        logger.warning("Event loop blocked for %.0f ms at %s", lag_ms, stall["location"])
+
+    def _watchdog(self):
+        check_every = min(self.interval, self.threshold) / 2
+        while not self._stop_event.wait(check_every):
+            with self._lock:
+                seq = self._beat_seq
+                overdue = time.perf_counter() - self._last_beat - self.interval
+                if self._pending is not None or overdue < self.threshold:
+                    continue
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            frames = traceback.extract_stack(frame)[-STACK_LIMIT:] if frame is not None else []
+            del frame
+
+            with self._lock:
+                # El heartbeat corrió mientras se capturaba: no era un stall
+                if seq != self._beat_seq:
+                    continue
+                self._pending = {
+                    "at": datetime.utcnow().isoformat(),
+                    "location": _app_location(frames),
+                    "stack": [
+                        f"{frame.filename}:{frame.lineno} in {frame.name}" + (f": {frame.line}" if frame.line else "")
+                        for frame in frames
+                    ],
+                }
+
+    def snapshot(self) -> dict:
+        """
+        Estadísticas actuales (histograma, stalls recientes y offenders)
+        """
+        with self._lock:
+            histogram = [
+                {"le_ms": bound, "count": count}
+                for bound, count in zip(LAG_BUCKETS_MS + ("+Inf",), self._bucket_counts)
+            ]
+            current = None
+            if self._pending is not None:
+                current = dict(self._pending)
+                current["blocked_ms"] = round((time.perf_counter() - self._last_beat - self.interval) * 1000, 1)
+            offenders = sorted(
+                (dict(item, total_ms=round(item["total_ms"], 1), max_ms=round(item["max_ms"], 1))
+                 for item in self._offenders.values()),
+                key=lambda item: item["total_ms"],
+                reverse=True
+            )
+            return {
+                "running": self.running,
+                "since": self._since.isoformat(),
+                "interval_ms": self.interval * 1000,
+                "threshold_ms": self.threshold * 1000,
+                "lag": {
+                    "samples": self._samples,
+                    "mean_ms": round(self._lag_sum_ms / self._samples, 3) if self._samples else 0.0,
+                    "max_ms": round(self._lag_max_ms, 1),
+                    "histogram": histogram,
+                },
+                "stalls_total": self._stalls_total,
+                "current_stall": current,
+                "offenders": offenders,
+                "recent_stalls": list(self._stalls),
+            }
+
+
+# Instancia global iniciada en el lifespan de main.py
+loop_monitor = LoopMonitor()
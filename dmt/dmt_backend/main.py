@@ -1,8 +1,26 @@
+import time
+_boot_started = time.perf_counter()  # antes del resto de los imports: mide el arranque completo
+
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
-from database import init_db
-from routers import router_auth, router_entities, router_dmt, router_users
+from database import init_db, dispose_engines, replica_router
+from replicas import ReadYourWritesMiddleware
+from responses import FastJSONResponse
+from compression import CompressionMiddleware
+from sql_monitor import SQLStatsMiddleware
+from loop_monitor import loop_monitor, LOOP_MONITOR_ENABLED
+from metrics import (
+    MetricsMiddleware, METRICS_ENABLED, CONTENT_TYPE as METRICS_CONTENT_TYPE, registry, STARTUP_SECONDS
+)
+from invalidation import cache_bus
+from catalog_snapshot import catalog_snapshot
+from dmt_events import dmt_feed
+from tracing import TracingMiddleware, TRACING_ENABLED, exporter as trace_exporter
+from profiler import ProfilingMiddleware
+from admission import AdmissionMiddleware
+from user_import import shutdown_hash_pool
+from routers import router_auth, router_entities, router_dmt, router_users, router_admin
 
 # Define the lifespan context manager
 @asynccontextmanager
@@ -14,22 +32,79 @@ async def lifespan(app: FastAPI):
     Code after 'yield' runs on shutdown.
     """
     # Startup logic
+    # Tiempo por fase: imports (módulos, routers, modelos), esquema, réplicas, monitores
+    phases = {}
+    mark = time.perf_counter()
+    phases["import"] = mark - _boot_started
+
     print("Initializing database...")
-    init_db()
-    
+    schema_check = init_db()
+    phases["init_db"], mark = time.perf_counter() - mark, time.perf_counter()
+
+    await replica_router.start()
+    phases["replicas"], mark = time.perf_counter() - mark, time.perf_counter()
+
+    cache_bus.start()
+    catalog_snapshot.start()
+    dmt_feed.start()
+
+    if LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+    if TRACING_ENABLED:
+        trace_exporter.start()
+    phases["monitors"] = time.perf_counter() - mark
+
+    total = time.perf_counter() - _boot_started
+    for phase, seconds in phases.items():
+        STARTUP_SECONDS.labels(phase).inc(seconds)
+    STARTUP_SECONDS.labels("total").inc(total)
+    print(f"Startup in {total * 1000:.0f} ms (" + ", ".join(
+        f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in phases.items()
+    ) + f"; schema verified by {schema_check})")
+
     yield # Application starts serving requests
 
     # Shutdown logic (if any)
     print("Application shutting down...")
+    await loop_monitor.stop()
+    shutdown_hash_pool()
+    dmt_feed.stop()
+    catalog_snapshot.stop()
+    cache_bus.stop()
+    await dispose_engines()
+    trace_exporter.stop()
 
 
 app = FastAPI(
     title="DMT Backend API",
     description="Backend para gestión de DMT Records con FastAPI + SQLModel + MariaDB",
     version="1.0.0",
-    lifespan=lifespan # Pass the lifespan function here
+    lifespan=lifespan, # Pass the lifespan function here
+    default_response_class=FastJSONResponse # orjson si está instalado
 )
 
+# Compresión gzip/brotli para respuestas grandes
+app.add_middleware(CompressionMiddleware)
+
+# Conteo de consultas SQL por request (X-DB-Queries / X-DB-Time-Ms)
+app.add_middleware(SQLStatsMiddleware)
+
+# Token read-your-writes en las respuestas de escrituras (solo con réplicas)
+app.add_middleware(ReadYourWritesMiddleware, router=replica_router)
+
+# Métricas de Prometheus por ruta (latencia, requests en curso, status)
+app.add_middleware(MetricsMiddleware)
+
+# Trazas muestreadas (span por request, propagación de traceparent)
+app.add_middleware(TracingMiddleware)
+
+# Perfilado por request (X-Profile de un Admin o N requests al azar por minuto)
+app.add_middleware(ProfilingMiddleware)
+
+# Control de admisión: límites y colas por clase de request, 503 + Retry-After
+# (fuera de las métricas y trazas: un request rechazado no llega a la API)
+app.add_middleware(AdmissionMiddleware)
+
 # Configurar CORS
 app.add_middleware(
     CORSMiddleware,
@@ -44,6 +119,7 @@ app.include_router(router_auth.router)
 app.include_router(router_entities.router)
 app.include_router(router_dmt.router)
 app.include_router(router_users.router)
+app.include_router(router_admin.router)
 
 
 @app.get("/")
@@ -64,4 +140,14 @@ def health_check():
     """
     Endpoint de health check
     """
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """
+    Métricas en formato de texto de Prometheus (por proceso / worker)
+    """
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return Response(registry.render(), media_type=METRICS_CONTENT_TYPE)
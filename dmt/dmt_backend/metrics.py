@@ -0,0 +1,424 @@
+"""
+Prometheus metrics (GET /metrics, text exposition format 0.0.4)
+
+Exposed families:
+- dmt_http_requests_total, dmt_http_request_duration_seconds and
+  dmt_http_requests_in_flight per method and route template
+- dmt_db_pool_* connections checked out / overflow / capacity per pool,
+  read from the engines when scraped
+- dmt_translation_* LibreTranslate call latency, errors and fallbacks
+  (texts returned untranslated)
+- dmt_password_hash_seconds hash / verify timing from auth (hashes done in
+  the user_import process pool are timed in the worker processes and are
+  not included)
+- dmt_export_rows_total and dmt_export_duration_seconds for the CSV export
+- dmt_startup_seconds per startup phase of the worker
+
+Updates are lock-free: every metric keeps one slot array per thread and
+only the owning thread writes to it, so an update is a plain in-place
+addition (no lock, no contention between the event loop and the
+threadpool). A lock is only taken the first time a thread updates a
+metric and when the shards are summed at scrape time; the shards of
+finished threads are folded into a base value then.
+
+Configuration (environment variables):
+    METRICS_ENABLED   1/0, also disables the /metrics endpoint (default: 1)
+"""
+
+import bisect
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+from starlette.routing import Match
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+# Starlette agrega "; charset=utf-8"
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# Buckets por defecto de los clientes de Prometheus (segundos)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+
+class _ShardedValues:
+    """
+    Valores de una serie repartidos en un arreglo por hilo
+    """
+
+    __slots__ = ("_size", "_local", "_shards", "_base", "_lock")
+
+    def __init__(self, size: int):
+        self._size = size
+        self._local = threading.local()
+        self._shards: List[Tuple[threading.Thread, List[float]]] = []
+        self._base = [0.0] * size
+        self._lock = threading.Lock()
+
+    def shard(self) -> List[float]:
+        """
+        Arreglo del hilo actual (solo este hilo escribe en él)
+        """
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = [0.0] * self._size
+            with self._lock:
+                self._shards.append((threading.current_thread(), values))
+            return values
+
+    def totals(self) -> List[float]:
+        """
+        Suma de todos los hilos; los de hilos terminados pasan a la base
+        """
+        with self._lock:
+            alive = []
+            for thread, values in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, values))
+                else:
+                    for i, value in enumerate(values):
+                        self._base[i] += value
+            self._shards = alive
+            totals = list(self._base)
+            for _, values in alive:
+                for i, value in enumerate(values):
+                    totals[i] += value
+        return totals
+
+
+class _CounterChild:
+    __slots__ = ("_values",)
+
+    def __init__(self):
+        self._values = _ShardedValues(1)
+
+    def inc(self, amount: float = 1):
+        self._values.shard()[0] += amount
+
+    def value(self) -> float:
+        return self._values.totals()[0]
+
+    def samples(self, name: str, labels: str):
+        yield f"{name}{labels} {_format(self.value())}"
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1):
+        self._values.shard()[0] -= amount
+
+
+class _HistogramChild:
+    __slots__ = ("_buckets", "_values")
+
+    def __init__(self, buckets: Sequence[float]):
+        self._buckets = buckets
+        # Conteo por bucket (no acumulado), +Inf, suma y cantidad
+        self._values = _ShardedValues(len(buckets) + 3)
+
+    def observe(self, value: float):
+        values = self._values.shard()
+        values[bisect.bisect_left(self._buckets, value)] += 1
+        values[-2] += value
+        values[-1] += 1
+
+    def value(self) -> float:
+        return self._values.totals()[-1]
+
+    def samples(self, name: str, labels: str):
+        totals = self._values.totals()
+        prefix = labels[:-1] + "," if labels else "{"
+        cumulative = 0.0
+        for bound, count in zip(self._buckets, totals):
+            cumulative += count
+            yield f'{name}_bucket{prefix}le="{_format(bound)}"}} {_format(cumulative)}'
+        cumulative += totals[len(self._buckets)]
+        yield f'{name}_bucket{prefix}le="+Inf"}} {_format(cumulative)}'
+        yield f"{name}_sum{labels} {_format(totals[-2])}"
+        yield f"{name}_count{labels} {_format(totals[-1])}"
+
+
+class _Metric:
+    """
+    Familia de series con el mismo nombre y distintos valores de labels
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            # Sin labels la serie existe (en 0) desde el inicio
+            self.labels()
+        registry.register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """
+        Serie para esos valores de labels (creada en el primer uso)
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def total(self) -> float:
+        """
+        Suma de todas las series (cantidad de observaciones en un histograma)
+        """
+        return sum(child.value() for child in list(self._children.values()))
+
+    def collect(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for values, child in list(self._children.items()):
+            yield from child.samples(self.name, _labels(self.labelnames, values))
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1):
+        self.labels().dec(amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self, *values: str):
+        """
+        Context manager que observa la duración del bloque
+        """
+        return _Timer(self.labels(*values))
+
+
+class GaugeCallback:
+    """
+    Gauge calculado al momento del scrape: callback() -> {labels: valor}
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str],
+                 callback: Callable[[], Dict[Tuple[str, ...], float]]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        registry.register(self)
+
+    def collect(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for values, value in self.callback().items():
+            yield f"{self.name}{_labels(self.labelnames, values)} {_format(value)}"
+
+
+class _Timer:
+    __slots__ = ("_child", "_start")
+
+    def __init__(self, child: _HistogramChild):
+        self._child = child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._child.observe(time.perf_counter() - self._start)
+
+
+class Registry:
+    """
+    Métricas del proceso en el orden en que se registraron
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        """
+        Todas las métricas en el formato de texto de Prometheus
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def _format(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + "}"
+
+
+# HTTP
+HTTP_REQUESTS = Counter(
+    "dmt_http_requests_total", "HTTP requests by method, route template and status code",
+    ("method", "route", "status")
+)
+HTTP_DURATION = Histogram(
+    "dmt_http_request_duration_seconds", "HTTP request latency until the response body is sent",
+    ("method", "route")
+)
+HTTP_IN_FLIGHT = Gauge(
+    "dmt_http_requests_in_flight", "HTTP requests being processed", ("method", "route")
+)
+
+# Traducción (translation_free)
+TRANSLATION_DURATION = Histogram(
+    "dmt_translation_request_duration_seconds", "LibreTranslate call latency (kind: single or batch)",
+    ("kind",)
+)
+TRANSLATION_IN_FLIGHT = Gauge("dmt_translation_requests_in_flight", "LibreTranslate calls in progress")
+TRANSLATION_ERRORS = Counter("dmt_translation_errors_total", "Failed LibreTranslate calls", ("kind",))
+TRANSLATION_FALLBACKS = Counter(
+    "dmt_translation_fallbacks_total", "Texts returned untranslated because the call failed", ("kind",)
+)
+
+# Passwords (auth)
+PASSWORD_HASH_DURATION = Histogram(
+    "dmt_password_hash_seconds", "Password hashing time (operation: hash or verify)", ("operation",)
+)
+
+# Export CSV
+EXPORT_ROWS = Counter("dmt_export_rows_total", "DMT records written to CSV exports")
+EXPORT_DURATION = Histogram(
+    "dmt_export_duration_seconds", "CSV export time from query to generated file",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+)
+
+# Arranque del worker (main.lifespan)
+STARTUP_SECONDS = Gauge("dmt_startup_seconds", "Worker startup time by phase", ("phase",))
+
+
+def _pool_metric(field: str) -> Callable[[], Dict[Tuple[str, ...], float]]:
+    def callback():
+        from database import pool_status
+        return {(name,): pool[field] for name, pool in pool_status().items()}
+    return callback
+
+
+GaugeCallback("dmt_db_pool_checked_out", "Connections checked out of the pool", ("pool",),
+              _pool_metric("checked_out"))
+GaugeCallback("dmt_db_pool_overflow", "Overflow connections open beyond pool_size", ("pool",),
+              _pool_metric("overflow"))
+GaugeCallback("dmt_db_pool_capacity", "pool_size + max_overflow", ("pool",), _pool_metric("capacity"))
+
+
+# Segmentos numéricos (ids) normalizados para cachear la ruta por path
+_NUMERIC_SEGMENT = re.compile(r"/\d+(?=/|$)")
+_ROUTE_CACHE_MAX = 1024
+_route_cache: Dict[Tuple[str, str], str] = {}
+
+
+def route_template(scope) -> str:
+    """
+    Plantilla de la ruta (/dmt/{dmt_id}) para usar como label sin
+    cardinalidad ilimitada; "unmatched" si ninguna ruta coincide
+    """
+    key = (scope["method"], _NUMERIC_SEGMENT.sub("/0", scope["path"]))
+    template = _route_cache.get(key)
+    if template is not None:
+        return template
+
+    app = scope.get("app")
+    for route in getattr(app, "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            template = route.path
+            break
+    else:
+        return "unmatched"
+    if len(_route_cache) < _ROUTE_CACHE_MAX:
+        _route_cache[key] = template
+    return template
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI: latencia, requests en curso y status por ruta
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = route_template(scope)
+        in_flight = HTTP_IN_FLIGHT.labels(method, route)
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_DURATION.labels(method, route).observe(time.perf_counter() - start)
+            HTTP_REQUESTS.labels(method, route, str(status_code)).inc()
+            in_flight.dec()
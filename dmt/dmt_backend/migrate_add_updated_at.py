@@ -0,0 +1,90 @@
+"""
+Database Migration Script: Add DMTRecord.updated_at
+Adds the 'updated_at' column used to build ETags for DMT records.
+
+This script:
+1. Adds a nullable 'updated_at' column to the 'dmtrecord' table.
+2. Fills it with 'created_at' for existing records.
+
+IMPORTANT: Back up your database before running this script!
+
+Usage:
+    python migrate_add_updated_at.py [--force]
+"""
+
+import sys
+import argparse
+from sqlalchemy import text
+from database import engine, db_type
+
+# Tipo de columna según el motor
+DATETIME_TYPES = {
+    "postgresql": "TIMESTAMP",
+    "oracle": "TIMESTAMP",
+}
+
+
+def run_migration():
+    """
+    Applies the schema change to the 'dmtrecord' table.
+    """
+    print("\n=== Starting DMTRecord.updated_at Migration ===")
+    column_type = DATETIME_TYPES.get(db_type, "DATETIME")
+
+    with engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            print("Step 1: Adding column 'updated_at'...")
+            try:
+                conn.execute(text(f"ALTER TABLE dmtrecord ADD COLUMN updated_at {column_type}"))
+                print("✓ Column 'updated_at' added successfully.")
+            except Exception as e:
+                if "duplicate column" in str(e).lower() or "already exists" in str(e).lower():
+                    print("⚠ Column 'updated_at' already exists, skipping.")
+                    trans.rollback()
+                    trans = conn.begin()
+                else:
+                    raise
+
+            print("\nStep 2: Filling 'updated_at' from 'created_at'...")
+            result = conn.execute(text("UPDATE dmtrecord SET updated_at = created_at WHERE updated_at IS NULL"))
+            print(f"✓ {result.rowcount} records updated.")
+
+            trans.commit()
+            print("\n✓ Migration transaction committed successfully.")
+
+        except Exception as e:
+            print(f"\n✗ MIGRATION FAILED: An error occurred: {e}")
+            print("   Rolling back changes...")
+            trans.rollback()
+            sys.exit(1)
+
+
+def main():
+    """
+    Main migration function.
+    """
+    parser = argparse.ArgumentParser(description='Add updated_at column to DMT records.')
+    parser.add_argument('--force', action='store_true', help='Force migration without interactive prompt.')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("DMT DATABASE MIGRATION: Add DMTRecord.updated_at")
+    print("=" * 60)
+
+    if not args.force:
+        print("\n⚠ IMPORTANT: Make sure you have backed up your database!")
+        response = input("\nDo you want to proceed with the migration? (yes/no): ")
+        if response.lower() != 'yes':
+            print("Migration cancelled.")
+            sys.exit(0)
+
+    run_migration()
+
+    print("\n" + "=" * 60)
+    print("✓ UPDATED_AT MIGRATION COMPLETED SUCCESSFULLY!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -89,6 +89,8 @@ class DMTRecordBase(SQLModel):
 
     is_closed: bool = Field(default=False)
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    # Se actualiza en cada modificación (usado para ETags)
+    updated_at: Optional[datetime] = Field(default_factory=datetime.utcnow)
     created_by_id: int = Field(foreign_key="user.id")
 
     report_number: Optional[str] = Field(default=None, max_length=100)
@@ -144,6 +146,9 @@ class DMTRecordBase(SQLModel):
 
 
 class DMTRecord(DMTRecordBase, table=True):
+    # Ids reservados por id_blocks.dmt_ids: en PostgreSQL salen de la secuencia
+    # SERIAL de esta columna; en SQLite y MySQL el autoincrement no conoce los
+    # ids reservados, así que todo INSERT debe tomar el id de id_blocks
     id: Optional[int] = Field(default=None, primary_key=True)
 
     # Explicitly specify which foreign key to use (created_by_id, not approved_by_id)
@@ -163,3 +168,35 @@ class DMTRecord(DMTRecordBase, table=True):
 
     final_disposition: Optional[Disposition] = Relationship()
     failure_code: Optional[FailureCode] = Relationship()
+
+
+# ---------------------------------------------------
+# ID BLOCKS (see id_blocks.py)
+# ---------------------------------------------------
+class IdSequence(SQLModel, table=True):
+    # Siguiente id libre por tabla; los procesos reservan bloques de ids
+    name: str = Field(primary_key=True, max_length=100)
+    next_value: int
+
+
+# ---------------------------------------------------
+# CACHE INVALIDATION BUS (see invalidation.py)
+# ---------------------------------------------------
+class CacheVersion(SQLModel, table=True):
+    # Versión global por nombre del cache de catálogos; cada escritura la incrementa
+    name: str = Field(primary_key=True, max_length=100)
+    version: int = Field(default=0)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+# ---------------------------------------------------
+# DMT LIVE FEED (see dmt_events.py)
+# ---------------------------------------------------
+class DMTEvent(SQLModel, table=True):
+    # Cambio de un DMT record (created, updated, closed, deleted), escrito en la
+    # misma transacción; los workers leen las filas nuevas y las envían por SSE
+    id: Optional[int] = Field(default=None, primary_key=True)
+    kind: str = Field(max_length=20)
+    record_id: int
+    payload: str = Field(sa_column=Column(Text, nullable=False))
+    created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -0,0 +1,499 @@
+"""
+On-demand request profiling (sampling, wall clock)
+
+A request is profiled when:
+- it carries `X-Profile: 1` or the query parameter `_profile=1` and its
+  bearer token belongs to an Admin (checked with deps.role_required), or
+- the rolling mode is on: N randomly chosen requests per minute
+  (PUT /admin/profiling, changeable without a restart)
+
+A sampler thread takes a stack every PROFILE_INTERVAL_MS while profiled
+requests are running. Each sample follows the request's asyncio task:
+- task running on the event loop: the loop thread's stack (joined across
+  the greenlets SQLAlchemy's async layer runs ORM code in)
+- task suspended: the coroutine chain it is awaiting in, plus the stack of
+  the threadpool worker running a call made from this request
+  (run_in_threadpool copies the request context, which identifies it),
+  or an "[await]" leaf (DB driver, network, sleep)
+
+so the profile shows where the wall-clock time of that one request went
+(translation in the threadpool, DB awaits, serialization), not what other
+requests were doing. Finished profiles are kept in memory and served by
+GET /admin/profiles/{id} (call tree), .../flamegraph.svg and .../collapsed
+(folded stacks for speedscope or flamegraph.pl). The response of a
+profiled request carries X-Profile-Id.
+
+Configuration (environment variables):
+    PROFILE_INTERVAL_MS          Sampling interval (default: 5)
+    PROFILE_MAX_STORED           Profiles kept in memory (default: 50)
+    PROFILE_REQUESTS_PER_MINUTE  Initial rolling mode rate, 0 = off (default: 0)
+"""
+
+import asyncio
+import contextvars
+import html
+import itertools
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import zlib
+from collections import Counter, deque
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from fastapi import HTTPException
+from deps import get_current_user, role_required
+from database import async_session_factory
+
+logger = logging.getLogger(__name__)
+
+try:
+    import greenlet
+except ImportError:  # solo lo usa SQLAlchemy async
+    greenlet = None
+
+try:
+    from anyio._backends._asyncio import WorkerThread
+    _WORKER_RUN_CODE = WorkerThread.run.__code__
+except (ImportError, AttributeError):  # otra versión de anyio: sin seguimiento del threadpool
+    _WORKER_RUN_CODE = None
+
+# Un worker en estas funciones está ocioso (su variable context es la de la llamada anterior)
+_WORKER_IDLE_CODES = (
+    queue.Queue.get.__code__,
+    queue.Queue.task_done.__code__,
+    asyncio.BaseEventLoop.call_soon_threadsafe.__code__,
+)
+
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_STORED = int(os.getenv("PROFILE_MAX_STORED", "50"))
+PROFILE_REQUESTS_PER_MINUTE = int(os.getenv("PROFILE_REQUESTS_PER_MINUTE", "0"))
+
+# Frames por muestra (los más externos se descartan)
+STACK_LIMIT = 200
+
+# Hoja de una muestra con la tarea esperando algo que no es el threadpool
+AWAIT_FRAME = "[await]"
+
+# Rutas que nunca se perfilan en el modo aleatorio
+EXCLUDED_PREFIXES = ("/admin/profil", "/metrics")
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+_active_profile: contextvars.ContextVar[Optional["RequestProfile"]] = contextvars.ContextVar(
+    "active_profile", default=None
+)
+
+_labels: Dict[object, str] = {}
+
+
+def _frame_label(code) -> str:
+    """
+    función (archivo:línea de def), con el archivo relativo a la app o a sys.path
+    """
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        if filename.startswith(APP_ROOT):
+            filename = os.path.relpath(filename, APP_ROOT)
+        else:
+            roots = [path for path in sys.path if path and filename.startswith(path)]
+            if roots:
+                filename = os.path.relpath(filename, max(roots, key=len))
+        label = _labels[code] = f"{code.co_name} ({filename}:{code.co_firstlineno})"
+    return label
+
+
+def _thread_stack(frame, stop_frame=None) -> Tuple[List[str], bool]:
+    """
+    Labels del frame más externo al más interno, desde stop_frame;
+    indica si stop_frame se encontró
+    """
+    labels = []
+    found = False
+    while frame is not None and len(labels) < STACK_LIMIT:
+        labels.append(_frame_label(frame.f_code))
+        if frame is stop_frame:
+            found = True
+            break
+        frame = frame.f_back
+    labels.reverse()
+    return labels, found
+
+
+def _coroutine_stack(coro) -> List[str]:
+    """
+    Labels de la cadena de coroutines que la tarea suspendida está esperando
+    """
+    labels = []
+    while coro is not None and len(labels) < STACK_LIMIT:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        labels.append(_frame_label(frame.f_code))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return labels
+
+
+class RequestProfile:
+    """
+    Muestras de un request perfilado
+    """
+
+    def __init__(self, profile_id: int, method: str, path: str, trigger: str,
+                 loop: asyncio.AbstractEventLoop, task: asyncio.Task):
+        self.id = profile_id
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self.started_at = datetime.utcnow()
+        self.loop = loop
+        self.task = task
+        self.thread_id = threading.get_ident()
+        self.root_frame = task.get_coro().cr_frame
+        self.main_greenlet = greenlet.getcurrent() if greenlet is not None else None
+        self.status_code: Optional[int] = None
+        self.duration_ms = 0.0
+        self.stacks: Counter = Counter()
+        self.samples = 0
+
+    def sample(self, frames: Dict[int, object]):
+        """
+        Una muestra (hilo del sampler)
+        """
+        # Copias locales: finish() puede soltar las referencias durante la muestra
+        task, loop = self.task, self.loop
+        root_frame, main_greenlet = self.root_frame, self.main_greenlet
+        if task is None or task.done():
+            return
+        if asyncio.current_task(loop) is task:
+            stack, found = _thread_stack(frames.get(self.thread_id), root_frame)
+            outer = main_greenlet.gr_frame if main_greenlet is not None else None
+            if not found and outer is not None:
+                # Dentro de un greenlet de SQLAlchemy async: su stack no enlaza con el
+                # de la tarea, que está en el greenlet principal (suspendido en greenlet_spawn)
+                stack = _thread_stack(outer, root_frame)[0] + stack
+        else:
+            stack = _coroutine_stack(task.get_coro())
+            workers = self._worker_stacks(frames)
+            if workers:
+                for worker in workers:
+                    self.stacks[";".join(stack + worker)] += 1
+                self.samples += 1
+                return
+            stack.append(AWAIT_FRAME)
+        if stack:
+            self.stacks[";".join(stack)] += 1
+            self.samples += 1
+
+    def _worker_stacks(self, frames: Dict[int, object]) -> List[List[str]]:
+        """
+        Stacks de los hilos del threadpool que ejecutan una llamada de este request
+        """
+        if _WORKER_RUN_CODE is None:
+            return []
+        stacks = []
+        for thread_id, leaf in frames.items():
+            if thread_id == self.thread_id:
+                continue
+            frame, below = leaf, None
+            while frame is not None and frame.f_code is not _WORKER_RUN_CODE:
+                frame, below = frame.f_back, frame
+            if frame is None or below is None or below.f_code in _WORKER_IDLE_CODES:
+                continue
+            context = frame.f_locals.get("context")
+            if isinstance(context, contextvars.Context) and context.get(_active_profile) is self:
+                stacks.append(_thread_stack(leaf, below)[0])
+        return stacks
+
+    def finish(self):
+        """
+        Soltar la tarea y sus frames al terminar: un perfil guardado no debe
+        mantener vivos la sesión, los objetos ORM ni el body del request
+        """
+        self.task = None
+        self.loop = None
+        self.root_frame = None
+        self.main_greenlet = None
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "trigger": self.trigger,
+            "started_at": self.started_at.isoformat(),
+            "status_code": self.status_code,
+            "duration_ms": round(self.duration_ms, 1),
+            "samples": self.samples,
+            "interval_ms": PROFILE_INTERVAL_MS,
+        }
+
+    def collapsed(self) -> str:
+        """
+        Stacks en formato folded (una línea "a;b;c conteo" por stack)
+        """
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def call_tree(self, min_share: float = 0.005) -> dict:
+        """
+        Árbol de llamadas con muestras totales y propias por nodo;
+        se omiten los nodos con menos de min_share de las muestras
+        """
+        root = _tree_from_stacks(self.stacks)
+        threshold = max(1, int(root["samples"] * min_share))
+        return _prune(root, threshold, root["samples"])
+
+    def flamegraph_svg(self) -> str:
+        return _render_flamegraph(_tree_from_stacks(self.stacks), f"{self.method} {self.path}")
+
+
+def _tree_from_stacks(stacks: Counter) -> dict:
+    root = {"name": "all", "samples": 0, "self": 0, "children": {}}
+    for stack, count in stacks.items():
+        root["samples"] += count
+        node = root
+        for label in stack.split(";"):
+            child = node["children"].get(label)
+            if child is None:
+                child = node["children"][label] = {"name": label, "samples": 0, "self": 0, "children": {}}
+            child["samples"] += count
+            node = child
+        node["self"] += count
+    return root
+
+
+def _prune(node: dict, threshold: int, total: int) -> dict:
+    children = sorted(node["children"].values(), key=lambda child: child["samples"], reverse=True)
+    return {
+        "name": node["name"],
+        "samples": node["samples"],
+        "self": node["self"],
+        "percent": round(100 * node["samples"] / total, 1) if total else 0.0,
+        "children": [_prune(child, threshold, total) for child in children if child["samples"] >= threshold],
+    }
+
+
+# Dimensiones del SVG del flame graph
+FLAME_WIDTH = 1200
+FLAME_ROW = 17
+FLAME_MIN_WIDTH = 0.5
+
+
+def _render_flamegraph(root: dict, title: str) -> str:
+    """
+    Flame graph SVG autocontenido (raíz abajo, ancho proporcional a las muestras)
+    """
+    total = root["samples"] or 1
+    rects = []
+    depth_max = 0
+
+    def walk(node, x, depth):
+        nonlocal depth_max
+        width = FLAME_WIDTH * node["samples"] / total
+        if width < FLAME_MIN_WIDTH:
+            return
+        depth_max = max(depth_max, depth)
+        rects.append((x, depth, width, node))
+        child_x = x
+        for child in sorted(node["children"].values(), key=lambda child: child["name"]):
+            walk(child, child_x, depth + 1)
+            child_x += FLAME_WIDTH * child["samples"] / total
+
+    walk(root, 0.0, 0)
+    height = (depth_max + 1) * FLAME_ROW + 40
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{FLAME_WIDTH}" height="{height}" '
+        f'font-family="monospace" font-size="11">',
+        f'<text x="4" y="16" font-size="13">{html.escape(title)} ({root["samples"]} samples)</text>',
+    ]
+    for x, depth, width, node in rects:
+        y = height - (depth + 1) * FLAME_ROW
+        name = node["name"]
+        hue = 0 if name == AWAIT_FRAME else 10 + zlib.crc32(name.encode()) % 50
+        percent = 100 * node["samples"] / total
+        chars = int(width / 7)
+        text = name if len(name) <= chars else name[:max(0, chars - 2)] + ".."
+        parts.append(
+            f'<g><title>{html.escape(name)} ({node["samples"]} samples, {percent:.1f}%)</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{width:.1f}" height="{FLAME_ROW - 1}" '
+            f'fill="hsl({hue},80%,60%)" rx="2"/>'
+            + (f'<text x="{x + 3:.1f}" y="{y + 12}">{html.escape(text)}</text>' if chars >= 3 else "")
+            + "</g>"
+        )
+    parts.append("</svg>")
+    return "\n".join(parts)
+
+
+class Profiler:
+    """
+    Requests perfilados en curso, el hilo que los muestrea y los perfiles guardados
+    """
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self._active: Dict[int, RequestProfile] = {}
+        self._stored: deque = deque(maxlen=PROFILE_MAX_STORED)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.requests_per_minute = PROFILE_REQUESTS_PER_MINUTE
+        # Ventana del modo aleatorio
+        self._window_start = time.monotonic()
+        self._window_requests = 0
+        self._window_profiled = 0
+        self._last_window_requests = 0
+
+    def pick_random(self, path: str) -> bool:
+        """
+        ¿Perfilar este request en el modo aleatorio? (hasta N por minuto,
+        con probabilidad N / requests del minuto anterior)
+        """
+        if self.requests_per_minute <= 0 or path.startswith(EXCLUDED_PREFIXES):
+            return False
+        now = time.monotonic()
+        if now - self._window_start >= 60:
+            self._last_window_requests = self._window_requests
+            self._window_start, self._window_requests, self._window_profiled = now, 0, 0
+        self._window_requests += 1
+        if self._window_profiled >= self.requests_per_minute:
+            return False
+        expected = max(self._last_window_requests, self._window_requests, 1)
+        if random.random() < self.requests_per_minute / expected:
+            self._window_profiled += 1
+            return True
+        return False
+
+    def begin(self, method: str, path: str, trigger: str) -> RequestProfile:
+        """
+        Empezar a muestrear el request actual (llamado desde su tarea)
+        """
+        profile = RequestProfile(
+            next(self._ids), method, path, trigger, asyncio.get_running_loop(), asyncio.current_task()
+        )
+        with self._lock:
+            self._active[profile.id] = profile
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+        return profile
+
+    def end(self, profile: RequestProfile):
+        profile.finish()
+        with self._lock:
+            self._active.pop(profile.id, None)
+            self._stored.appendleft(profile)
+
+    def _run(self):
+        interval = PROFILE_INTERVAL_MS / 1000
+        while True:
+            with self._lock:
+                active = list(self._active.values())
+                if not active:
+                    self._thread = None
+                    return
+            frames = sys._current_frames()
+            for profile in active:
+                try:
+                    profile.sample(frames)
+                except Exception:
+                    # La tarea cambió de estado durante la muestra: se descarta
+                    pass
+            del frames
+            time.sleep(interval)
+
+    def get(self, profile_id: int) -> Optional[RequestProfile]:
+        with self._lock:
+            return next((profile for profile in self._stored if profile.id == profile_id), None)
+
+    def summaries(self) -> List[dict]:
+        with self._lock:
+            return [profile.summary() for profile in self._stored]
+
+    def clear(self):
+        with self._lock:
+            self._stored.clear()
+
+
+profiler = Profiler()
+
+
+def _profile_flag(scope) -> Tuple[bool, Optional[str]]:
+    """
+    (pidió perfil, bearer token) a partir de X-Profile / _profile=1
+    """
+    requested, token = False, None
+    for name, value in scope.get("headers", ()):
+        if name == b"x-profile" and value.strip() in (b"1", b"true"):
+            requested = True
+        elif name == b"authorization" and value[:7].lower() == b"bearer ":
+            token = value[7:].decode("latin-1").strip()
+    if not requested:
+        query = scope.get("query_string", b"")
+        requested = b"_profile=1" in query.split(b"&")
+    return requested, token
+
+
+async def _is_admin(token: Optional[str]) -> bool:
+    """
+    El token pertenece a un Admin (mismas dependencias que los endpoints)
+    """
+    if not token:
+        return False
+    try:
+        async with async_session_factory() as session:
+            user = await get_current_user(token, session)
+        await role_required(["Admin"])(user)
+        return True
+    except HTTPException:
+        return False
+    except Exception as e:
+        # Error de la base de datos: el request se atiende sin perfilar
+        logger.warning("Could not check X-Profile permission: %s: %s", type(e).__name__, e)
+        return False
+
+
+class ProfilingMiddleware:
+    """
+    Middleware ASGI: perfila los requests pedidos por un Admin y los del modo aleatorio
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trigger = None
+        requested, token = _profile_flag(scope)
+        if requested and await _is_admin(token):
+            trigger = "flag"
+        elif profiler.pick_random(scope["path"]):
+            trigger = "random"
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile = profiler.begin(scope["method"], scope["path"], trigger)
+
+        async def send_with_profile(message):
+            if message["type"] == "http.response.start":
+                profile.status_code = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (b"x-profile-id", str(profile.id).encode("latin-1")),
+                ]
+            await send(message)
+
+        context_token = _active_profile.set(profile)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            profile.duration_ms = (time.perf_counter() - start) * 1000
+            _active_profile.reset(context_token)
+            profiler.end(profile)
@@ -0,0 +1,270 @@
+"""
+Read-replica routing for the async API sessions
+
+Read-only requests get a session bound to one of the configured replicas,
+chosen round-robin among the healthy ones. A background task checks each
+replica every REPLICA_HEALTH_INTERVAL seconds (connectivity plus
+replication lag where the database exposes it); a replica that fails the
+check or lags more than REPLICA_MAX_LAG_SECONDS is skipped until it
+recovers, and reads fall back to the primary when none is usable.
+
+Read-your-writes: a commit on a write session gives the response a signed
+token with the end of the window (cookie dmt_rw and header
+X-Read-Your-Writes) and reads that bring a valid token back go to the
+primary for READ_YOUR_WRITES_SECONDS. The window travels with the client,
+so it holds whichever worker serves the next request; browsers return the
+cookie on their own, other clients echo the header. The token only moves
+reads to the primary, and it is signed with SECRET_KEY and capped at the
+window so a client can't pin its reads there. Workers compare it with
+their wall clock (hosts are expected to run NTP).
+
+Configuration (environment variables):
+    DATABASE_REPLICA_URLS     Comma-separated replica URLs (default: none)
+    REPLICA_HEALTH_INTERVAL   Seconds between health checks (default: 5)
+    REPLICA_MAX_LAG_SECONDS   Maximum acceptable lag (default: 5)
+    READ_YOUR_WRITES_SECONDS  Primary-only window after a write (default: 5)
+"""
+
+import asyncio
+import hashlib
+import hmac
+import itertools
+import logging
+import os
+import time
+from datetime import datetime
+from typing import List, Optional
+from sqlalchemy import text
+from auth import SECRET_KEY
+
+logger = logging.getLogger(__name__)
+
+DATABASE_REPLICA_URLS = [
+    url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()
+]
+REPLICA_HEALTH_INTERVAL = float(os.getenv("REPLICA_HEALTH_INTERVAL", "5"))
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+# Consulta de lag (segundos) por tipo de base de datos
+# PostgreSQL: 0 si la réplica ya aplicó todo lo recibido (evita falsos positivos sin escrituras)
+LAG_QUERIES = {
+    "postgresql": (
+        "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+    ),
+    "mysql": "SHOW SLAVE STATUS",
+    "mariadb": "SHOW SLAVE STATUS",
+}
+
+# Token read-your-writes en la respuesta de una escritura y en las lecturas siguientes
+READ_YOUR_WRITES_COOKIE = "dmt_rw"
+READ_YOUR_WRITES_HEADER = "x-read-your-writes"
+
+
+class Replica:
+    """
+    Una réplica: engine, session factory y estado del último health check
+    """
+
+    def __init__(self, name: str, engine, session_factory):
+        self.name = name
+        self.engine = engine
+        self.session_factory = session_factory
+        self.healthy = False
+        self.lag: Optional[float] = None
+        self.last_check: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+
+    async def check(self, max_lag: float):
+        """
+        Verificar conectividad y lag; actualiza healthy
+        """
+        dialect = self.engine.dialect.name
+        try:
+            async with self.engine.connect() as conn:
+                query = LAG_QUERIES.get(dialect)
+                if query is None:
+                    await conn.execute(text("SELECT 1"))
+                    lag = 0.0
+                elif dialect == "postgresql":
+                    lag = float((await conn.execute(text(query))).scalar() or 0)
+                else:
+                    row = (await conn.execute(text(query))).mappings().first()
+                    value = None
+                    if row is not None:
+                        value = row.get("Seconds_Behind_Master", row.get("Seconds_Behind_Source"))
+                    # NULL = la replicación está detenida
+                    lag = float(value) if value is not None else float("inf")
+            self.lag = lag
+            self.last_error = None
+            self.healthy = lag <= max_lag
+        except Exception as e:
+            self.lag = None
+            self.last_error = f"{type(e).__name__}: {e}"
+            self.healthy = False
+        self.last_check = datetime.utcnow()
+
+    def status(self) -> dict:
+        return {
+            "name": self.name,
+            "url": self.engine.url.render_as_string(hide_password=True),
+            "healthy": self.healthy,
+            "lag_seconds": self.lag,
+            "last_check": self.last_check.isoformat() if self.last_check else None,
+            "last_error": self.last_error,
+        }
+
+
+class ReplicaRouter:
+    """
+    Elige la session factory para lecturas (réplica o primario)
+    """
+
+    def __init__(
+        self,
+        replicas: List[Replica],
+        health_interval: float = REPLICA_HEALTH_INTERVAL,
+        max_lag: float = REPLICA_MAX_LAG_SECONDS,
+        read_your_writes_seconds: float = READ_YOUR_WRITES_SECONDS
+    ):
+        self.replicas = replicas
+        self.health_interval = health_interval
+        self.max_lag = max_lag
+        self.read_your_writes_seconds = read_your_writes_seconds
+        self._counter = itertools.count()
+        self._task: Optional[asyncio.Task] = None
+        self.reads_replica = 0
+        self.reads_primary = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    def write_token(self) -> str:
+        """
+        Token firmado con el fin de la ventana read-your-writes (después de un commit)
+        """
+        expires = str(int((time.time() + self.read_your_writes_seconds) * 1000))
+        return f"{expires}.{_sign(expires)}"
+
+    def wrote_recently(self, token: Optional[str]) -> bool:
+        """
+        True si el token es válido y su ventana read-your-writes sigue abierta
+        """
+        if not token:
+            return False
+        expires, _, signature = token.partition(".")
+        if not expires.isdigit() or not hmac.compare_digest(signature, _sign(expires)):
+            return False
+        remaining = int(expires) / 1000 - time.time()
+        return 0 < remaining <= self.read_your_writes_seconds + 1
+
+    def read_session_factory(self, token: Optional[str] = None):
+        """
+        Session factory de una réplica sana (round-robin) o None para usar el primario
+        """
+        if not self.enabled or self.wrote_recently(token):
+            self.reads_primary += 1
+            return None
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            self.reads_primary += 1
+            return None
+        self.reads_replica += 1
+        return healthy[next(self._counter) % len(healthy)].session_factory
+
+    async def check_all(self):
+        """
+        Health check de todas las réplicas
+        """
+        await asyncio.gather(*(replica.check(self.max_lag) for replica in self.replicas))
+        for replica in self.replicas:
+            if not replica.healthy:
+                logger.warning("Replica %s unavailable (lag=%s, error=%s)",
+                               replica.name, replica.lag, replica.last_error)
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await self.check_all()
+
+    async def start(self):
+        """
+        Primer health check y tarea periódica (lifespan)
+        """
+        if not self.enabled or self._task is not None:
+            return
+        await self.check_all()
+        self._task = asyncio.get_running_loop().create_task(self._health_loop(), name="replica-health")
+
+    async def stop(self):
+        """
+        Detener los health checks y cerrar los pools de las réplicas
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    def status(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "max_lag_seconds": self.max_lag,
+            "read_your_writes_seconds": self.read_your_writes_seconds,
+            "reads_replica": self.reads_replica,
+            "reads_primary": self.reads_primary,
+            "replicas": [replica.status() for replica in self.replicas],
+        }
+
+
+def _sign(value: str) -> str:
+    return hmac.new(SECRET_KEY.encode("utf-8"), f"rw:{value}".encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+
+def read_your_writes_token(request) -> Optional[str]:
+    """
+    Token read-your-writes de la request (cookie o header)
+    """
+    return request.cookies.get(READ_YOUR_WRITES_COOKIE) or request.headers.get(READ_YOUR_WRITES_HEADER)
+
+
+class ReadYourWritesMiddleware:
+    """
+    Middleware ASGI: agrega el token read-your-writes (cookie y header) a la
+    respuesta de una request cuya sesión de escritura hizo commit
+    """
+
+    def __init__(self, app, router: ReplicaRouter):
+        self.app = app
+        self.router = router
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.router.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        # request.state de los endpoints guarda los atributos en este dict
+        state = scope.setdefault("state", {})
+
+        async def send_with_token(message):
+            if message["type"] == "http.response.start":
+                token = state.get("read_your_writes")
+                if token:
+                    max_age = int(self.router.read_your_writes_seconds) + 1
+                    cookie = (
+                        f"{READ_YOUR_WRITES_COOKIE}={token}; Max-Age={max_age}; "
+                        "Path=/; HttpOnly; SameSite=Lax"
+                    )
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"set-cookie", cookie.encode("latin-1")),
+                        (READ_YOUR_WRITES_HEADER.encode("latin-1"), token.encode("latin-1")),
+                    ]
+            await send(message)
+
+        await self.app(scope, receive, send_with_token)
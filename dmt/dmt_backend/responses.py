@@ -0,0 +1,44 @@
+"""
+JSON serialization for API responses
+
+Uses orjson when it is installed (several times faster than the standard
+json module on large /dmt/ pages) and falls back to the standard library
+otherwise. Both produce UTF-8 without escaping non-ASCII text, so Chinese
+and Spanish descriptions are not inflated to \\uXXXX sequences.
+"""
+
+import json
+from typing import Any, Iterable, Type
+from pydantic import BaseModel
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional
+    orjson = None
+
+
+def dumps(data: Any) -> bytes:
+    """
+    Serializar a JSON compacto en UTF-8
+    """
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dump_models(schema: Type[BaseModel], objects: Iterable) -> bytes:
+    """
+    Lista de objetos ORM validados con `schema` y serializados
+    (mismo JSON que FastAPI genera con response_model=List[schema])
+    """
+    return dumps([schema.model_validate(obj).model_dump(mode="json") for obj in objects])
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    Response class por defecto de la API (orjson si está disponible)
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
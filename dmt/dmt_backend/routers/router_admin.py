@@ -0,0 +1,224 @@
+from anyio import to_thread
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import PlainTextResponse
+from deps import role_required
+from loop_monitor import loop_monitor
+from sql_monitor import sql_monitor
+from database import replica_router, pool_status
+from cache import catalog_cache
+from invalidation import cache_bus
+from catalog_snapshot import catalog_snapshot
+from admission import admission
+from coalesce import single_flight
+from dmt_events import dmt_feed
+from translation_free import translation_status
+from tracing import TracedRoute
+from profiler import profiler, RequestProfile
+from schemas import ProfilingSettings
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["Admin"],
+    dependencies=[Depends(role_required(["Admin"]))],
+    route_class=TracedRoute
+)
+
+
+@router.get("/loop")
+async def get_loop_stats():
+    """
+    Lag del event loop: histograma, stalls recientes con stack trace
+    y offenders agrupados por ubicación en el código
+    Solo Admin
+    """
+    return loop_monitor.snapshot()
+
+
+@router.delete("/loop", status_code=status.HTTP_204_NO_CONTENT)
+async def reset_loop_stats():
+    """
+    Reiniciar las estadísticas del monitor del event loop
+    Solo Admin
+    """
+    loop_monitor.reset()
+
+
+@router.get("/sql")
+async def get_sql_stats(top: int = Query(20, ge=1, le=500)):
+    """
+    Estadísticas de SQL: sentencias más costosas, slow queries
+    (con la forma de los parámetros) y patrones N+1 detectados
+    Solo Admin
+    """
+    return sql_monitor.snapshot(top)
+
+
+@router.delete("/sql", status_code=status.HTTP_204_NO_CONTENT)
+async def reset_sql_stats():
+    """
+    Reiniciar las estadísticas de SQL
+    Solo Admin
+    """
+    sql_monitor.reset()
+
+
+@router.get("/replicas")
+async def get_replica_status():
+    """
+    Estado de las réplicas de lectura (salud, lag, lecturas enrutadas)
+    Solo Admin
+    """
+    return replica_router.status()
+
+
+@router.get("/cache")
+async def get_cache_status():
+    """
+    Cache de catálogos de este worker (versión y páginas por nombre),
+    estado del bus de invalidación entre workers y del snapshot compartido
+    Solo Admin
+    """
+    return {
+        "catalogs": {
+            name: {"version": version, "entries": entries}
+            for name, (version, entries) in catalog_cache.stats().items()
+        },
+        "bus": cache_bus.status(),
+        "snapshot": catalog_snapshot.status(),
+    }
+
+
+@router.get("/admission")
+async def get_admission_status():
+    """
+    Control de admisión: slots en uso, cola, duración promedio, admitidos y
+    rechazados (503) por clase de request
+    Solo Admin
+    """
+    return admission.status()
+
+
+@router.get("/coalescing")
+async def get_coalescing_status():
+    """
+    Lecturas coalescidas por ruta: requests, consultas ejecutadas, requests
+    que compartieron una consulta en curso y proporción deduplicada
+    Solo Admin
+    """
+    return single_flight.status()
+
+
+@router.delete("/coalescing", status_code=status.HTTP_204_NO_CONTENT)
+async def reset_coalescing_stats():
+    """
+    Reiniciar los contadores de coalescing
+    Solo Admin
+    """
+    single_flight.reset()
+
+
+@router.get("/feed")
+async def get_feed_status():
+    """
+    Feed en vivo de DMT records: streams abiertos, último evento leído,
+    eventos en el buffer de reconexión y desconexiones
+    Solo Admin
+    """
+    return dmt_feed.status()
+
+
+@router.get("/saturation")
+async def get_saturation():
+    """
+    Indicadores de saturación en este momento (pruebas de carga): cola del
+    threadpool, conexiones en uso por pool y llamadas a LibreTranslate en curso
+    Son por proceso (worker)
+    Solo Admin
+    """
+    limiter = to_thread.current_default_thread_limiter()
+    stats = limiter.statistics()
+    return {
+        "threadpool": {
+            "total": limiter.total_tokens,
+            "busy": stats.borrowed_tokens,
+            "waiting": stats.tasks_waiting,
+        },
+        "db_pools": pool_status(),
+        "translation": translation_status(),
+    }
+
+
+@router.get("/profiling", response_model=ProfilingSettings)
+async def get_profiling_settings():
+    """
+    Modo de perfilado aleatorio: requests perfilados por minuto (0 = apagado)
+    Solo Admin
+    """
+    return ProfilingSettings(requests_per_minute=profiler.requests_per_minute)
+
+
+@router.put("/profiling", response_model=ProfilingSettings)
+async def update_profiling_settings(settings: ProfilingSettings):
+    """
+    Cambiar el modo de perfilado aleatorio sin reiniciar (por proceso / worker)
+    Solo Admin
+    """
+    profiler.requests_per_minute = settings.requests_per_minute
+    return settings
+
+
+@router.get("/profiles")
+async def list_profiles():
+    """
+    Perfiles guardados, el más reciente primero
+    (un request con X-Profile: 1 o _profile=1 de un Admin se perfila)
+    Solo Admin
+    """
+    return profiler.summaries()
+
+
+@router.delete("/profiles", status_code=status.HTTP_204_NO_CONTENT)
+async def clear_profiles():
+    """
+    Descartar los perfiles guardados
+    Solo Admin
+    """
+    profiler.clear()
+
+
+def _get_profile(profile_id: int) -> RequestProfile:
+    profile = profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Profile {profile_id} not found"
+        )
+    return profile
+
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(profile_id: int, min_share: float = Query(0.005, ge=0, le=1)):
+    """
+    Resumen y árbol de llamadas (muestras totales y propias por función)
+    Solo Admin
+    """
+    profile = _get_profile(profile_id)
+    return {**profile.summary(), "call_tree": profile.call_tree(min_share)}
+
+
+@router.get("/profiles/{profile_id}/flamegraph.svg")
+async def get_profile_flamegraph(profile_id: int):
+    """
+    Flame graph SVG del request
+    Solo Admin
+    """
+    return Response(_get_profile(profile_id).flamegraph_svg(), media_type="image/svg+xml")
+
+
+@router.get("/profiles/{profile_id}/collapsed", response_class=PlainTextResponse)
+async def get_profile_collapsed(profile_id: int):
+    """
+    Stacks en formato folded (speedscope, flamegraph.pl)
+    Solo Admin
+    """
+    return _get_profile(profile_id).collapsed()
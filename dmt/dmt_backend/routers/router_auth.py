@@ -1,19 +1,20 @@
 from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlmodel import Session
-from database import get_session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from database import get_async_primary_session
 from schemas import Token
-from crud.crud_user import authenticate_user
+from crud.crud_user_async import authenticate_user
 from auth import create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
+from tracing import TracedRoute
 
-router = APIRouter(prefix="/auth", tags=["Authentication"])
+router = APIRouter(prefix="/auth", tags=["Authentication"], route_class=TracedRoute)
 
 
 @router.post("/token")
-def login(
+async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_primary_session)
 ):
     """
     OAuth2 Login:
@@ -21,7 +22,7 @@ def login(
     password = user's password
     Returns JWT + user info for PHP session.
     """
-    user = authenticate_user(session, form_data.username, form_data.password)
+    user = await authenticate_user(session, form_data.username, form_data.password)
 
     if not user:
         raise HTTPException(
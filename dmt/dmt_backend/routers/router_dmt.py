@@ -1,26 +1,58 @@
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from datetime import datetime, timedelta
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Body, Depends, HTTPException, status, Query, Request, Response
 from fastapi.responses import StreamingResponse
-from sqlmodel import Session
-from database import get_session
-from schemas import DMTRecordCreate, DMTRecordRead, DMTRecordUpdate
-from crud.crud_dmt import (
-    create_dmt, get_dmt_by_id, list_dmt, update_dmt_partial_with_field_control
+from pydantic import ValidationError
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from database import (
+    get_async_session, get_async_write_session, read_class, release_connection, shared_read_session
+)
+from schemas import DMTRecordCreate, DMTRecordRead, DMTRecordUpdate, DMTBulkItemResult, DMTBulkResult
+from crud.crud_dmt_async import (
+    create_dmt, get_dmt_by_id, list_dmt, update_dmt_partial_with_field_control,
+    get_dmt_version, list_dmt_versions, delete_dmt, get_users_by_ids,
+    create_dmt_bulk, find_missing_references, DMT_BULK_MAX_ITEMS
+)
+from responses import dump_models
+from http_cache import (
+    DMT_RECORD_CACHE_CONTROL, DMT_EXPORT_CACHE_CONTROL,
+    row_etag, rows_etag, if_none_match, has_conditional, not_modified, set_validators
 )
 from deps import get_current_user, role_required
 from models import User
+from metrics import EXPORT_ROWS, EXPORT_DURATION
 import csv
 import io
-
-router = APIRouter(prefix="/dmt", tags=["DMT Records"])
+import time
+from tracing import TracedRoute
+from cache import USERS_KEY
+from catalog_snapshot import CatalogSnapshot, catalog_snapshot
+from coalesce import single_flight
+from dmt_events import EventFilter, dmt_feed
+
+router = APIRouter(prefix="/dmt", tags=["DMT Records"], route_class=TracedRoute)
+
+# Catálogos del CSV: relación de DMTRecord -> nombre del catálogo (snapshot)
+EXPORT_CATALOGS = {
+    "part_number": "partnumber",
+    "work_center": "workcenter",
+    "customer": "customer",
+    "level": "level",
+    "area": "area",
+    "prepared_by": "preparedby",
+    "inspection_item": "inspectionitem",
+    "process_code": "processcode",
+    "final_disposition": "disposition",
+    "failure_code": "failurecode",
+}
 
 
 @router.post("/", response_model=DMTRecordRead, status_code=status.HTTP_201_CREATED)
-def create_dmt_record(
+async def create_dmt_record(
     dmt_data: DMTRecordCreate,
     language: str = Query('en', description="Input language code (en, es, zh)"),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_write_session),
     current_user: User = Depends(role_required(["Inspector"]))
 ):
     """
@@ -33,12 +65,77 @@ def create_dmt_record(
     Args:
         language: Language of input text (en, es, zh). Text will be auto-translated to all 3 languages.
     """
-    dmt = create_dmt(session, dmt_data, current_user.id, language)
+    dmt = await create_dmt(session, dmt_data, current_user.id, language)
     return dmt
 
 
+@router.post("/bulk", response_model=DMTBulkResult)
+async def create_dmt_records_bulk(
+    records: List[Dict[str, Any]] = Body(..., description="List of DMTRecordCreate objects"),
+    language: str = Query('en', description="Input language code (en, es, zh)"),
+    session: AsyncSession = Depends(get_async_write_session),
+    current_user: User = Depends(role_required(["Inspector"]))
+):
+    """
+    Crear varios DMT Records en un solo request (integración MES)
+    Solo Inspector puede crear
+
+    Cada item se valida por separado (schema y catálogos referenciados).
+    Los items válidos se insertan juntos en una transacción; la respuesta
+    trae el resultado de cada item en el mismo orden del request.
+    """
+    if len(records) > DMT_BULK_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {DMT_BULK_MAX_ITEMS} records per request"
+        )
+
+    results: List[Optional[DMTBulkItemResult]] = [None] * len(records)
+    valid_indexes: List[int] = []
+    valid_items: List[DMTRecordCreate] = []
+    for index, raw in enumerate(records):
+        try:
+            valid_items.append(DMTRecordCreate.model_validate(raw))
+            valid_indexes.append(index)
+        except ValidationError as e:
+            results[index] = DMTBulkItemResult(
+                index=index,
+                status="error",
+                errors=[f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}" for error in e.errors()]
+            )
+
+    missing = await find_missing_references(session, valid_items)
+    to_create = []
+    for position, (index, item) in enumerate(zip(valid_indexes, valid_items)):
+        if position in missing:
+            results[index] = DMTBulkItemResult(index=index, status="error", errors=missing[position])
+        else:
+            to_create.append((index, item))
+
+    try:
+        created = await create_dmt_bulk(session, [item for _, item in to_create], current_user.id, language)
+    except Exception as e:
+        await session.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    for (index, _), dmt in zip(to_create, created):
+        results[index] = DMTBulkItemResult(
+            index=index, status="created", id=dmt.id, report_number=dmt.report_number
+        )
+
+    return DMTBulkResult(
+        created=len(created),
+        failed=len(records) - len(created),
+        results=results
+    )
+
+
 @router.get("/", response_model=List[DMTRecordRead])
-def list_dmt_records(
+async def list_dmt_records(
+    request: Request,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     is_closed: Optional[bool] = Query(None, description="Filter by closed status"),
@@ -46,15 +143,17 @@ def list_dmt_records(
     part_number_id: Optional[int] = Query(None, description="Filter by part number ID"),
     created_after: Optional[datetime] = Query(None, description="Filter by created after date"),
     created_before: Optional[datetime] = Query(None, description="Filter by created before date"),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_user)
 ):
     """
     Listar DMT Records con filtros opcionales
     Accesible para todos los roles autenticados
+
+    ETag = hash de (id, updated_at) de las filas de la página
+    Requests idénticos concurrentes comparten la consulta (coalesce)
     """
-    dmts = list_dmt(
-        session=session,
+    filters = dict(
         skip=skip,
         limit=limit,
         is_closed=is_closed,
@@ -63,25 +162,111 @@ def list_dmt_records(
         created_after=created_after,
         created_before=created_before
     )
-    return dmts
+
+    # Revalidación: solo se consultan (id, updated_at), sin cargar los textos
+    if has_conditional(request):
+        etag = rows_etag("dmt-list", await list_dmt_versions(session=session, **filters))
+        if if_none_match(request, etag):
+            return not_modified(etag, DMT_RECORD_CACHE_CONTROL)
+        await release_connection(session)
+
+    async def compute():
+        # Sesión propia: si este request se cancela, su sesión se cierra con él
+        # y la consulta sigue para los requests que la comparten
+        async with shared_read_session(session) as shared:
+            dmts = await list_dmt(session=shared, **filters)
+            etag = rows_etag("dmt-list", ((dmt.id, dmt.updated_at) for dmt in dmts))
+            return etag, dump_models(DMTRecordRead, dmts)
+
+    etag, payload = await single_flight.run(
+        "dmt", (read_class(session), tuple(sorted(filters.items()))), compute
+    )
+    response = Response(content=payload, media_type="application/json")
+    set_validators(response, etag, DMT_RECORD_CACHE_CONTROL)
+    return response
+
+
+@router.get("/events")
+async def stream_dmt_events(
+    request: Request,
+    is_closed: Optional[bool] = Query(None, description="Filter by closed status"),
+    created_by_id: Optional[int] = Query(None, description="Filter by creator user ID"),
+    part_number_id: Optional[int] = Query(None, description="Filter by part number ID"),
+    created_after: Optional[datetime] = Query(None, description="Filter by created after date"),
+    created_before: Optional[datetime] = Query(None, description="Filter by created before date"),
+    last_event_id: Optional[int] = Query(None, description="Resume after this event id (or Last-Event-ID header)"),
+    session: AsyncSession = Depends(get_async_session),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Stream (server-sent events) de cambios de DMT Records: created, updated,
+    closed y deleted, con los campos que muestra el feed
+    Accesible para todos los roles autenticados
+
+    Mismos filtros que GET /dmt/; un record que deja de cumplirlos también se
+    envía (el cliente lo quita). Ver dmt_events.py
+    """
+    if not dmt_feed.enabled:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="DMT live feed is disabled"
+        )
+    if dmt_feed.full():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many open feed streams, retry later",
+            headers={"Retry-After": "30"}
+        )
+
+    header = request.headers.get("last-event-id")
+    if header is not None:
+        try:
+            last_event_id = int(header)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Last-Event-ID must be an event id"
+            )
+
+    # El stream no usa la base de datos: devolver la conexión de la autenticación
+    await release_connection(session)
+
+    event_filter = EventFilter(is_closed, created_by_id, part_number_id, created_after, created_before)
+    return StreamingResponse(
+        dmt_feed.stream(event_filter, last_event_id, current_user.id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @router.get("/{dmt_id}", response_model=DMTRecordRead)
-def get_dmt_record(
+async def get_dmt_record(
     dmt_id: int,
-    session: Session = Depends(get_session),
+    request: Request,
+    response: Response,
+    session: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_user)
 ):
     """
     Obtener un DMT Record específico por ID
     Accesible para todos los roles autenticados
+
+    ETag = id + updated_at del registro
     """
-    dmt = get_dmt_by_id(session, dmt_id)
+    if has_conditional(request):
+        version = await get_dmt_version(session, dmt_id)
+        if version is not None:
+            etag = row_etag("dmt", *version)
+            if if_none_match(request, etag):
+                return not_modified(etag, DMT_RECORD_CACHE_CONTROL)
+
+    dmt = await get_dmt_by_id(session, dmt_id)
     if not dmt:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"DMT Record with id {dmt_id} not found"
         )
+    set_validators(response, row_etag("dmt", dmt.id, dmt.updated_at), DMT_RECORD_CACHE_CONTROL)
     return dmt
 
 
@@ -90,7 +275,7 @@ async def update_dmt_record(
     dmt_id: int,
     update_data: DMTRecordUpdate,
     language: str = Query('en', description="Input language code (en, es, zh)"),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_write_session),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -110,7 +295,7 @@ async def update_dmt_record(
     La validación de permisos por campo se realiza en la función CRUD
     """
     try:
-        dmt = update_dmt_partial_with_field_control(
+        dmt = await update_dmt_partial_with_field_control(
             session=session,
             dmt_id=dmt_id,
             update_data=update_data,
@@ -136,40 +321,37 @@ async def update_dmt_record(
 @router.delete("/{dmt_id}", response_model=DMTRecordRead)
 async def delete_dmt_record(
     dmt_id: int,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_write_session),
     current_user: User = Depends(role_required(["Admin"]))
 ):
     """
     Delete a DMT record by ID.
     Only Admin can delete.
     """
-
-    dmt = get_dmt_by_id(session, dmt_id)
-    if not dmt:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"DMT Record with id {dmt_id} not found"
-        )
-
     try:
-        session.delete(dmt)
-        session.commit()
-        return dmt
+        dmt = await delete_dmt(session, dmt_id)
 
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e)
         )
 
+    if not dmt:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"DMT Record with id {dmt_id} not found"
+        )
+    return dmt
+
 
 @router.get("/export/csv")
 async def export_dmt_csv(
     start_date: Optional[datetime] = Query(None, description="Start date for filtering (YYYY-MM-DD)"),
     end_date: Optional[datetime] = Query(None, description="End date for filtering (YYYY-MM-DD)"),
     language: str = Query('en', description="Language for text fields (en, es, zh)"),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -183,15 +365,76 @@ async def export_dmt_csv(
     Returns:
         CSV file with all DMT records matching the filters
     """
+    started = time.perf_counter()
+
+    # Catalog and user labels from the shared snapshot when it is current;
+    # otherwise catalog relationships are loaded in bulk with the records
+    snapshot = catalog_snapshot.current(*EXPORT_CATALOGS.values(), USERS_KEY)
+
     # Get filtered records
-    records = list_dmt(
+    records = await list_dmt(
         session=session,
         skip=0,
         limit=10000,  # Large limit to get all records
         created_after=start_date,
-        created_before=end_date
+        created_before=end_date,
+        with_relationships=snapshot is None
+    )
+
+    # Referenced users in one query instead of one per record and field
+    users_by_id = {}
+    if snapshot is None:
+        users_by_id = await get_users_by_ids(session, (
+            user_id
+            for record in records
+            for user_id in (record.created_by_id, record.analysis_by_id,
+                            record.engineer_id, record.disposition_approved_by_id)
+        ))
+
+    # Building the CSV is CPU work: keep it off the event loop
+    content = await run_in_threadpool(build_dmt_csv, records, users_by_id, language, snapshot)
+    EXPORT_ROWS.inc(len(records))
+    EXPORT_DURATION.observe(time.perf_counter() - started)
+
+    # Generate filename with date range
+    filename = "dmt_records"
+    if start_date:
+        filename += f"_{start_date.strftime('%Y%m%d')}"
+    if end_date:
+        filename += f"_to_{end_date.strftime('%Y%m%d')}"
+    filename += ".csv"
+
+    return StreamingResponse(
+        iter([content]),
+        media_type="text/csv; charset=utf-8",
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "Cache-Control": DMT_EXPORT_CACHE_CONTROL
+        }
     )
 
+
+def build_dmt_csv(records: List, users_by_id: dict, language: str, snapshot: Optional[CatalogSnapshot] = None) -> bytes:
+    """
+    Generar el CSV (UTF-8 con BOM) de los records ya cargados
+    Con `snapshot`, las etiquetas de catálogos y usuarios salen del snapshot
+    compartido; sin él, de las relaciones cargadas y de `users_by_id`
+    """
+    if snapshot is not None:
+        def catalog_label(record, relationship: str) -> str:
+            return snapshot.label(EXPORT_CATALOGS[relationship], getattr(record, f"{relationship}_id"))
+
+        def user_label(user_id: Optional[int]) -> str:
+            return snapshot.label(USERS_KEY, user_id)
+    else:
+        def catalog_label(record, relationship: str) -> str:
+            entity = getattr(record, relationship)
+            return f"{entity.item_number} - {entity.item_name}" if entity else ""
+
+        def user_label(user_id: Optional[int]) -> str:
+            user = users_by_id.get(user_id)
+            return f"{user.username} - {user.full_name}" if user else ""
+
     # Create CSV in memory with utf-8 encoding and BOM
     output = io.StringIO(newline='')
     writer = csv.writer(output)
@@ -213,29 +456,22 @@ async def export_dmt_csv(
     # Write data rows
     for record in records:
         # Get related entity names
-        part_number_name = f"{record.part_number.item_number} - {record.part_number.item_name}" if record.part_number else ""
-        work_center_name = f"{record.work_center.item_number} - {record.work_center.item_name}" if record.work_center else ""
-        customer_name = f"{record.customer.item_number} - {record.customer.item_name}" if record.customer else ""
-        level_name = f"{record.level.item_number} - {record.level.item_name}" if record.level else ""
-        area_name = f"{record.area.item_number} - {record.area.item_name}" if record.area else ""
-        prepared_by_name = f"{record.prepared_by.item_number} - {record.prepared_by.item_name}" if record.prepared_by else ""
-        inspection_item_name = f"{record.inspection_item.item_number} - {record.inspection_item.item_name}" if record.inspection_item else ""
-        process_code_name = f"{record.process_code.item_number} - {record.process_code.item_name}" if record.process_code else ""
-        disposition_name = f"{record.final_disposition.item_number} - {record.final_disposition.item_name}" if record.final_disposition else ""
-        failure_code_name = f"{record.failure_code.item_number} - {record.failure_code.item_name}" if record.failure_code else ""
+        part_number_name = catalog_label(record, "part_number")
+        work_center_name = catalog_label(record, "work_center")
+        customer_name = catalog_label(record, "customer")
+        level_name = catalog_label(record, "level")
+        area_name = catalog_label(record, "area")
+        prepared_by_name = catalog_label(record, "prepared_by")
+        inspection_item_name = catalog_label(record, "inspection_item")
+        process_code_name = catalog_label(record, "process_code")
+        disposition_name = catalog_label(record, "final_disposition")
+        failure_code_name = catalog_label(record, "failure_code")
 
         # Get user names
-        created_by = session.get(User, record.created_by_id)
-        created_by_name = f"{created_by.username} - {created_by.full_name}" if created_by else ""
-
-        analysis_by = session.get(User, record.analysis_by_id) if record.analysis_by_id else None
-        analysis_by_name = f"{analysis_by.username} - {analysis_by.full_name}" if analysis_by else ""
-
-        engineer = session.get(User, record.engineer_id) if record.engineer_id else None
-        engineer_name = f"{engineer.username} - {engineer.full_name}" if engineer else ""
-
-        approved_by = session.get(User, record.disposition_approved_by_id) if record.disposition_approved_by_id else None
-        approved_by_name = f"{approved_by.username} - {approved_by.full_name}" if approved_by else ""
+        created_by_name = user_label(record.created_by_id)
+        analysis_by_name = user_label(record.analysis_by_id)
+        engineer_name = user_label(record.engineer_id)
+        approved_by_name = user_label(record.disposition_approved_by_id)
 
         # Get text fields in requested language, fall back to English if specific language is empty
         defect_desc = getattr(record, f'defect_description_{language}', '') or getattr(record, 'defect_description_en', '') or ''
@@ -282,19 +518,4 @@ async def export_dmt_csv(
         ]
         writer.writerow(row)
 
-    # Prepare response
-    output.seek(0)
-
-    # Generate filename with date range
-    filename = "dmt_records"
-    if start_date:
-        filename += f"_{start_date.strftime('%Y%m%d')}"
-    if end_date:
-        filename += f"_to_{end_date.strftime('%Y%m%d')}"
-    filename += ".csv"
-
-    return StreamingResponse(
-        iter([output.getvalue().encode('utf-8-sig')]),
-        media_type="text/csv; charset=utf-8",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
-    )
+    return output.getvalue().encode('utf-8-sig')
@@ -1,22 +1,32 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlmodel import Session
-from database import get_session
-from schemas import EntityCreate, EntityRead
-from crud.crud_entity import (
-    create_entity, get_entity, list_entities, update_entity, delete_entity
+from typing import List, Optional
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, Response, UploadFile, status
+from sqlmodel.ext.asyncio.session import AsyncSession
+from database import get_async_primary_session, get_async_write_session, shared_read_session
+from schemas import EntityCreate, EntityRead, EntityImportResult
+from crud.crud_entity import get_entity_model, catalog_version
+from crud.crud_entity_async import (
+    create_entity, get_entity, list_entities_json, update_entity, delete_entity,
+    get_catalog_bundle, import_entities
+)
+from catalog_import import ImportReport, IMPORT_FORMATS, detect_format, read_catalog_batches
+from cache import catalog_cache, BUNDLE_KEY
+from http_cache import (
+    CATALOG_CACHE_CONTROL, version_etag, if_none_match, not_modified, set_validators
 )
 from deps import get_current_user, role_required
 from models import User
+from tracing import TracedRoute
+from coalesce import single_flight
+from compression import choose_encoding
 
-router = APIRouter(prefix="/entities", tags=["Entities (Catalogs)"])
+router = APIRouter(prefix="/entities", tags=["Entities (Catalogs)"], route_class=TracedRoute)
 
 
 @router.post("/{entity_name}", response_model=EntityRead, status_code=status.HTTP_201_CREATED)
-def create_entity_endpoint(
+async def create_entity_endpoint(
     entity_name: str,
     entity_data: EntityCreate,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_write_session),
     current_user: User = Depends(role_required(["Admin"]))
 ):
     """
@@ -24,36 +34,130 @@ def create_entity_endpoint(
     Solo Admin puede crear
     """
     try:
-        entity = create_entity(session, entity_name, entity_data)
+        entity = await create_entity(session, entity_name, entity_data)
         return entity
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
 
+@router.post("/{entity_name}/import", response_model=EntityImportResult)
+async def import_entities_endpoint(
+    entity_name: str,
+    file: UploadFile = File(..., description="CSV (item_number,item_name) or JSON lines file"),
+    format: Optional[str] = Query(None, description="csv or jsonl (default: from file name)"),
+    session: AsyncSession = Depends(get_async_write_session),
+    current_user: User = Depends(role_required(["Admin"]))
+):
+    """
+    Importar un catálogo completo o parcial desde CSV / JSON lines
+    Upsert por item_number: retorna cuántos se insertaron, actualizaron o no cambiaron
+    Solo Admin
+    """
+    if not get_entity_model(entity_name):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Entity '{entity_name}' not found")
+    file_format = format or detect_format(file.filename, file.content_type)
+    if file_format not in IMPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unsupported format '{file_format}'. Use one of: {', '.join(IMPORT_FORMATS)}"
+        )
+
+    report = ImportReport(entity_name.lower())
+    try:
+        await import_entities(
+            session, entity_name, read_catalog_batches(file.file, file_format, report), report
+        )
+    except ValueError as e:
+        await session.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    finally:
+        await file.close()
+    return report.as_dict()
+
+
+@router.get("/_bundle")
+async def get_catalog_bundle_endpoint(
+    request: Request,
+    session: AsyncSession = Depends(get_async_primary_session),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Todos los catálogos + lista reducida de usuarios en una sola respuesta
+    Usado por el formulario DMT al cargar (reemplaza 11 peticiones)
+    Todos los roles autenticados pueden leer
+
+    Respuesta: {"version": n, "catalogs": {"partnumber": [...], ...},
+                "users": [{"id", "username", "full_name", "role"}]}
+    """
+    # Solo hay un cuerpo precomprimido (gzip); br lo agrega el middleware si hace falta
+    use_gzip = choose_encoding(request.headers.get("accept-encoding", ""), offered=("gzip",)) == "gzip"
+
+    # Revalidación sin consultar la base de datos
+    current = catalog_cache.version(BUNDLE_KEY)
+    etag = version_etag("bundle", current, "gz" if use_gzip else "id")
+    if if_none_match(request, etag):
+        return not_modified(etag, CATALOG_CACHE_CONTROL, vary="Accept-Encoding")
+
+    version, payload, compressed = await get_catalog_bundle(session)
+    headers = {
+        "X-Catalog-Version": str(version),
+        "Vary": "Accept-Encoding",
+        "ETag": version_etag("bundle", version, "gz" if use_gzip else "id"),
+        "Cache-Control": CATALOG_CACHE_CONTROL,
+    }
+
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=compressed, media_type="application/json", headers=headers)
+
+    return Response(content=payload, media_type="application/json", headers=headers)
+
+
 @router.get("/{entity_name}", response_model=List[EntityRead])
-def list_entities_endpoint(
+async def list_entities_endpoint(
     entity_name: str,
+    request: Request,
     skip: int = 0,
     limit: int = 100,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_primary_session),
     current_user: User = Depends(get_current_user)
 ):
     """
     Listar todos los registros de un catálogo
     Todos los roles autenticados pueden leer
+    Se sirve desde el cache de catálogos (JSON pre-serializado); los
+    requests idénticos concurrentes comparten la construcción (coalesce)
     """
     try:
-        entities = list_entities(session, entity_name, skip, limit)
-        return entities
+        if not get_entity_model(entity_name):
+            raise ValueError(f"Entity '{entity_name}' not found")
+
+        # La versión se lee antes que los datos: un ETag nunca es más nuevo que el contenido
+        version = catalog_version(entity_name)
+        etag = version_etag("entity", entity_name.lower(), version, skip, limit)
+        if if_none_match(request, etag):
+            return not_modified(etag, CATALOG_CACHE_CONTROL)
+
+        async def compute():
+            # Sesión propia: no depende del ciclo de vida de este request (coalesce)
+            async with shared_read_session(session) as shared:
+                return await list_entities_json(shared, entity_name, skip, limit)
+
+        payload = await single_flight.run("entities", (entity_name.lower(), skip, limit, version), compute)
+        response = Response(content=payload, media_type="application/json")
+        set_validators(response, etag, CATALOG_CACHE_CONTROL)
+        return response
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
 
 @router.get("/{entity_name}/{entity_id}", response_model=EntityRead)
-def get_entity_endpoint(
+async def get_entity_endpoint(
     entity_name: str,
     entity_id: int,
-    session: Session = Depends(get_session),
+    request: Request,
+    response: Response,
+    session: AsyncSession = Depends(get_async_primary_session),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -61,23 +165,31 @@ def get_entity_endpoint(
     Todos los roles autenticados pueden leer
     """
     try:
-        entity = get_entity(session, entity_name, entity_id)
+        if not get_entity_model(entity_name):
+            raise ValueError(f"Entity '{entity_name}' not found")
+
+        etag = version_etag("entity", entity_name.lower(), catalog_version(entity_name), "id", entity_id)
+        if if_none_match(request, etag):
+            return not_modified(etag, CATALOG_CACHE_CONTROL)
+
+        entity = await get_entity(session, entity_name, entity_id)
         if not entity:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Entity '{entity_name}' with id {entity_id} not found"
             )
+        set_validators(response, etag, CATALOG_CACHE_CONTROL)
         return entity
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
 
 @router.put("/{entity_name}/{entity_id}", response_model=EntityRead)
-def update_entity_endpoint(
+async def update_entity_endpoint(
     entity_name: str,
     entity_id: int,
     entity_data: EntityCreate,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_write_session),
     current_user: User = Depends(role_required(["Admin"]))
 ):
     """
@@ -85,7 +197,7 @@ def update_entity_endpoint(
     Solo Admin puede actualizar
     """
     try:
-        entity = update_entity(session, entity_name, entity_id, entity_data)
+        entity = await update_entity(session, entity_name, entity_id, entity_data)
         if not entity:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -97,10 +209,10 @@ def update_entity_endpoint(
 
 
 @router.delete("/{entity_name}/{entity_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_entity_endpoint(
+async def delete_entity_endpoint(
     entity_name: str,
     entity_id: int,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_write_session),
     current_user: User = Depends(role_required(["Admin"]))
 ):
     """
@@ -108,7 +220,7 @@ def delete_entity_endpoint(
     Solo Admin puede eliminar
     """
     try:
-        deleted = delete_entity(session, entity_name, entity_id)
+        deleted = await delete_entity(session, entity_name, entity_id)
         if not deleted:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -1,45 +1,64 @@
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlmodel import Session, select
-from database import get_session
-from schemas import UserRead, UserCreate, UserUpdate
+from typing import Any, Dict, List, Optional
+from fastapi import APIRouter, Body, Depends, HTTPException, Request, Response, status
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
+from sqlmodel.ext.asyncio.session import AsyncSession
+from database import get_async_primary_session, get_async_write_session, shared_read_session
+from schemas import UserRead, UserCreate, UserUpdate, UserBulkItemResult, UserBulkResult
 from models import User
 from deps import get_current_user, role_required
-from crud import crud_user
+from crud import crud_user_async
+from cache import catalog_cache, USERS_KEY
+from http_cache import USER_CACHE_CONTROL, version_etag, if_none_match, not_modified, set_validators
+from user_import import USER_BULK_MAX_ITEMS, validation_errors
+from tracing import TracedRoute
+from coalesce import single_flight
 
 router = APIRouter(
     prefix="/users",
     tags=["Users"],
+    route_class=TracedRoute
 )
 
 
 @router.get("/", response_model=List[UserRead])
-def list_users(
+async def list_users(
+    request: Request,
     role: Optional[str] = None,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_primary_session),
     current_user: User = Depends(get_current_user) # Accessible to all authenticated users
 ):
     """
     List all users, optionally filtered by role.
+    Identical concurrent requests share one query and serialization (coalesce).
     """
-    statement = select(User)
-    if role:
-        statement = statement.where(User.role == role)
-    users = session.exec(statement).all()
-    return users
+    version = catalog_cache.version(USERS_KEY)
+    etag = version_etag("users", version, role or "")
+    if if_none_match(request, etag):
+        return not_modified(etag, USER_CACHE_CONTROL)
+
+    async def compute():
+        # Sesión propia: no depende del ciclo de vida de este request (coalesce)
+        async with shared_read_session(session) as shared:
+            return await crud_user_async.list_users_json(shared, role)
+
+    payload = await single_flight.run("users", (role or "", version), compute)
+    response = Response(content=payload, media_type="application/json")
+    set_validators(response, etag, USER_CACHE_CONTROL)
+    return response
 
 
 @router.post("", response_model=UserRead, status_code=status.HTTP_201_CREATED,
              dependencies=[Depends(role_required(["Admin"]))]) # Admin only
-def create_user(
+async def create_user(
     user_in: UserCreate,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_write_session),
 ):
     """
     Create a new user. Admin only.
     """
     # Check for existing user with the same username or email
-    existing_user = crud_user.get_user_by_username(session, user_in.username)
+    existing_user = await crud_user_async.get_user_by_username(session, user_in.username)
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
@@ -53,60 +72,122 @@ def create_user(
     #         detail="Email already registered",
     #     )
         
-    user = crud_user.create_user(session, user_in)
+    user = await crud_user_async.create_user(session, user_in)
     return user
 
 
+@router.post("/bulk", response_model=UserBulkResult,
+             dependencies=[Depends(role_required(["Admin"]))]) # Admin only
+async def create_users_bulk(
+    users: List[Dict[str, Any]] = Body(..., description="List of UserCreate objects"),
+    session: AsyncSession = Depends(get_async_write_session),
+):
+    """
+    Create several users in one request (shift onboarding). Admin only.
+
+    Each item is validated separately; username/email conflicts are checked
+    in one query. Valid users are inserted together in one transaction and
+    the response has the result of each item in request order.
+    """
+    if len(users) > USER_BULK_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {USER_BULK_MAX_ITEMS} users per request"
+        )
+
+    results: List[Optional[UserBulkItemResult]] = [None] * len(users)
+    valid_indexes: List[int] = []
+    valid_items: List[UserCreate] = []
+    for index, raw in enumerate(users):
+        try:
+            valid_items.append(UserCreate.model_validate(raw))
+            valid_indexes.append(index)
+        except ValidationError as e:
+            results[index] = UserBulkItemResult(index=index, status="error", errors=validation_errors(e))
+
+    try:
+        created, conflicts = await crud_user_async.create_users_bulk(session, valid_items)
+    except IntegrityError:
+        # Otro request registró el mismo username/email entre la verificación y el INSERT
+        await session.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Username or email registered concurrently, retry the request",
+        )
+
+    for position, index in enumerate(valid_indexes):
+        if position in conflicts:
+            results[index] = UserBulkItemResult(
+                index=index, status="error", username=valid_items[position].username, errors=conflicts[position]
+            )
+        else:
+            user = created[position]
+            results[index] = UserBulkItemResult(index=index, status="created", id=user.id, username=user.username)
+
+    return UserBulkResult(
+        created=len(created),
+        failed=len(users) - len(created),
+        results=results
+    )
+
+
 @router.get("/{user_id}", response_model=UserRead)
-def get_user(
+async def get_user(
     user_id: int,
-    session: Session = Depends(get_session),
+    request: Request,
+    response: Response,
+    session: AsyncSession = Depends(get_async_primary_session),
     current_user: User = Depends(get_current_user) # Accessible to all authenticated users
 ):
     """
     Get a specific user by ID.
     """
-    user = crud_user.get_user(session, user_id)
+    etag = version_etag("users", catalog_cache.version(USERS_KEY), "id", user_id)
+    if if_none_match(request, etag):
+        return not_modified(etag, USER_CACHE_CONTROL)
+
+    user = await crud_user_async.get_user(session, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"User with id {user_id} not found",
         )
+    set_validators(response, etag, USER_CACHE_CONTROL)
     return user
 
 
 @router.put("/{user_id}", response_model=UserRead,
             dependencies=[Depends(role_required(["Admin"]))]) # Admin only
-def update_user(
+async def update_user(
     user_id: int,
     user_in: UserUpdate,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_write_session),
 ):
     """
     Update a user's details. Admin only.
     """
-    user = crud_user.get_user(session, user_id)
+    user = await crud_user_async.get_user(session, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"User with id {user_id} not found",
         )
     
-    user = crud_user.update_user(session, user, user_in)
+    user = await crud_user_async.update_user(session, user, user_in)
     return user
 
 
 @router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT,
             dependencies=[Depends(role_required(["Admin"]))]) # Admin only
-def delete_user(
+async def delete_user(
     user_id: int,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_write_session),
     current_user: User = Depends(get_current_user),
 ):
     """
     Delete a user. Admin only.
     """
-    user = crud_user.get_user(session, user_id)
+    user = await crud_user_async.get_user(session, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -118,5 +199,5 @@ def delete_user(
             detail="Admins cannot delete themselves.",
         )
         
-    crud_user.delete_user(session, user)
+    await crud_user_async.delete_user(session, user)
     return
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import Optional, List
 from datetime import datetime
 
 # ===== USER SCHEMAS =====
@@ -27,6 +27,24 @@ class UserRead(BaseModel):
     class Config:
         from_attributes = True
 
+class UserBulkItemResult(BaseModel):
+    """
+    Resultado de un item de POST /users/bulk (mismo índice que en el request)
+    """
+    index: int
+    status: str  # created | error
+    id: Optional[int] = None
+    username: Optional[str] = None
+    errors: Optional[List[str]] = None
+
+class UserBulkResult(BaseModel):
+    """
+    Respuesta de POST /users/bulk
+    """
+    created: int
+    failed: int
+    results: List[UserBulkItemResult]
+
 class UserAuth(BaseModel):
     username: str
     password: str
@@ -54,6 +72,19 @@ class EntityRead(BaseModel):
     class Config:
         from_attributes = True
 
+class EntityImportResult(BaseModel):
+    """
+    Resultado de POST /entities/{name}/import
+    """
+    entity: str
+    rows: int
+    inserted: int
+    updated: int
+    unchanged: int
+    duplicates: int
+    errors: int
+    error_samples: List[str]
+
 # ===== DMT RECORD SCHEMAS =====
 
 class DMTRecordCreate(BaseModel):
@@ -98,6 +129,7 @@ class DMTRecordRead(BaseModel):
     id: int
     is_closed: bool
     created_at: datetime
+    updated_at: Optional[datetime] = None
     created_by_id: int
     report_number: Optional[str] = None
 
@@ -205,3 +237,33 @@ class DMTRecordUpdate(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+# ===== BULK DMT SCHEMAS =====
+
+class DMTBulkItemResult(BaseModel):
+    """
+    Resultado de un item de POST /dmt/bulk (mismo índice que en el request)
+    """
+    index: int
+    status: str  # created | error
+    id: Optional[int] = None
+    report_number: Optional[str] = None
+    errors: Optional[List[str]] = None
+
+class DMTBulkResult(BaseModel):
+    """
+    Respuesta de POST /dmt/bulk
+    """
+    created: int
+    failed: int
+    results: List[DMTBulkItemResult]
+
+
+# ===== ADMIN SCHEMAS =====
+
+class ProfilingSettings(BaseModel):
+    """
+    Modo de perfilado aleatorio (GET/PUT /admin/profiling), 0 = apagado
+    """
+    requests_per_minute: int = Field(0, ge=0, le=600)
@@ -11,45 +11,41 @@ from models import (
     User, PartNumber, WorkCenter, Customer, Level, Area,
     Calibration, InspectionItem, PreparedBy, ProcessCode, Disposition, FailureCode
 )
-from passlib.context import CryptContext
-
-# Password hashing
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
-
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+from schemas import UserCreate
+from crud.crud_user import create_users_bulk
+from user_import import shutdown_hash_pool
 
 def create_users(session: Session):
-    """Create default users for all roles"""
+    """Create default users for all roles (bulk path: one conflict query, parallel hashing, one INSERT)"""
     print("Creating users...")
 
     users = []
 
     # System admin
-    users.append(User(
+    users.append(UserCreate(
         username="ADM001",
         email="adm001@example.com",
         full_name="System Administrator",
         role="Admin",
-        hashed_password=hash_password("admin123")
+        password="admin123"
     ))
 
     # Tech Engineer
-    users.append(User(
+    users.append(UserCreate(
         username="ENG001",
         email="eng001@example.com",
         full_name="Technical Engineer",
         role="Tech Engineer",
-        hashed_password=hash_password("engineer123")
+        password="engineer123"
     ))
 
     # Quality Engineer
-    users.append(User(
+    users.append(UserCreate(
         username="QUA001",
         email="qua001@example.com",
         full_name="Quality Engineer",
         role="Quality Engineer",
-        hashed_password=hash_password("quality123")
+        password="quality123"
     ))
 
     # Inspectors - default password: employee123
@@ -69,12 +65,12 @@ def create_users(session: Session):
 
     for idx, name in enumerate(inspector_names, start=1):
         username = f"INS{idx:03d}"
-        users.append(User(
+        users.append(UserCreate(
             username=username,
             email=f"{username.lower()}@example.com",
             full_name=name,
             role="Inspector",
-            hashed_password=hash_password("employee123")
+            password="employee123"
         ))
 
     # Operators - default password: employee123
@@ -145,25 +141,21 @@ def create_users(session: Session):
 
     for idx, name in enumerate(operator_names, start=1):
         username = f"OPR{idx:03d}"
-        users.append(User(
+        users.append(UserCreate(
             username=username,
             email=f"{username.lower()}@example.com",
             full_name=name,
             role="Operator",
-            hashed_password=hash_password("employee123")
+            password="employee123"
         ))
 
-    for user in users:
-        # Check if user already exists
-        existing = session.query(User).filter(User.username == user.username).first()
-        if not existing:
-            session.add(user)
+    created, conflicts = create_users_bulk(session, users)
+    for position, user in enumerate(users):
+        if position in created:
             print(f"  ✓ Created user: {user.username} - {user.full_name} ({user.role})")
         else:
             print(f"  ⚠ User already exists: {user.username}")
 
-    session.commit()
-
 def create_part_numbers(session: Session):
     """Create part numbers"""
     print("\nCreating part numbers...")
@@ -433,6 +425,8 @@ def seed_database():
     except Exception as e:
         print(f"\n✗ Error seeding database: {e}")
         sys.exit(1)
+    finally:
+        shutdown_hash_pool()
 
 if __name__ == "__main__":
     seed_database()
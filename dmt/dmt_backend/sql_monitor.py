@@ -0,0 +1,245 @@
+"""
+SQL instrumentation based on SQLAlchemy cursor-execute events
+
+Replaces echo=True (which prints every statement synchronously) with:
+- per-statement timing aggregated by SQL text (count, total, max)
+- a sampled slow-query log with the shape of the bound parameters
+  (types only, never values)
+- per-request query count and time, returned as X-DB-Queries and
+  X-DB-Time-Ms response headers
+- N+1 detection: the same statement executed SQL_N_PLUS_ONE_THRESHOLD
+  times within one request is reported (warn) or fails the request (raise)
+
+Listeners are attached to the Engine class, so every engine (sync, async,
+SQLite writer) is covered. Results are exposed through GET /admin/sql.
+
+Configuration (environment variables):
+    SQL_MONITOR_ENABLED        1/0 (default: 1)
+    SQL_SLOW_QUERY_MS          Slow query threshold in ms (default: 200)
+    SQL_SLOW_QUERY_SAMPLE      Fraction of slow queries logged, 0-1 (default: 1.0)
+    SQL_SLOW_QUERY_MAX         Slow queries kept in memory (default: 100)
+    SQL_STATEMENT_STATS_MAX    Distinct statements tracked (default: 500)
+    SQL_STRICT_N_PLUS_ONE      off / warn / raise (default: warn)
+    SQL_N_PLUS_ONE_THRESHOLD   Repetitions that count as N+1 (default: 10)
+"""
+
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+SQL_MONITOR_ENABLED = os.getenv("SQL_MONITOR_ENABLED", "1") == "1"
+SQL_SLOW_QUERY_MS = float(os.getenv("SQL_SLOW_QUERY_MS", "200"))
+SQL_SLOW_QUERY_SAMPLE = float(os.getenv("SQL_SLOW_QUERY_SAMPLE", "1.0"))
+SQL_SLOW_QUERY_MAX = int(os.getenv("SQL_SLOW_QUERY_MAX", "100"))
+SQL_STATEMENT_STATS_MAX = int(os.getenv("SQL_STATEMENT_STATS_MAX", "500"))
+SQL_STRICT_N_PLUS_ONE = os.getenv("SQL_STRICT_N_PLUS_ONE", "warn").lower()
+SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "10"))
+
+# Longitud máxima del SQL guardado en los reportes
+STATEMENT_PREVIEW = 1000
+
+
+class NPlusOneError(RuntimeError):
+    """
+    La misma sentencia se ejecutó demasiadas veces en un request (modo raise)
+    """
+
+
+class RequestSQLStats:
+    """
+    Contadores de SQL de un request (guardados en un ContextVar)
+    """
+
+    __slots__ = ("path", "queries", "time_ms", "statements", "flagged")
+
+    def __init__(self, path: str = ""):
+        self.path = path
+        self.queries = 0
+        self.time_ms = 0.0
+        self.statements: Dict[str, int] = {}
+        self.flagged = set()
+
+
+_request_stats: contextvars.ContextVar[Optional[RequestSQLStats]] = contextvars.ContextVar(
+    "sql_request_stats", default=None
+)
+
+
+def param_shape(parameters):
+    """
+    Forma de los parámetros: tipos en lugar de valores
+    """
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            # executemany
+            return {"rows": len(parameters), "row": param_shape(parameters[0])}
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+class SQLMonitor:
+    """
+    Estadísticas globales de SQL del proceso
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Descartar las estadísticas acumuladas
+        """
+        with self._lock:
+            self._since = datetime.utcnow()
+            self._queries = 0
+            self._time_ms = 0.0
+            self._statements: Dict[str, list] = {}
+            self._slow = deque(maxlen=SQL_SLOW_QUERY_MAX)
+            self._n_plus_one = deque(maxlen=SQL_SLOW_QUERY_MAX)
+
+    def record(self, statement: str, parameters, elapsed_ms: float, executemany: bool):
+        """
+        Registrar una ejecución (llamado desde after_cursor_execute)
+        """
+        request = _request_stats.get()
+        repeated = 0
+        if request is not None:
+            request.queries += 1
+            request.time_ms += elapsed_ms
+            repeated = request.statements.get(statement, 0) + 1
+            request.statements[statement] = repeated
+
+        with self._lock:
+            self._queries += 1
+            self._time_ms += elapsed_ms
+            stats = self._statements.get(statement)
+            if stats is None and len(self._statements) < SQL_STATEMENT_STATS_MAX:
+                stats = self._statements[statement] = [0, 0.0, 0.0]
+            if stats is not None:
+                stats[0] += 1
+                stats[1] += elapsed_ms
+                stats[2] = max(stats[2], elapsed_ms)
+
+            if elapsed_ms >= SQL_SLOW_QUERY_MS and random.random() < SQL_SLOW_QUERY_SAMPLE:
+                self._slow.appendleft({
+                    "at": datetime.utcnow().isoformat(),
+                    "duration_ms": round(elapsed_ms, 2),
+                    "path": request.path if request else None,
+                    "statement": statement[:STATEMENT_PREVIEW],
+                    "params": param_shape(parameters),
+                    "executemany": executemany,
+                })
+                logger.warning("Slow query (%.0f ms): %s", elapsed_ms, statement[:200])
+
+        if (
+            SQL_STRICT_N_PLUS_ONE != "off"
+            and repeated >= SQL_N_PLUS_ONE_THRESHOLD
+            and statement not in request.flagged
+        ):
+            request.flagged.add(statement)
+            with self._lock:
+                self._n_plus_one.appendleft({
+                    "at": datetime.utcnow().isoformat(),
+                    "path": request.path,
+                    "statement": statement[:STATEMENT_PREVIEW],
+                })
+            message = (
+                f"N+1 query pattern: statement executed {repeated} times in "
+                f"{request.path}: {statement[:200]}"
+            )
+            if SQL_STRICT_N_PLUS_ONE == "raise":
+                raise NPlusOneError(message)
+            logger.warning(message)
+
+    def snapshot(self, top: int = 20) -> dict:
+        """
+        Sentencias más costosas, slow queries y N+1 detectados
+        """
+        with self._lock:
+            statements = sorted(self._statements.items(), key=lambda item: item[1][1], reverse=True)[:top]
+            return {
+                "since": self._since.isoformat(),
+                "queries": self._queries,
+                "time_ms": round(self._time_ms, 1),
+                "slow_query_ms": SQL_SLOW_QUERY_MS,
+                "strict_n_plus_one": SQL_STRICT_N_PLUS_ONE,
+                "top_statements": [
+                    {
+                        "statement": statement[:STATEMENT_PREVIEW],
+                        "count": count,
+                        "total_ms": round(total, 1),
+                        "mean_ms": round(total / count, 3),
+                        "max_ms": round(maximum, 1),
+                    }
+                    for statement, (count, total, maximum) in statements
+                ],
+                "slow_queries": list(self._slow),
+                "n_plus_one": list(self._n_plus_one),
+            }
+
+
+sql_monitor = SQLMonitor()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (time.perf_counter() - conn.info["query_start"].pop()) * 1000
+    sql_monitor.record(statement, parameters, elapsed_ms, executemany)
+
+
+def install_sql_monitor():
+    """
+    Registrar los listeners en todos los engines (idempotente)
+    """
+    if not SQL_MONITOR_ENABLED or event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class SQLStatsMiddleware:
+    """
+    Middleware ASGI: cuenta las consultas de cada request y agrega
+    X-DB-Queries / X-DB-Time-Ms a la respuesta
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not SQL_MONITOR_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestSQLStats(scope.get("path", ""))
+        token = _request_stats.set(stats)
+
+        async def send_with_stats(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (b"x-db-queries", str(stats.queries).encode("latin-1")),
+                    (b"x-db-time-ms", f"{stats.time_ms:.1f}".encode("latin-1")),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            _request_stats.reset(token)
@@ -0,0 +1,447 @@
+"""
+Request tracing (spans exported as OTLP/JSON)
+
+Each sampled request gets a trace with:
+- a server span per request (TracingMiddleware, named by route template)
+- a span for the router endpoint (TracedRoute, set as route_class)
+- spans for the crud_dmt functions (@traced)
+- a client span per LibreTranslate call (translation_free)
+- a span per SQL statement and per session commit (SQLAlchemy events on
+  the Engine and Session classes, like sql_monitor)
+
+The trace id comes from an incoming W3C `traceparent` header when present,
+and is propagated to LibreTranslate; sampled responses carry X-Trace-Id.
+Sampling is head-based: the decision is made once when the request
+arrives (TRACING_SAMPLE_RATE, or the sampled flag of the incoming
+traceparent) and an unsampled request creates no span objects at all.
+
+Finished spans are queued and exported in batches by a background thread,
+either to a file (one OTLP ExportTraceServiceRequest JSON per line, the
+format of the collector's file exporter) or POSTed to an OTLP/HTTP
+collector. When the queue is full spans are dropped, never blocking a
+request (dmt_tracing_spans_dropped_total).
+
+Configuration (environment variables):
+    TRACING_EXPORTER        off / file / otlp (default: off)
+    TRACING_FILE            Output file for "file" (default: traces.jsonl)
+    TRACING_OTLP_ENDPOINT   Collector URL for "otlp" (default: http://localhost:4318/v1/traces)
+    TRACING_SAMPLE_RATE     Fraction of requests traced, 0-1 (default: 0.05)
+    TRACING_SERVICE_NAME    service.name resource attribute (default: dmt-backend)
+    TRACING_MAX_QUEUE       Finished spans waiting for export (default: 4096)
+    TRACING_EXPORT_INTERVAL Seconds between exports (default: 5)
+"""
+
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from metrics import Counter, route_template
+
+logger = logging.getLogger(__name__)
+
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "off").lower()
+TRACING_FILE = os.getenv("TRACING_FILE", "traces.jsonl")
+TRACING_OTLP_ENDPOINT = os.getenv("TRACING_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACING_SAMPLE_RATE = float(os.getenv("TRACING_SAMPLE_RATE", "0.05"))
+TRACING_SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", "dmt-backend")
+TRACING_MAX_QUEUE = int(os.getenv("TRACING_MAX_QUEUE", "4096"))
+TRACING_EXPORT_INTERVAL = float(os.getenv("TRACING_EXPORT_INTERVAL", "5"))
+
+TRACING_ENABLED = TRACING_EXPORTER in ("file", "otlp")
+
+# Spans por archivo / request al collector
+EXPORT_BATCH_SIZE = 512
+
+# Longitud máxima del SQL guardado en db.statement
+STATEMENT_PREVIEW = 1000
+
+# SpanKind de OTLP
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+SPANS_EXPORTED = Counter("dmt_tracing_spans_exported_total", "Spans written to the trace sink")
+SPANS_DROPPED = Counter("dmt_tracing_spans_dropped_total", "Spans dropped because the export queue was full")
+
+
+class Span:
+    """
+    Span en curso o terminado (solo existe en requests muestreados)
+    """
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str, kind: int = KIND_INTERNAL,
+                 attributes: Optional[dict] = None):
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes or {}
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException):
+        self.error = f"{type(error).__name__}: {error}"[:500]
+
+    def finish(self):
+        self.end_ns = time.time_ns()
+        exporter.submit(self)
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_otlp(self) -> dict:
+        data = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 0},
+        }
+        if self.parent_id:
+            data["parentSpanId"] = self.parent_id
+        return data
+
+
+class _NoopSpan:
+    """
+    Span de un request no muestreado: no registra nada
+    """
+
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value):
+        pass
+
+    def record_error(self, error: BaseException):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def trace_headers() -> Dict[str, str]:
+    """
+    Header traceparent para propagar el trace a otro servicio ({} si no hay trace)
+    """
+    span = _current_span.get()
+    return {"traceparent": span.traceparent} if span is not None else {}
+
+
+@contextmanager
+def start_span(name: str, kind: int = KIND_INTERNAL, attributes: Optional[dict] = None):
+    """
+    Span hijo del span actual; sin trace muestreado no hace nada
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield NOOP_SPAN
+        return
+
+    span = Span(parent.trace_id, parent.span_id, name, kind, attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.record_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.finish()
+
+
+def traced(name: Optional[str] = None):
+    """
+    Decorador: un span por llamada a la función (sync o async)
+    Nombre por defecto: <módulo>.<función>
+    """
+    def decorator(func):
+        span_name = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if _current_span.get() is None:
+                    return await func(*args, **kwargs)
+                with start_span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current_span.get() is None:
+                return func(*args, **kwargs)
+            with start_span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+class TracedRoute(APIRoute):
+    """
+    route_class de los routers: span router.<endpoint> alrededor del endpoint
+    (el resto del span del request es dependencias y serialización)
+    """
+
+    def get_route_handler(self):
+        if TRACING_ENABLED:
+            self.dependant.call = traced(f"router.{self.name}")(self.dependant.call)
+        return super().get_route_handler()
+
+
+class SpanExporter:
+    """
+    Cola de spans terminados y el hilo que los exporta por lotes
+    """
+
+    def __init__(self):
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=TRACING_MAX_QUEUE)
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def submit(self, span: Span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            SPANS_DROPPED.inc()
+
+    def start(self):
+        """
+        Iniciar el hilo de exportación (lifespan)
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Exportar lo pendiente y detener el hilo (shutdown)
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=TRACING_EXPORT_INTERVAL + 10)
+        self._thread = None
+
+    def _drain(self) -> List[Span]:
+        spans = []
+        while len(spans) < EXPORT_BATCH_SIZE:
+            try:
+                spans.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return spans
+
+    def _run(self):
+        while True:
+            stopping = self._stop.wait(TRACING_EXPORT_INTERVAL)
+            while True:
+                spans = self._drain()
+                if not spans:
+                    break
+                try:
+                    self.export(spans)
+                    SPANS_EXPORTED.inc(len(spans))
+                except Exception as e:
+                    SPANS_DROPPED.inc(len(spans))
+                    logger.warning("Trace export failed (%d spans dropped): %s", len(spans), e)
+            if stopping:
+                return
+
+    def export(self, spans: List[Span]):
+        """
+        Escribir un lote en el destino configurado (hilo del exportador)
+        """
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    {"key": "service.name", "value": {"stringValue": TRACING_SERVICE_NAME}},
+                ]},
+                "scopeSpans": [{
+                    "scope": {"name": "dmt_backend"},
+                    "spans": [span.to_otlp() for span in spans],
+                }],
+            }]
+        }
+        if TRACING_EXPORTER == "otlp":
+            import requests
+            response = requests.post(TRACING_OTLP_ENDPOINT, json=payload, timeout=10)
+            response.raise_for_status()
+        else:
+            with open(TRACING_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(payload, separators=(",", ":")) + "\n")
+
+
+exporter = SpanExporter()
+
+
+def _parse_traceparent(value: Optional[str]):
+    if not value:
+        return None
+    match = _TRACEPARENT.match(value.strip().lower())
+    if match is None or match.group(1) == "0" * 32:
+        return None
+    trace_id, parent_id, flags = match.groups()
+    return trace_id, parent_id, int(flags, 16) & 1 == 1
+
+
+class TracingMiddleware:
+    """
+    Middleware ASGI: decide el muestreo y abre el span del request
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not TRACING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = None
+        for name, value in scope.get("headers", ()):
+            if name == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+        parent = _parse_traceparent(traceparent)
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id = f"{random.getrandbits(128):032x}", None
+            sampled = random.random() < TRACING_SAMPLE_RATE
+        if not sampled:
+            await self.app(scope, receive, send)
+            return
+
+        route = route_template(scope)
+        span = Span(trace_id, parent_id, f"{scope['method']} {route}", KIND_SERVER, {
+            "http.method": scope["method"],
+            "http.route": route,
+            "http.target": scope.get("path", ""),
+        })
+
+        async def send_with_trace(message):
+            if message["type"] == "http.response.start":
+                span.set_attribute("http.status_code", message["status"])
+                if message["status"] >= 500:
+                    span.error = f"HTTP {message['status']}"
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (b"x-trace-id", trace_id.encode("latin-1")),
+                ]
+            await send(message)
+
+        token = _current_span.set(span)
+        try:
+            await self.app(scope, receive, send_with_trace)
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.finish()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    parent = _current_span.get()
+    if parent is None:
+        return
+    span = Span(parent.trace_id, parent.span_id, f"SQL {statement.lstrip().split(None, 1)[0].upper()}",
+                KIND_CLIENT, {
+                    "db.system": conn.dialect.name,
+                    "db.statement": statement[:STATEMENT_PREVIEW],
+                })
+    if executemany:
+        span.set_attribute("db.executemany", True)
+    conn.info.setdefault("trace_spans", []).append(span)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_span.get() is None:
+        return
+    spans = conn.info.get("trace_spans")
+    if spans:
+        spans.pop().finish()
+
+
+def _handle_error(exception_context):
+    if _current_span.get() is None or exception_context.connection is None:
+        return
+    spans = exception_context.connection.info.get("trace_spans")
+    if spans:
+        span = spans.pop()
+        span.record_error(exception_context.original_exception)
+        span.finish()
+
+
+def _before_commit(session):
+    parent = _current_span.get()
+    if parent is not None:
+        session.info["trace_commit"] = Span(parent.trace_id, parent.span_id, "db.commit", KIND_CLIENT)
+
+
+def _after_commit(session):
+    span = session.info.pop("trace_commit", None)
+    if span is not None:
+        span.finish()
+
+
+def _after_rollback(session):
+    span = session.info.pop("trace_commit", None)
+    if span is not None:
+        span.error = "commit rolled back"
+        span.finish()
+
+
+def install_tracing():
+    """
+    Registrar los listeners de SQL y commit (idempotente)
+    """
+    if not TRACING_ENABLED or event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Engine, "handle_error", _handle_error)
+    event.listen(Session, "before_commit", _before_commit)
+    event.listen(Session, "after_commit", _after_commit)
+    event.listen(Session, "after_rollback", _after_rollback)
@@ -9,6 +9,7 @@ Functions:
 - translate_text(): Translates a single text from source to target language
 - translate_field_to_all_languages(): Translates a field to all 3 supported languages
 - translate_all_text_fields(): Translates all text fields in a DMT record payload
+- translate_texts_to_all_languages(): Translates many texts at once (bulk endpoints)
 
 LibreTranslate Installation:
     pip install libretranslate
@@ -19,17 +20,26 @@ LibreTranslate Installation:
 Public instance: https://libretranslate.de (may have rate limits)
 """
 
-import requests
-from typing import Dict, Optional
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
 import logging
+from metrics import (
+    TRANSLATION_DURATION, TRANSLATION_ERRORS, TRANSLATION_FALLBACKS, TRANSLATION_IN_FLIGHT
+)
+from tracing import KIND_CLIENT, start_span, trace_headers
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Logging is configured by the application (or by __main__ below), not at import
 logger = logging.getLogger(__name__)
 
+# requests is imported by the functions that call LibreTranslate, on first
+# use, so that importing this module (every worker boot) stays cheap
+
 # LibreTranslate configuration
 # Option 1: Use public instance (may have rate limits)
-LIBRETRANSLATE_URL = "https://libretranslate.de/translate"
+# (overridable with the LIBRETRANSLATE_URL environment variable)
+LIBRETRANSLATE_URL = os.getenv("LIBRETRANSLATE_URL", "https://libretranslate.de/translate")
 
 # Option 2: Use local instance (recommended for production)
 # LIBRETRANSLATE_URL = "http://localhost:5000/translate"
@@ -42,6 +52,45 @@ SUPPORTED_LANGUAGES = {
 }
 
 
+# Span names of the LibreTranslate calls (tracing)
+_SPAN_NAMES = {'single': 'translate_text', 'batch': 'translate_batch'}
+
+
+@contextmanager
+def _tracked_call(kind: str, source_lang: str, target_lang: str, texts: int = 1):
+    """
+    Latency, in-flight count and errors of one LibreTranslate call (metrics),
+    and its span when the request is traced. Yields the headers that
+    propagate the trace to LibreTranslate.
+    """
+    TRANSLATION_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    try:
+        with start_span(_SPAN_NAMES[kind], KIND_CLIENT, {
+            'translation.source': source_lang,
+            'translation.target': target_lang,
+            'translation.texts': texts,
+        }):
+            yield trace_headers()
+    except Exception:
+        TRANSLATION_ERRORS.labels(kind).inc()
+        raise
+    finally:
+        TRANSLATION_DURATION.labels(kind).observe(time.perf_counter() - start)
+        TRANSLATION_IN_FLIGHT.dec()
+
+
+def translation_status() -> Dict[str, int]:
+    """
+    Calls to LibreTranslate: in progress now, total and failed since start.
+    """
+    return {
+        'in_flight': int(TRANSLATION_IN_FLIGHT.total()),
+        'total': int(TRANSLATION_DURATION.total()),
+        'errors': int(TRANSLATION_ERRORS.total()),
+    }
+
+
 def translate_text(text: str, source_lang: str, target_lang: str) -> str:
     """
     Translates text from source language to target language using LibreTranslate.
@@ -58,6 +107,8 @@ def translate_text(text: str, source_lang: str, target_lang: str) -> str:
         >>> translate_text("Hello world", "en", "es")
         "Hola mundo"
     """
+    import requests
+
     # If source and target are the same, no translation needed
     if source_lang == target_lang:
         return text
@@ -76,8 +127,9 @@ def translate_text(text: str, source_lang: str, target_lang: str) -> str:
         }
 
         # Make the translation request
-        response = requests.post(LIBRETRANSLATE_URL, json=payload, timeout=10)
-        response.raise_for_status()  # Raise exception for bad status codes
+        with _tracked_call('single', source_lang, target_lang) as headers:
+            response = requests.post(LIBRETRANSLATE_URL, json=payload, headers=headers, timeout=10)
+            response.raise_for_status()  # Raise exception for bad status codes
 
         # Extract translated text from response
         result = response.json()
@@ -89,9 +141,11 @@ def translate_text(text: str, source_lang: str, target_lang: str) -> str:
     except requests.exceptions.RequestException as e:
         logger.error(f"Translation API error: {e}")
         # Fallback: return original text if translation fails
+        TRANSLATION_FALLBACKS.labels('single').inc()
         return text
     except Exception as e:
         logger.error(f"Unexpected error during translation: {e}")
+        TRANSLATION_FALLBACKS.labels('single').inc()
         return text
 
 
@@ -126,6 +180,77 @@ def translate_field_to_all_languages(text: str, source_lang: str) -> Dict[str, s
     return result
 
 
+# Maximum texts sent in one LibreTranslate request (q as a list)
+TRANSLATION_BATCH_SIZE = 50
+
+
+def translate_batch(texts: List[str], source_lang: str, target_lang: str) -> List[str]:
+    """
+    Translates several texts in a single LibreTranslate request.
+
+    LibreTranslate accepts a list in 'q' and returns a list in
+    'translatedText'. On any error the original texts are returned,
+    like translate_text().
+    """
+    import requests
+
+    if source_lang == target_lang or not texts:
+        return list(texts)
+
+    try:
+        payload = {
+            'q': texts,
+            'source': source_lang,
+            'target': target_lang,
+            'format': 'text'
+        }
+        with _tracked_call('batch', source_lang, target_lang, len(texts)) as headers:
+            response = requests.post(LIBRETRANSLATE_URL, json=payload, headers=headers, timeout=30)
+            response.raise_for_status()
+
+        translated = response.json().get('translatedText')
+        if not isinstance(translated, list) or len(translated) != len(texts):
+            raise ValueError("Unexpected batch response from translation service")
+
+        logger.info(f"Translated batch of {len(texts)} texts from {source_lang} to {target_lang}")
+        return translated
+
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Translation API error: {e}")
+        TRANSLATION_FALLBACKS.labels('batch').inc(len(texts))
+        return list(texts)
+    except Exception as e:
+        logger.error(f"Unexpected error during batch translation: {e}")
+        TRANSLATION_FALLBACKS.labels('batch').inc(len(texts))
+        return list(texts)
+
+
+def translate_texts_to_all_languages(texts: List[str], source_lang: str) -> Dict[str, Dict[str, str]]:
+    """
+    Translates many texts to all 3 supported languages.
+
+    Identical texts are translated once, and the unique texts are sent in
+    batches of TRANSLATION_BATCH_SIZE: one request per batch and target
+    language instead of one per text.
+
+    Returns:
+        Dictionary {original text: {'en': ..., 'es': ..., 'zh': ...}}
+    """
+    unique_texts = list(dict.fromkeys(text for text in texts if text and text.strip()))
+    result = {text: {} for text in unique_texts}
+
+    for target_lang in SUPPORTED_LANGUAGES.keys():
+        for start in range(0, len(unique_texts), TRANSLATION_BATCH_SIZE):
+            batch = unique_texts[start:start + TRANSLATION_BATCH_SIZE]
+            for text, translated in zip(batch, translate_batch(batch, source_lang, target_lang)):
+                result[text][target_lang] = translated
+
+    for text in texts:
+        if not text or not text.strip():
+            result[text] = {'en': '', 'es': '', 'zh': ''}
+    return result
+
+
 def translate_all_text_fields(data: dict, source_lang: str) -> dict:
     """
     Translates all text fields in a DMT record payload to all 3 languages.
@@ -190,6 +315,8 @@ def check_translation_service() -> bool:
     Returns:
         True if service is available, False otherwise
     """
+    import requests
+
     try:
         response = requests.get(LIBRETRANSLATE_URL.replace('/translate', '/languages'), timeout=5)
         response.raise_for_status()
@@ -201,6 +328,8 @@ def check_translation_service() -> bool:
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
     # Test the translation service
     print("Testing LibreTranslate service...")
     print(f"Service available: {check_translation_service()}")
@@ -0,0 +1,197 @@
+"""
+Bulk user provisioning (onboarding a whole shift at once)
+
+Used by POST /users/bulk, by the command below and by
+seed_database.create_users. For each batch:
+
+- username / email conflicts, against the database and within the batch,
+  are found with one set-based query
+- passwords are hashed (pbkdf2, CPU-bound) across a process pool so every
+  core is used; the pool is created on first use and shut down with the app.
+  Workers are spawned (they re-import the entry script, which therefore
+  needs an `if __name__ == "__main__":` guard)
+- the new users are inserted with one executemany INSERT in one transaction
+
+Accepted file formats (command line):
+    CSV         header with username, email, full_name, role, password
+    JSON lines  one UserCreate object per line
+
+Configuration (environment variables):
+    PASSWORD_HASH_WORKERS   Hashing processes, 1 = hash in-process (default: CPU count)
+    USER_BULK_MAX_ITEMS     Users per request / transaction (default: 500)
+
+Usage:
+    python user_import.py users.csv
+    python user_import.py users.jsonl
+"""
+
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence
+from pydantic import ValidationError
+from sqlalchemy import or_
+from sqlmodel import select
+from auth import get_password_hash
+from models import User
+from schemas import UserCreate
+
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+USER_BULK_MAX_ITEMS = int(os.getenv("USER_BULK_MAX_ITEMS", "500"))
+
+# Por debajo de este número de passwords no vale la pena usar el pool
+MIN_PARALLEL_HASHES = 2
+
+_hash_pool: Optional[ProcessPoolExecutor] = None
+_hash_pool_lock = threading.Lock()
+
+
+def _get_hash_pool() -> ProcessPoolExecutor:
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is None:
+            # spawn: el proceso del servidor tiene hilos (threadpool, monitores), fork no es seguro
+            _hash_pool = ProcessPoolExecutor(
+                max_workers=PASSWORD_HASH_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _hash_pool
+
+
+def shutdown_hash_pool():
+    """
+    Terminar los procesos de hashing (lifespan / fin del comando)
+    """
+    global _hash_pool
+    with _hash_pool_lock:
+        pool, _hash_pool = _hash_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def hash_passwords(passwords: Sequence[str]) -> List[str]:
+    """
+    Hash de cada password, repartido entre los procesos del pool
+    Bloqueante: desde el event loop llamarla con run_in_threadpool
+    """
+    if PASSWORD_HASH_WORKERS <= 1 or len(passwords) < MIN_PARALLEL_HASHES:
+        return [get_password_hash(password) for password in passwords]
+    chunksize = max(1, len(passwords) // (PASSWORD_HASH_WORKERS * 4))
+    return list(_get_hash_pool().map(get_password_hash, passwords, chunksize=chunksize))
+
+
+def conflicts_statement(users: Sequence[UserCreate]):
+    """
+    Una sola consulta: usuarios existentes con alguno de los usernames o emails
+    """
+    return select(User.username, User.email).where(or_(
+        User.username.in_({user.username for user in users}),
+        User.email.in_({user.email for user in users}),
+    ))
+
+
+def find_conflicts(users: Sequence[UserCreate], existing_rows) -> Dict[int, List[str]]:
+    """
+    Errores por posición: username/email ya registrados o repetidos en el lote
+    (la primera aparición dentro del lote gana)
+    """
+    taken_usernames = {row[0] for row in existing_rows}
+    taken_emails = {row[1] for row in existing_rows}
+    seen_usernames, seen_emails = set(), set()
+    conflicts: Dict[int, List[str]] = {}
+    for position, user in enumerate(users):
+        errors = []
+        if user.username in taken_usernames:
+            errors.append("Username already registered")
+        elif user.username in seen_usernames:
+            errors.append("Username repeated in this batch")
+        if user.email in taken_emails:
+            errors.append("Email already registered")
+        elif user.email in seen_emails:
+            errors.append("Email repeated in this batch")
+        seen_usernames.add(user.username)
+        seen_emails.add(user.email)
+        if errors:
+            conflicts[position] = errors
+    return conflicts
+
+
+def user_rows(users: Sequence[UserCreate], hashed_passwords: Sequence[str]) -> List[dict]:
+    """
+    Filas para el INSERT executemany
+    """
+    return [
+        {
+            "username": user.username,
+            "email": user.email,
+            "full_name": user.full_name,
+            "role": user.role,
+            "hashed_password": hashed_password,
+        }
+        for user, hashed_password in zip(users, hashed_passwords)
+    ]
+
+
+def validation_errors(error: ValidationError) -> List[str]:
+    return [f"{'.'.join(str(loc) for loc in item['loc'])}: {item['msg']}" for item in error.errors()]
+
+
+def read_users_file(path: str) -> List[dict]:
+    """
+    Filas del archivo (CSV o JSON lines según la extensión), sin validar
+    """
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if path.lower().endswith((".jsonl", ".ndjson")):
+            return [json.loads(line) for line in f if line.strip()]
+        return [
+            # Las celdas vacías se omiten para que la validación las reporte como faltantes
+            {key.strip().lower(): value.strip() for key, value in row.items() if key and value and value.strip()}
+            for row in csv.DictReader(f)
+        ]
+
+
+def main(argv: List[str]) -> int:
+    """
+    Importar usuarios desde un archivo, en lotes de USER_BULK_MAX_ITEMS
+    """
+    if len(argv) != 1:
+        print("Usage: python user_import.py <users.csv | users.jsonl>")
+        return 2
+
+    from sqlmodel import Session
+    from database import engine
+    from crud.crud_user import create_users_bulk
+
+    raw_rows = read_users_file(argv[0])
+    users: List[UserCreate] = []
+    failed = 0
+    for line_number, raw in enumerate(raw_rows, start=1):
+        try:
+            users.append(UserCreate.model_validate(raw))
+        except ValidationError as e:
+            failed += 1
+            print(f"  ✗ Row {line_number}: {'; '.join(validation_errors(e))}")
+
+    created = 0
+    try:
+        with Session(engine) as session:
+            for start in range(0, len(users), USER_BULK_MAX_ITEMS):
+                batch = users[start:start + USER_BULK_MAX_ITEMS]
+                new_users, conflicts = create_users_bulk(session, batch)
+                created += len(new_users)
+                failed += len(conflicts)
+                for position, errors in conflicts.items():
+                    print(f"  ⚠ {batch[position].username}: {'; '.join(errors)}")
+    finally:
+        shutdown_hash_pool()
+
+    print(f"✓ Created {created} users, {failed} skipped")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
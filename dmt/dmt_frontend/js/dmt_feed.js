@@ -9,6 +9,14 @@ let partNumbers = [];
 let workCenters = [];
 let customers = [];
 
+// Live feed (GET /dmt/events): the table is patched with each change
+// instead of re-downloading the list
+const RECORDS_PAGE_LIMIT = 100;  // default limit of GET /dmt/
+let currentFilters = {};
+let liveFeed = null;
+let lastEventId = null;
+let queuedFeedEvents = null;  // events received while the list is loading
+
 /**
  * Show loading spinner
  */
@@ -149,22 +157,13 @@ async function loadRecords(filters = {}) {
     try {
         showLoading();
 
-        // Build query string from filters
-        const params = new URLSearchParams();
-        if (filters.is_closed !== undefined && filters.is_closed !== '') {
-            params.append('is_closed', filters.is_closed);
-        }
-        if (filters.part_number_id) {
-            params.append('part_number_id', filters.part_number_id);
-        }
-        if (filters.created_after) {
-            params.append('created_after', filters.created_after);
-        }
-        if (filters.created_before) {
-            params.append('created_before', filters.created_before);
-        }
+        // Subscribe before loading: changes made while the list downloads are
+        // queued and applied on top of it
+        currentFilters = filters;
+        queuedFeedEvents = [];
+        startLiveFeed(filters);
 
-        const queryString = params.toString();
+        const queryString = buildRecordsQuery(filters).toString();
         const url = `${API_BASE_URL}/dmt/${queryString ? '?' + queryString : ''}`;
         console.log("Fetching:", url);
 
@@ -174,10 +173,15 @@ async function loadRecords(filters = {}) {
             allRecords = [];
         }
 
+        const queued = queuedFeedEvents || [];
+        queuedFeedEvents = null;
+        queued.forEach(({ type, record }) => patchRecords(type, record));
+
         renderRecordsTable(allRecords);
         updateRecordsCount(allRecords.length);
 
     } catch (error) {
+        queuedFeedEvents = null;
         console.error('Error loading records:', error);
         showToast('Error loading records: ' + error.message, 'error');
         renderEmptyState('Error loading records');
@@ -186,6 +190,188 @@ async function loadRecords(filters = {}) {
     }
 }
 
+/**
+ * Query parameters of GET /dmt/ (and of the live feed) for the filters
+ */
+function buildRecordsQuery(filters = {}) {
+    const params = new URLSearchParams();
+    if (filters.is_closed !== undefined && filters.is_closed !== '') {
+        params.append('is_closed', filters.is_closed);
+    }
+    if (filters.part_number_id) {
+        params.append('part_number_id', filters.part_number_id);
+    }
+    if (filters.created_after) {
+        params.append('created_after', filters.created_after);
+    }
+    if (filters.created_before) {
+        params.append('created_before', filters.created_before);
+    }
+    return params;
+}
+
+/**
+ * Open the live feed for the filters (closes the previous stream)
+ *
+ * fetch() instead of EventSource: EventSource cannot send the
+ * Authorization header. Reconnects with Last-Event-ID after errors or when
+ * the server ends the stream; a `reset` event (missed events no longer
+ * buffered) reloads the list once.
+ */
+function startLiveFeed(filters = {}) {
+    stopLiveFeed();
+    lastEventId = null;
+
+    const feed = { controller: new AbortController(), retryMs: 3000, timer: null };
+    liveFeed = feed;
+
+    const connect = async () => {
+        const token = localStorage.getItem('access_token');
+        const headers = { 'Authorization': `Bearer ${token}`, 'Accept': 'text/event-stream' };
+        if (lastEventId !== null) {
+            headers['Last-Event-ID'] = String(lastEventId);
+        }
+
+        try {
+            const queryString = buildRecordsQuery(filters).toString();
+            const response = await fetch(`${API_BASE_URL}/dmt/events${queryString ? '?' + queryString : ''}`, {
+                headers: headers,
+                signal: feed.controller.signal
+            });
+            if (response.status === 401 || response.status === 404) {
+                // Token expired (the next page load logs in again) or feed disabled
+                console.warn('Live feed unavailable:', response.status);
+                return;
+            }
+            if (!response.ok) {
+                throw new Error(`Live feed failed: ${response.status}`);
+            }
+            await readEventStream(response, feed);
+        } catch (error) {
+            if (feed.controller.signal.aborted) return;
+            console.warn('Live feed disconnected:', error.message);
+        }
+
+        if (liveFeed === feed && !feed.controller.signal.aborted) {
+            feed.timer = setTimeout(connect, feed.retryMs);
+        }
+    };
+
+    connect();
+}
+
+/**
+ * Close the live feed stream
+ */
+function stopLiveFeed() {
+    if (liveFeed) {
+        clearTimeout(liveFeed.timer);
+        liveFeed.controller.abort();
+        liveFeed = null;
+    }
+}
+
+/**
+ * Parse a text/event-stream body and handle each event
+ */
+async function readEventStream(response, feed) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) return;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const block = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let id = null;
+            let type = 'message';
+            const data = [];
+            block.split('\n').forEach(line => {
+                if (line.startsWith(':')) return;  // keep-alive
+                const colon = line.indexOf(':');
+                const field = colon === -1 ? line : line.slice(0, colon);
+                const fieldValue = colon === -1 ? '' : line.slice(colon + 1).replace(/^ /, '');
+                if (field === 'id') id = fieldValue;
+                else if (field === 'event') type = fieldValue;
+                else if (field === 'data') data.push(fieldValue);
+                else if (field === 'retry' && /^\d+$/.test(fieldValue)) feed.retryMs = Number(fieldValue);
+            });
+
+            if (id !== null) lastEventId = id;
+            if (data.length) handleFeedEvent(type, JSON.parse(data.join('\n')));
+            if (liveFeed !== feed) return;  // reset: the list reload opened a new stream
+        }
+    }
+}
+
+/**
+ * Apply one live feed event to the table
+ */
+function handleFeedEvent(type, record) {
+    if (type === 'reset') {
+        loadRecords(currentFilters);
+        return;
+    }
+    if (!['created', 'updated', 'closed', 'deleted'].includes(type)) return;
+
+    if (queuedFeedEvents) {
+        queuedFeedEvents.push({ type, record });
+        return;
+    }
+    patchRecords(type, record);
+    renderRecordsTable(allRecords);
+    updateRecordsCount(allRecords.length);
+}
+
+/**
+ * Insert, update or remove the record in allRecords (same order and page
+ * size as GET /dmt/)
+ */
+function patchRecords(type, record) {
+    const index = allRecords.findIndex(r => r.id === record.id);
+
+    if (type === 'deleted' || !matchesCurrentFilters(record)) {
+        if (index !== -1) allRecords.splice(index, 1);
+        return;
+    }
+    if (index !== -1) {
+        allRecords[index] = { ...allRecords[index], ...record };
+        return;
+    }
+    allRecords.push(record);
+    allRecords.sort((a, b) => a.id - b.id);
+    if (allRecords.length > RECORDS_PAGE_LIMIT) {
+        allRecords.length = RECORDS_PAGE_LIMIT;
+    }
+}
+
+/**
+ * Same filters the API applies to GET /dmt/
+ */
+function matchesCurrentFilters(record) {
+    const filters = currentFilters;
+    if (filters.is_closed !== undefined && filters.is_closed !== '' &&
+        record.is_closed !== (String(filters.is_closed) === 'true')) {
+        return false;
+    }
+    if (filters.part_number_id && record.part_number_id !== Number(filters.part_number_id)) {
+        return false;
+    }
+    if (filters.created_after && record.created_at < filters.created_after) {
+        return false;
+    }
+    if (filters.created_before && record.created_at > filters.created_before) {
+        return false;
+    }
+    return true;
+}
+
 /**
  * Render records table
  */
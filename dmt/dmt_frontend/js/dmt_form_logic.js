@@ -71,44 +71,22 @@ document.addEventListener("DOMContentLoaded", async () => {
 
 async function loadAllCatalogs() {
     try {
-        const [
-            partNumbers,
-            workCenters,
-            customers,
-            levels,
-            areas,
-            preparedBy,
-            inspectionItems,
-            processCodes,
-            dispositions,
-            failureCodes,
-            users
-        ] = await Promise.all([
-            apiGet(`${API_BASE_URL}/entities/partnumber`),
-            apiGet(`${API_BASE_URL}/entities/workcenter`),
-            apiGet(`${API_BASE_URL}/entities/customer`),
-            apiGet(`${API_BASE_URL}/entities/level`),
-            apiGet(`${API_BASE_URL}/entities/area`),
-            apiGet(`${API_BASE_URL}/entities/preparedby`),
-            apiGet(`${API_BASE_URL}/entities/inspectionitem`),
-            apiGet(`${API_BASE_URL}/entities/processcode`),
-            apiGet(`${API_BASE_URL}/entities/disposition`),
-            apiGet(`${API_BASE_URL}/entities/failurecode`),
-            apiGet(`${API_BASE_URL}/users/`)
-        ]);
+        // Single request: every catalog + slim user list (cached server-side)
+        const bundle = await apiGet(`${API_BASE_URL}/entities/_bundle`);
+        const data = (bundle && bundle.catalogs) || {};
 
         catalogs = {
-            partNumbers: partNumbers || [],
-            workCenters: workCenters || [],
-            customers: customers || [],
-            levels: levels || [],
-            areas: areas || [],
-            preparedBy: preparedBy || [],
-            inspectionItems: inspectionItems || [],
-            processCodes: processCodes || [],
-            dispositions: dispositions || [],
-            failureCodes: failureCodes || [],
-            users: users || []
+            partNumbers: data.partnumber || [],
+            workCenters: data.workcenter || [],
+            customers: data.customer || [],
+            levels: data.level || [],
+            areas: data.area || [],
+            preparedBy: data.preparedby || [],
+            inspectionItems: data.inspectionitem || [],
+            processCodes: data.processcode || [],
+            dispositions: data.disposition || [],
+            failureCodes: data.failurecode || [],
+            users: (bundle && bundle.users) || []
         };
 
         populateSelects();